@@ -0,0 +1,136 @@
+import datetime
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Count, F, FloatField, Sum
+from django.db.models.functions import Coalesce, TruncDay, TruncMonth, TruncWeek
+
+from .caching import MISSING, get_cache, progress_version
+from .models import ExerciseProgress
+
+PERIODS = {
+    'day': TruncDay,
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+
+# Series the downsampling can follow; the points it keeps are kept in every column
+METRICS = ('count', 'sets', 'reps', 'volume')
+MIN_POINTS = 3
+MAX_POINTS = 5000
+
+
+def progress_queryset(profile, start=None, end=None, exercise_id=None):
+    queryset = ExerciseProgress.objects.filter(profile=profile)
+    if start:
+        queryset = queryset.filter(date__gte=start)
+    if end:
+        queryset = queryset.filter(date__lte=end)
+    if exercise_id:
+        queryset = queryset.filter(exercise_id=exercise_id)
+    return queryset
+
+
+def aggregate_progress(profile, period='day', start=None, end=None, exercise_id=None):
+    # One GROUP BY query per call: the database does the bucketing, Python only sees one row per bucket
+    if period not in PERIODS:
+        raise ValueError('Unknown period: %s' % period)
+
+    volume = F('sets') * F('repetitions') * Coalesce(F('weight'), 0, output_field=FloatField())
+    return (
+        progress_queryset(profile, start, end, exercise_id)
+        .annotate(bucket=PERIODS[period]('date'))
+        .values('bucket')
+        .annotate(
+            count=Count('id'),
+            total_sets=Coalesce(Sum('sets'), 0),
+            total_reps=Coalesce(Sum('repetitions'), 0),
+            volume=Coalesce(Sum(volume, output_field=FloatField()), 0.0),
+        )
+        .order_by('bucket')
+    )
+
+
+def empty_series(period):
+    # Column-oriented payload so the chart can hand each list straight to a dataset
+    return {'period': period, 'labels': [], 'count': [], 'sets': [], 'reps': [], 'volume': []}
+
+
+def add_bucket(series, row):
+    series['labels'].append(row['bucket'].isoformat())
+    series['count'].append(row['count'])
+    series['sets'].append(row['total_sets'])
+    series['reps'].append(row['total_reps'])
+    series['volume'].append(round(row['volume'], 2))
+
+
+def lttb(xs, ys, threshold):
+    # Largest-triangle-three-buckets: keeps the first and last points and, from each bucket in between,
+    # the point forming the largest triangle with the previous pick and the next bucket's average
+    count = len(xs)
+    if threshold >= count or threshold < MIN_POINTS:
+        return list(range(count))
+    every = (count - 2) / (threshold - 2)
+    keep = [0]
+    previous = 0
+    for bucket in range(threshold - 2):
+        start = int(bucket * every) + 1
+        end = int((bucket + 1) * every) + 1
+        next_end = min(int((bucket + 2) * every) + 1, count)
+        if end >= next_end:
+            average_x, average_y = xs[-1], ys[-1]
+        else:
+            average_x = sum(xs[end:next_end]) / (next_end - end)
+            average_y = sum(ys[end:next_end]) / (next_end - end)
+        x, y = xs[previous], ys[previous]
+        previous = max(range(start, end), key=lambda index: abs((x - average_x) * (ys[index] - y) - (x - xs[index]) * (average_y - y)))
+        keep.append(previous)
+    keep.append(count - 1)
+    return keep
+
+
+def downsample(series, points, metric='volume'):
+    xs = [datetime.date.fromisoformat(label).toordinal() for label in series['labels']]
+    keep = lttb(xs, series[metric], points)
+    downsampled = {name: [values[index] for index in keep] if isinstance(values, list) else values for name, values in series.items()}
+    downsampled['total'] = len(xs)
+    return downsampled
+
+
+def series_key(profile_id, version, period, start, end, exercise_id, points, metric):
+    return 'progress_series:%s:%s:%s:%s:%s:%s:%s:%s' % (profile_id, version, period, start, end, exercise_id, points, metric)
+
+
+def progress_series(profile, period='day', start=None, end=None, exercise_id=None, points=None, metric='volume'):
+    # With `points`, the series is cut to at most that many points and cached until the profile's progress changes
+    if points is not None:
+        profile_id = getattr(profile, 'pk', profile)
+        cache = get_cache()
+        key = series_key(profile_id, progress_version(profile_id), period, start, end, exercise_id, points, metric)
+        series = cache.get(key, MISSING)
+        if series is MISSING:
+            series = downsample(progress_series(profile, period, start, end, exercise_id), points, metric)
+            cache.set(key, series, getattr(settings, 'WORKOUT_CACHE_TIMEOUT', 600))
+        return series
+
+    series = empty_series(period)
+    for row in aggregate_progress(profile, period, start, end, exercise_id):
+        add_bucket(series, row)
+    return series
+
+
+async def aprogress_series(profile, period='day', start=None, end=None, exercise_id=None, points=None, metric='volume'):
+    if points is not None:
+        profile_id = getattr(profile, 'pk', profile)
+        cache = get_cache()
+        key = series_key(profile_id, await sync_to_async(progress_version)(profile_id), period, start, end, exercise_id, points, metric)
+        series = await cache.aget(key, MISSING)
+        if series is MISSING:
+            series = downsample(await aprogress_series(profile, period, start, end, exercise_id), points, metric)
+            await cache.aset(key, series, getattr(settings, 'WORKOUT_CACHE_TIMEOUT', 600))
+        return series
+
+    series = empty_series(period)
+    async for row in aggregate_progress(profile, period, start, end, exercise_id):
+        add_bucket(series, row)
+    return series
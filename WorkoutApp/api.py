@@ -0,0 +1,281 @@
+import json
+from decimal import Decimal
+
+from django.core.exceptions import BadRequest
+from django.db import transaction
+from django.forms import model_to_dict, modelform_factory
+from django.http import Http404, HttpResponse, JsonResponse
+from django.urls import path
+from django.views.decorators.gzip import gzip_page
+
+from workout_app.sqlite_backend.retry import retry_on_locked
+
+from .models import DailyTracking, Exercise, ExerciseProgress, ExerciseType, NutritionTracking, Workout
+from .pagination import keyset_paginate
+from .records import record_personal_bests
+
+# Version prefix for every route below; bump it alongside a new urlpatterns list when the payloads change
+API_VERSION = 'v1'
+
+
+class Resource:
+    model = None
+    fields = ()
+    writable = ()
+    embeds = {}
+    ordering = ('-id',)
+    owned = True
+
+    def get_queryset(self, request):
+        queryset = self.model.objects.all()
+        if self.owned:
+            queryset = queryset.filter(profile=request.user.profile)
+        return queryset
+
+    def limit_choices(self, form, request):
+        pass
+
+    def get_form(self, request, data, instance=None):
+        form = modelform_factory(self.model, fields=self.writable)(data, instance=instance)
+        self.limit_choices(form, request)
+        return form
+
+    def after_create(self, request, obj):
+        pass
+
+    def serialize(self, obj, fields, embeds=()):
+        opts = self.model._meta
+        data = {}
+        for name in fields:
+            field = opts.get_field(name)
+            if name in embeds:
+                embedded = self.embeds[name]
+                if field.many_to_many:
+                    data[name] = [embedded.serialize(item, embedded.fields) for item in getattr(obj, name).all()]
+                else:
+                    related = getattr(obj, name)
+                    data[name] = embedded.serialize(related, embedded.fields) if related else None
+            elif field.many_to_many:
+                data[name] = [item.pk for item in getattr(obj, name).all()]
+            elif field.is_relation:
+                data[name] = getattr(obj, field.attname)
+            else:
+                data[name] = json_value(getattr(obj, name))
+        return data
+
+
+def json_value(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+class ExerciseTypeResource(Resource):
+    model = ExerciseType
+    fields = ('id', 'name')
+    owned = False
+
+
+class ExerciseResource(Resource):
+    model = Exercise
+    fields = ('id', 'name', 'type', 'description')
+    writable = ('name', 'type', 'description')
+    embeds = {'type': ExerciseTypeResource()}
+    ordering = ('id',)
+    owned = False
+
+
+class WorkoutResource(Resource):
+    model = Workout
+    fields = ('id', 'name', 'date', 'duration', 'description', 'completed', 'exercises')
+    writable = ('name', 'duration', 'description', 'completed', 'exercises')
+    embeds = {'exercises': ExerciseResource()}
+    ordering = ('-date', '-id')
+
+    def limit_choices(self, form, request):
+        # Exercises can be attached later, as the HTML flow does
+        form.fields['exercises'].required = False
+
+
+class ExerciseProgressResource(Resource):
+    model = ExerciseProgress
+    fields = ('id', 'workout', 'exercise', 'date', 'repetitions', 'sets', 'weight')
+    writable = ('workout', 'exercise', 'repetitions', 'sets', 'weight')
+    embeds = {'exercise': ExerciseResource(), 'workout': WorkoutResource()}
+    ordering = ('-date', '-id')
+
+    def limit_choices(self, form, request):
+        form.fields['workout'].queryset = Workout.objects.filter(profile=request.user.profile)
+
+    def after_create(self, request, obj):
+        record_personal_bests(obj)
+
+
+class DailyTrackingResource(Resource):
+    model = DailyTracking
+    fields = ('id', 'date', 'activity', 'duration', 'notes')
+    writable = ('activity', 'duration', 'notes')
+    ordering = ('-date', '-id')
+
+
+class NutritionTrackingResource(Resource):
+    model = NutritionTracking
+    fields = ('id', 'date', 'food_item', 'quantity', 'calories', 'notes')
+    writable = ('food_item', 'quantity', 'calories', 'notes')
+    ordering = ('-date', '-id')
+
+
+RESOURCES = {
+    'workouts': WorkoutResource(),
+    'exercises': ExerciseResource(),
+    'progress': ExerciseProgressResource(),
+    'daily': DailyTrackingResource(),
+    'nutrition': NutritionTrackingResource(),
+}
+
+
+def error(message, status=400, **extra):
+    return JsonResponse({'error': message, **extra}, status=status)
+
+
+def parse_list(request, name, allowed):
+    value = request.GET.get(name)
+    if not value:
+        return None
+    items = [item.strip() for item in value.split(',') if item.strip()]
+    unknown = [item for item in items if item not in allowed]
+    if unknown:
+        raise BadRequest('Unknown %s: %s' % (name, ', '.join(unknown)))
+    return items
+
+
+def selected_fields(request, resource):
+    fields = parse_list(request, 'fields', resource.fields) or list(resource.fields)
+    if 'id' not in fields:
+        fields.insert(0, 'id')
+    embeds = parse_list(request, 'embed', resource.embeds) or []
+    # Embedding a relation implies returning it
+    fields.extend(name for name in embeds if name not in fields)
+    return fields, embeds
+
+
+def with_relations(queryset, resource, fields, embeds):
+    # One JOIN per embedded foreign key and one extra query per many-to-many, never one per row
+    opts = resource.model._meta
+    for name in fields:
+        field = opts.get_field(name)
+        if field.many_to_many:
+            queryset = queryset.prefetch_related(name)
+        elif name in embeds:
+            queryset = queryset.select_related(name)
+        if name in embeds:
+            nested = resource.embeds[name]
+            queryset = queryset.prefetch_related(*[
+                '%s__%s' % (name, nested_name) for nested_name in nested.fields
+                if nested.model._meta.get_field(nested_name).many_to_many
+            ])
+    return queryset
+
+
+def parse_body(request):
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        raise BadRequest('Request body must be JSON.')
+    if not isinstance(data, dict):
+        raise BadRequest('Request body must be a JSON object.')
+    return data
+
+
+def list_view(request, resource):
+    if request.method == 'GET':
+        fields, embeds = selected_fields(request, resource)
+        queryset = with_relations(resource.get_queryset(request), resource, fields, embeds)
+        page = keyset_paginate(request, queryset, resource.ordering)
+        return JsonResponse({
+            'data': [resource.serialize(obj, fields, embeds) for obj in page.object_list],
+            'next': page.next_cursor,
+        })
+
+    if request.method == 'POST':
+        form = resource.get_form(request, parse_body(request))
+        if not form.is_valid():
+            return error('Invalid data.', errors=form.errors.get_json_data())
+        obj = form.save(commit=False)
+        if resource.owned:
+            obj.profile = request.user.profile
+        obj.save()
+        form.save_m2m()
+        resource.after_create(request, obj)
+        return JsonResponse(resource.serialize(obj, resource.fields), status=201)
+
+    return error('Method not allowed.', status=405)
+
+
+def detail_view(request, resource, pk):
+    queryset = resource.get_queryset(request)
+
+    if request.method == 'GET':
+        fields, embeds = selected_fields(request, resource)
+        obj = with_relations(queryset, resource, fields, embeds).filter(pk=pk).first()
+        if obj is None:
+            raise Http404
+        return JsonResponse(resource.serialize(obj, fields, embeds))
+
+    if not resource.owned:
+        # Shared catalog rows belong to nobody: deleting one would cascade into every user's history
+        return error('Method not allowed.', status=405)
+
+    # Prefetched, so the form's initial data and the response share one read of the many-to-many rows
+    obj = with_relations(queryset, resource, resource.fields, ()).filter(pk=pk).first()
+    if obj is None:
+        raise Http404
+
+    if request.method == 'PATCH':
+        data = model_to_dict(obj, fields=resource.writable)
+        data.update(parse_body(request))
+        form = resource.get_form(request, data, instance=obj)
+        if not form.is_valid():
+            return error('Invalid data.', errors=form.errors.get_json_data())
+        obj = form.save()
+        return JsonResponse(resource.serialize(obj, resource.fields))
+
+    if request.method == 'DELETE':
+        obj.delete()
+        return HttpResponse(status=204)
+
+    return error('Method not allowed.', status=405)
+
+
+@retry_on_locked
+def write(handler, *args):
+    # Writes run in one transaction, retried from the top (re-reading the body and the row) when the
+    # database is locked, so a retry never starts from an instance a rolled-back attempt had changed
+    with transaction.atomic():
+        return handler(*args)
+
+
+@gzip_page
+def api_view(request, resource_name, pk=None):
+    if not request.user.is_authenticated:
+        return error('Authentication required.', status=401)
+    resource = RESOURCES[resource_name]
+    handler, args = (list_view, (request, resource)) if pk is None else (detail_view, (request, resource, pk))
+    try:
+        if request.method in ('GET', 'HEAD'):
+            return handler(*args)
+        return write(handler, *args)
+    except BadRequest as exc:
+        return error(str(exc))
+    except Http404:
+        return error('Not found.', status=404)
+
+
+urlpatterns = []
+for name in RESOURCES:
+    urlpatterns += [
+        path('%s/' % name, api_view, {'resource_name': name}, name='api_%s_%s_list' % (API_VERSION, name)),
+        path('%s/<int:pk>/' % name, api_view, {'resource_name': name}, name='api_%s_%s_detail' % (API_VERSION, name)),
+    ]
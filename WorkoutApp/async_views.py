@@ -0,0 +1,127 @@
+import asyncio
+import functools
+
+from asgiref.sync import sync_to_async
+from django.contrib import messages
+from django.contrib.auth.models import User
+from django.contrib.auth.views import redirect_to_login
+from django.http import Http404, JsonResponse
+from django.shortcuts import redirect, render
+from django.template.loader import render_to_string
+from django.views import View
+
+from .analytics import aprogress_series
+from .caching import acached_for_user
+from .models import ExerciseProgress, Profile, Workout, WorkoutExercise
+from .pagination import akeyset_paginate
+from .views import parse_progress_filters
+from workout_app.routers import analytics_view
+
+# Async twins of the hot read views in views.py, served instead of them when settings.ASYNC_READ_VIEWS
+# is on (under ASGI). Queries go through the async ORM and independent ones are gathered; rendering
+# stays in a worker thread because templates may still touch lazy attributes.
+
+
+async def resolve_user(request):
+    # Django 4.2 has no request.auser(), so the lazy user (session and user lookups) is resolved in the sync thread
+    await sync_to_async(lambda: request.user.is_authenticated)()
+    return request.user
+
+
+def async_login_required(view):
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        user = await resolve_user(request)
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+async def alist(queryset):
+    return [obj async for obj in queryset]
+
+
+async def profile_id_for(user):
+    # Users loaded by the auth backend arrive with their profile attached
+    if User.profile.is_cached(user):
+        return user.profile.id
+    return await Profile.objects.filter(user_id=user.pk).values_list('id', flat=True).afirst()
+
+
+async def get_workout_or_404(pk):
+    workout = await Workout.objects.filter(pk=pk).afirst()
+    if workout is None:
+        raise Http404('No workout found matching the query')
+    return workout
+
+
+@analytics_view
+@async_login_required
+async def workout_summary(request, pk):
+    workout, profile_id = await asyncio.gather(get_workout_or_404(pk), profile_id_for(request.user))
+
+    if workout.profile_id != profile_id:
+        messages.error(request, "You don't have permission to view this workout.")
+        return redirect('home')
+
+    async def build():
+        exercises_progress = await alist(workout.exerciseprogress_set.select_related('exercise'))
+        return render_to_string('workout_summary_fragment.html', {'workout': workout, 'exercises_progress': exercises_progress})
+
+    context = {
+        'workout': workout,
+        'summary': await acached_for_user('workout_summary', request.user.id, workout.id, build),
+    }
+    return await sync_to_async(render)(request, 'workout_summary.html', context)
+
+
+class WorkoutDetailView(View):
+    template_name = 'workout_detail.html'
+
+    async def get(self, request, pk):
+        user = await resolve_user(request)
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        workout, profile_id = await asyncio.gather(get_workout_or_404(pk), profile_id_for(user))
+
+        async def build():
+            steps, progresses = await asyncio.gather(
+                alist(WorkoutExercise.objects.filter(workout_id=workout.id).select_related('exercise').order_by('position', 'id')),
+                alist(ExerciseProgress.objects.filter(workout_id=workout.id, profile_id=profile_id).order_by('date', 'id')),
+            )
+            # Later rows overwrite earlier ones, leaving each exercise's latest progress
+            return {
+                'steps': steps,
+                'exercises': [step.exercise for step in steps],
+                'exercise_progresses': {progress.exercise_id: progress for progress in progresses},
+            }
+
+        context = {'object': workout, 'workout': workout, 'view': self}
+        context.update(await acached_for_user('workout_detail', user.id, workout.id, build))
+        return await sync_to_async(render)(request, self.template_name, context)
+
+
+class WorkoutListView(View):
+    template_name = 'workout_list.html'
+    keyset_ordering = ('-date', '-id')
+
+    async def get(self, request, profile_id):
+        user = await resolve_user(request)
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        # Like the sync view, this lists the signed-in user's open workouts whatever profile_id says
+        page = await akeyset_paginate(request, Workout.objects.filter(profile__user_id=user.pk, completed=False), self.keyset_ordering)
+        context = {'object_list': page.object_list, 'workout_list': page.object_list, 'page': page, 'view': self}
+        return await sync_to_async(render)(request, self.template_name, context)
+
+
+@async_login_required
+@analytics_view
+async def progress_data(request):
+    try:
+        filters = parse_progress_filters(request)
+    except ValueError as error:
+        return JsonResponse({'error': str(error)}, status=400)
+
+    return JsonResponse(await aprogress_series(await profile_id_for(request.user), **filters))
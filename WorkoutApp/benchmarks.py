@@ -0,0 +1,284 @@
+import asyncio
+import datetime
+import io
+import json
+import math
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection
+from django.db.models import Count, Q
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, reverse
+
+from . import urls
+from .api import RESOURCES
+from .models import Exercise, Profile, Workout, WorkoutTemplate
+
+# URL names that change state on GET, or that would end the benchmark's own session
+SKIP = {
+    'logout': 'ends the session',
+    'complete_workout': 'marks the workout complete on GET',
+}
+
+# Which sample object fills a `pk` argument; anything not listed takes the workout
+PK_SOURCES = {
+    'profile': 'user',
+    'delete-profile': 'user',
+    'profile_update': 'profile',
+    'delete_exercise': 'exercise',
+}
+
+# A view only counts as slower when its p95 moves by more than both of these
+DEFAULT_TOLERANCE = 0.25
+NOISE_FLOOR_MS = 2.0
+
+
+def url_patterns(patterns=None, prefix=''):
+    # Yields (name, pattern) for every named route, descending into include()s such as the API
+    for entry in urls.urlpatterns if patterns is None else patterns:
+        if isinstance(entry, URLResolver):
+            yield from url_patterns(entry.url_patterns, prefix + str(entry.pattern))
+        elif isinstance(entry, URLPattern) and entry.name:
+            yield entry.name, entry.pattern
+
+
+def benchmark_profile(username=None):
+    profiles = Profile.objects.select_related('user')
+    if username:
+        return profiles.filter(user__username=username).first()
+    # The busiest profile makes the most demanding pages
+    return profiles.annotate(workouts=Count('workout')).order_by('-workouts', 'id').first()
+
+
+def sample_objects(profile):
+    workout = (
+        Workout.objects.filter(profile=profile).annotate(exercise_count=Count('exercises'))
+        .filter(exercise_count__gt=0).order_by('-date', '-id').first()
+        or Workout.objects.filter(profile=profile).order_by('-date', '-id').first()
+    )
+    exercise = (workout and workout.exercises.order_by('id').first()) or Exercise.objects.order_by('id').first()
+    template = WorkoutTemplate.objects.filter(Q(public=True) | Q(profile=profile)).order_by('id').first()
+    objects = {'user': profile.user, 'profile': profile, 'workout': workout, 'exercise': exercise, 'template': template}
+    for name, resource in RESOURCES.items():
+        queryset = resource.model.objects.filter(profile=profile) if resource.owned else resource.model.objects.all()
+        objects['api_%s' % name] = queryset.order_by('id').first()
+    return objects
+
+
+def url_kwargs(name, pattern, objects):
+    kwargs = {}
+    for argument in pattern.converters:
+        if argument == 'pk':
+            source = PK_SOURCES.get(name, 'workout')
+            for resource in RESOURCES:
+                if name.endswith('_%s_detail' % resource):
+                    source = 'api_%s' % resource
+        else:
+            source = argument[:-len('_id')]
+        obj = objects.get(source)
+        if obj is None:
+            return None
+        kwargs[argument] = obj.pk
+    return kwargs
+
+
+def percentile(values, fraction):
+    # Nearest-rank percentile; exact for the small sample counts a benchmark run collects
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def measure(client, path, iterations, warmup=1):
+    status = None
+    for _ in range(warmup):
+        client.get(path)
+    timings = []
+    queries = 0
+    for _ in range(iterations):
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            response = client.get(path)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            timings.append((time.perf_counter() - start) * 1000)
+        status = response.status_code
+        queries = max(queries, len(captured))
+    return {
+        'path': path,
+        'status': status,
+        'p50_ms': round(percentile(timings, 0.5), 3),
+        'p95_ms': round(percentile(timings, 0.95), 3),
+        'queries': queries,
+    }
+
+
+def run_benchmark(profile, iterations=20, warmup=1):
+    objects = sample_objects(profile)
+    client = Client(raise_request_exception=False)
+    client.force_login(profile.user)
+
+    results = {'generated': datetime.datetime.now().isoformat(timespec='seconds'), 'iterations': iterations, 'views': {}, 'skipped': {}}
+    # The test client always sends Host: testserver
+    with override_settings(ALLOWED_HOSTS=['testserver']):
+        for name, pattern in url_patterns():
+            if name in SKIP:
+                results['skipped'][name] = SKIP[name]
+                continue
+            kwargs = url_kwargs(name, pattern, objects)
+            if kwargs is None:
+                results['skipped'][name] = 'no sample data for its arguments'
+                continue
+            results['views'][name] = measure(client, reverse(name, kwargs=kwargs), iterations, warmup)
+    return results
+
+
+def summarize(timings, statuses, seconds):
+    return {
+        'requests': len(timings),
+        'errors': sum(1 for status in statuses if status != 200),
+        'requests_per_second': round(len(timings) / seconds, 1) if seconds else 0.0,
+        'p50_ms': round(percentile(timings, 0.5), 3),
+        'p95_ms': round(percentile(timings, 0.95), 3),
+    }
+
+
+def drive_wsgi(application, urls, cookie, concurrency):
+    # A threaded WSGI server in miniature: `concurrency` worker threads, each handling one request at a time
+    def request(url):
+        path, _, query = url.partition('?')
+        environ = {
+            'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query, 'SCRIPT_NAME': '',
+            'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+            'HTTP_HOST': 'localhost', 'HTTP_COOKIE': cookie, 'REMOTE_ADDR': '127.0.0.1',
+            'wsgi.version': (1, 0), 'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True, 'wsgi.multiprocess': False, 'wsgi.run_once': False,
+        }
+        status = []
+        start = time.perf_counter()
+        body = application(environ, lambda value, headers, exc_info=None: status.append(value))
+        try:
+            for chunk in body:
+                pass
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
+        return (time.perf_counter() - start) * 1000, int(status[0].split()[0])
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(request, urls))
+    return summarize([timing for timing, status in results], [status for timing, status in results], time.perf_counter() - start)
+
+
+def drive_asgi(application, urls, cookie, concurrency):
+    # What uvicorn does per worker: one event loop with `concurrency` connections in flight at once
+    async def request(url):
+        path, _, query = url.partition('?')
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+            'path': path, 'raw_path': path.encode(), 'query_string': query.encode(), 'root_path': '',
+            'headers': [(b'host', b'localhost'), (b'cookie', cookie.encode())],
+            'client': ('127.0.0.1', 50000), 'server': ('localhost', 80),
+        }
+        done = asyncio.Event()
+        received = []
+        status = []
+
+        async def receive():
+            if not received:
+                received.append(True)
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            await done.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+            elif not message.get('more_body'):
+                done.set()
+
+        start = time.perf_counter()
+        await application(scope, receive, send)
+        done.set()
+        return (time.perf_counter() - start) * 1000, status[0]
+
+    async def run():
+        queue = asyncio.Queue()
+        for url in urls:
+            queue.put_nowait(url)
+        results = []
+
+        async def connection():
+            while not queue.empty():
+                results.append(await request(queue.get_nowait()))
+
+        await asyncio.gather(*[connection() for _ in range(concurrency)])
+        return results
+
+    start = time.perf_counter()
+    results = asyncio.run(run())
+    return summarize([timing for timing, status in results], [status for timing, status in results], time.perf_counter() - start)
+
+
+def drive_logins(login, probe, logins, concurrency):
+    # `concurrency` threads call login(index) `logins` times while one more thread keeps timing probe(),
+    # a cheap request, to show what a burst of password hashing does to everyone else's latency
+    stop = threading.Event()
+    probe_timings = []
+
+    def probing():
+        while not stop.is_set():
+            start = time.perf_counter()
+            probe()
+            probe_timings.append((time.perf_counter() - start) * 1000)
+
+    def timed_login(index):
+        start = time.perf_counter()
+        ok = login(index)
+        return (time.perf_counter() - start) * 1000, 200 if ok else 401
+
+    prober = threading.Thread(target=probing, daemon=True)
+    prober.start()
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(timed_login, range(logins)))
+        seconds = time.perf_counter() - start
+    finally:
+        stop.set()
+        prober.join()
+    result = summarize([timing for timing, status in results], [status for timing, status in results], seconds)
+    result['probe_p50_ms'] = round(percentile(probe_timings, 0.5), 3) if probe_timings else None
+    result['probe_p95_ms'] = round(percentile(probe_timings, 0.95), 3) if probe_timings else None
+    return result
+
+
+def compare_results(current, baseline, tolerance=DEFAULT_TOLERANCE, noise_floor_ms=NOISE_FLOOR_MS):
+    regressions = []
+    for name, result in sorted(current['views'].items()):
+        before = baseline.get('views', {}).get(name)
+        if before is None:
+            continue
+        if result['status'] != before['status']:
+            regressions.append('%s: status %s -> %s' % (name, before['status'], result['status']))
+        if result['queries'] > before['queries']:
+            regressions.append('%s: %d -> %d queries' % (name, before['queries'], result['queries']))
+        slower = result['p95_ms'] - before['p95_ms']
+        if slower > noise_floor_ms and result['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+            regressions.append('%s: p95 %.1fms -> %.1fms' % (name, before['p95_ms'], result['p95_ms']))
+    return regressions
+
+
+def load_results(path):
+    with open(path) as handle:
+        return json.load(handle)
+
+
+def write_results(results, path):
+    with open(path, 'w') as handle:
+        json.dump(results, handle, indent=2, sort_keys=True)
+        handle.write('\n')
@@ -0,0 +1,159 @@
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .models import Exercise, ExerciseProgress, Workout, WorkoutExercise
+
+CACHE_KINDS = ('workout_detail', 'workout_summary')
+MISSING = object()
+
+
+def get_cache():
+    return caches[getattr(settings, 'WORKOUT_CACHE_ALIAS', 'default')]
+
+
+def version_key(workout_id):
+    return 'workout:%s:version' % workout_id
+
+
+def progress_version_key(profile_id):
+    return 'progress:%s:version' % profile_id
+
+
+def current_version(key):
+    # Versions are random tokens rather than counters, so an evicted version can never
+    # come back as a value that old entries were stored under
+    cache = get_cache()
+    version = cache.get(key)
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def workout_version(workout_id):
+    return current_version(version_key(workout_id))
+
+
+def progress_version(profile_id):
+    # Covers everything cached from a profile's ExerciseProgress rows, such as downsampled chart series
+    return current_version(progress_version_key(profile_id))
+
+
+def bump_versions(keys):
+    if keys:
+        get_cache().set_many({key: uuid.uuid4().hex for key in keys}, None)
+
+
+def bump_workouts(workout_ids):
+    bump_versions({version_key(workout_id) for workout_id in workout_ids if workout_id is not None})
+
+
+def invalidate_workouts(workout_ids):
+    # Wait for the commit so a concurrent reader cannot re-cache the old rows under the new version
+    workout_ids = list(workout_ids)
+    transaction.on_commit(lambda: bump_workouts(workout_ids))
+
+
+def invalidate_progress(profile_ids):
+    keys = {progress_version_key(profile_id) for profile_id in profile_ids if profile_id is not None}
+    transaction.on_commit(lambda: bump_versions(keys))
+
+
+def count(kind, outcome):
+    cache = get_cache()
+    key = 'workout_cache:%s:%s' % (kind, outcome)
+    if not cache.add(key, 1, None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, None)
+
+
+def cached_for_user(kind, user_id, workout_id, build):
+    cache = get_cache()
+    key = '%s:%s:%s:%s' % (kind, user_id, workout_id, workout_version(workout_id))
+    value = cache.get(key, MISSING)
+    if value is not MISSING:
+        count(kind, 'hits')
+        return value
+    count(kind, 'misses')
+    value = build()
+    cache.set(key, value, getattr(settings, 'WORKOUT_CACHE_TIMEOUT', 600))
+    return value
+
+
+async def acached_for_user(kind, user_id, workout_id, build):
+    # Same entries as cached_for_user; ``build`` is a coroutine function, so a miss stays on the async ORM
+    cache = get_cache()
+    key = '%s:%s:%s:%s' % (kind, user_id, workout_id, await sync_to_async(workout_version)(workout_id))
+    value = await cache.aget(key, MISSING)
+    if value is not MISSING:
+        await sync_to_async(count)(kind, 'hits')
+        return value
+    await sync_to_async(count)(kind, 'misses')
+    value = await build()
+    await cache.aset(key, value, getattr(settings, 'WORKOUT_CACHE_TIMEOUT', 600))
+    return value
+
+
+def cache_stats():
+    cache = get_cache()
+    keys = ['workout_cache:%s:%s' % (kind, outcome) for kind in CACHE_KINDS for outcome in ('hits', 'misses')]
+    values = cache.get_many(keys)
+    stats = {}
+    for kind in CACHE_KINDS:
+        hits = values.get('workout_cache:%s:hits' % kind, 0)
+        misses = values.get('workout_cache:%s:misses' % kind, 0)
+        stats[kind] = {'hits': hits, 'misses': misses, 'hit_ratio': hits / (hits + misses) if hits + misses else 0.0}
+    return stats
+
+
+def reset_cache_stats():
+    get_cache().delete_many(['workout_cache:%s:%s' % (kind, outcome) for kind in CACHE_KINDS for outcome in ('hits', 'misses')])
+
+
+@receiver(post_save, sender=Workout)
+@receiver(post_delete, sender=Workout)
+def invalidate_workout(sender, instance, **kwargs):
+    invalidate_workouts([instance.pk])
+
+
+@receiver(post_save, sender=ExerciseProgress)
+@receiver(post_delete, sender=ExerciseProgress)
+def invalidate_progress_workout(sender, instance, **kwargs):
+    invalidate_workouts([instance.workout_id])
+    invalidate_progress([instance.profile_id])
+
+
+@receiver(post_save, sender=WorkoutExercise)
+@receiver(post_delete, sender=WorkoutExercise)
+def invalidate_plan_workout(sender, instance, **kwargs):
+    # Plan edits save the through rows directly, which sends no m2m_changed
+    invalidate_workouts([instance.workout_id])
+
+
+@receiver(post_save, sender=Exercise)
+@receiver(pre_delete, sender=Exercise)
+def invalidate_exercise_workouts(sender, instance, **kwargs):
+    # pre_delete, because by post_delete the cascade has already removed the M2M rows we need
+    through = Workout.exercises.through
+    invalidate_workouts(through.objects.filter(exercise_id=instance.pk).values_list('workout_id', flat=True))
+
+
+@receiver(m2m_changed, sender=Workout.exercises.through)
+def invalidate_workout_exercises(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        invalidate_workouts([instance.pk])
+    elif action == 'pre_clear':
+        invalidate_exercise_workouts(Exercise, instance)
+    else:
+        invalidate_workouts(pk_set)
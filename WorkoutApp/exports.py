@@ -0,0 +1,124 @@
+import csv
+import datetime
+import json
+import zlib
+from decimal import Decimal
+
+from .models import ExerciseProgress, NutritionTracking, ProfileHistory, WorkoutProgress
+
+CHUNK_SIZE = 2000
+# Bytes buffered before a chunk is handed to the response; keeps the per-yield overhead low
+FLUSH_BYTES = 64 * 1024
+
+# Each dataset is exported straight from values_list(), so rows never become model instances
+DATASETS = {
+    'exercise_progress': {
+        'queryset': lambda profile: ExerciseProgress.objects.filter(profile=profile).order_by('date', 'id'),
+        'columns': (
+            ('id', 'id'), ('date', 'date'), ('workout', 'workout__name'), ('exercise', 'exercise__name'),
+            ('sets', 'sets'), ('repetitions', 'repetitions'), ('weight', 'weight'),
+        ),
+    },
+    'workout_progress': {
+        'queryset': lambda profile: WorkoutProgress.objects.filter(user_id=profile.user_id).order_by('date', 'id'),
+        'columns': (('id', 'id'), ('date', 'date'), ('workout', 'workout__name'), ('completed', 'completed'), ('notes', 'notes')),
+    },
+    'nutrition': {
+        'queryset': lambda profile: NutritionTracking.objects.filter(profile=profile).order_by('date', 'id'),
+        'columns': (
+            ('id', 'id'), ('date', 'date'), ('food_item', 'food_item'), ('quantity', 'quantity'),
+            ('calories', 'calories'), ('notes', 'notes'),
+        ),
+    },
+    'profile_history': {
+        'queryset': lambda profile: ProfileHistory.objects.filter(profile=profile).order_by('date_recorded', 'id'),
+        'columns': (('id', 'id'), ('date', 'date_recorded'), ('height', 'height'), ('weight', 'weight')),
+    },
+}
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def dataset_rows(profile, dataset):
+    spec = DATASETS[dataset]
+    lookups = [lookup for name, lookup in spec['columns']]
+    return spec['queryset'](profile).values_list(*lookups).iterator(chunk_size=CHUNK_SIZE)
+
+
+def json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    raise TypeError('Cannot export %r' % value)
+
+
+class LineBuffer:
+    # File-like sink for csv.writer; the caller drains it after every row
+    def __init__(self):
+        self.parts = []
+
+    def write(self, value):
+        self.parts.append(value)
+
+    def drain(self):
+        value = ''.join(self.parts)
+        self.parts = []
+        return value
+
+
+def csv_lines(profile, datasets):
+    # CSV holds one table, so several datasets are written as consecutive sections, each with its own header
+    buffer = LineBuffer()
+    writer = csv.writer(buffer)
+    for index, dataset in enumerate(datasets):
+        if index:
+            buffer.write('\r\n')
+        writer.writerow(['dataset'] + [name for name, lookup in DATASETS[dataset]['columns']])
+        yield buffer.drain()
+        for row in dataset_rows(profile, dataset):
+            writer.writerow((dataset,) + row)
+            yield buffer.drain()
+
+
+def ndjson_lines(profile, datasets):
+    encoder = json.JSONEncoder(default=json_default, separators=(',', ':'))
+    for dataset in datasets:
+        names = [name for name, lookup in DATASETS[dataset]['columns']]
+        for row in dataset_rows(profile, dataset):
+            record = dict(zip(names, row))
+            record['dataset'] = dataset
+            yield encoder.encode(record) + '\n'
+
+
+def export_chunks(profile, datasets, export_format='ndjson', compress=False):
+    # Yields bytes in FLUSH_BYTES-sized chunks; memory use does not depend on the size of the history
+    lines = csv_lines(profile, datasets) if export_format == 'csv' else ndjson_lines(profile, datasets)
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None  # wbits=31 writes a gzip container
+
+    pending = []
+    size = 0
+    for line in lines:
+        data = line.encode('utf-8')
+        pending.append(data)
+        size += len(data)
+        if size >= FLUSH_BYTES:
+            chunk = b''.join(pending)
+            pending, size = [], 0
+            chunk = compressor.compress(chunk) if compressor else chunk
+            if chunk:
+                yield chunk
+
+    chunk = b''.join(pending)
+    if compressor:
+        chunk = compressor.compress(chunk) + compressor.flush()
+    if chunk:
+        yield chunk
+
+
+def export_filename(profile, datasets, export_format, compress):
+    name = 'training-history' if len(datasets) > 1 else datasets[0].replace('_', '-')
+    return '%s-%s.%s%s' % (profile.user.username, name, export_format, '.gz' if compress else '')
@@ -1,5 +1,7 @@
 from django import forms
-from .models import Profile, Exercise, ExerciseType, Workout, ExerciseProgress, WorkoutProgress
+from django.contrib.auth.forms import UserCreationForm
+from workout_app import hashing
+from .models import Profile, Exercise, ExerciseType, Workout, ExerciseProgress, WorkoutProgress, WorkoutExercise
 
 class ProfileForm(forms.ModelForm):
     email = forms.EmailField(label='Email:')
@@ -77,4 +79,63 @@ class WorkoutForm(forms.ModelForm):
         return duration
 
 class ExerciseSelectionForm(forms.Form):
-    exercises = forms.ModelMultipleChoiceField(queryset=Exercise.objects.all())
+    # Options are fetched from the exercise search endpoint as the user types, so only selected ids are rendered
+    exercises = forms.ModelMultipleChoiceField(queryset=Exercise.objects.all(), widget=forms.MultipleHiddenInput)
+
+class LoadedRowField(forms.ModelChoiceField):
+    # Resolves a posted row id from the rows the formset already loaded, where ModelChoiceField would
+    # run a query per row; ids outside the formset's queryset are rejected
+    def __init__(self, formset, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.formset = formset
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        try:
+            row = self.formset._existing_object(self.formset.model._meta.pk.to_python(value))
+        except forms.ValidationError:
+            row = None
+        if row is None:
+            raise forms.ValidationError(self.error_messages['invalid_choice'], code='invalid_choice', params={'value': value})
+        return row
+
+class BaseWorkoutPlanFormSet(forms.BaseModelFormSet):
+    def add_fields(self, form, index):
+        super().add_fields(form, index)
+        name = self.model._meta.pk.name
+        field = form.fields[name]
+        form.fields[name] = LoadedRowField(self, field.queryset, initial=field.initial, required=False, widget=field.widget)
+
+WorkoutPlanFormSet = forms.modelformset_factory(
+    WorkoutExercise, formset=BaseWorkoutPlanFormSet,
+    fields=['position', 'target_sets', 'target_repetitions', 'target_weight'], extra=0, can_delete=True,
+)
+
+class ExerciseLogForm(forms.Form):
+    exercise = forms.TypedChoiceField(coerce=int)
+    repetitions = forms.IntegerField(initial=0, min_value=0)
+    sets = forms.IntegerField(initial=0, min_value=0)
+    # Bounded like ExerciseProgress.weight, so anything the column cannot hold fails validation
+    weight = forms.DecimalField(initial=0, min_value=0, max_digits=5, decimal_places=2)
+
+    def __init__(self, *args, exercise_choices=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        # Choices come from the workout's exercises, loaded once for the whole formset
+        self.fields['exercise'].choices = exercise_choices
+
+ExerciseLogFormSet = forms.formset_factory(ExerciseLogForm, extra=0, max_num=200, validate_max=True)
+
+class ImportHistoryForm(forms.Form):
+    file = forms.FileField(help_text="CSV or NDJSON, optionally gzipped; our own export files work as-is.")
+    format = forms.ChoiceField(choices=(('csv', 'CSV'), ('ndjson', 'NDJSON')), required=False, help_text="Detected from the file name when left blank.")
+
+class RegisterForm(UserCreationForm):
+    def save(self, commit=True):
+        # UserCreationForm.save() would hash inline on the request thread; hash on the bounded pool instead
+        user = forms.ModelForm.save(self, commit=False)
+        user.password = hashing.make_password(self.cleaned_data['password1'])
+        if commit:
+            user.save()
+            self.save_m2m()
+        return user
@@ -0,0 +1,92 @@
+from django.conf import settings
+from django.db.models import Max
+
+from .caching import get_cache, invalidate_workouts
+from .models import ExerciseProgress, Workout, WorkoutExercise
+from .progress import log_exercise
+
+# A guided session walks one user through a workout's plan a step at a time. The plan is loaded once,
+# when the session starts, and kept with the cursor in the cache; a step then costs the progress insert
+# and nothing else. Plan edits made mid-session apply from the next session.
+
+
+def plan_steps(workout_id):
+    return list(WorkoutExercise.objects.filter(workout_id=workout_id).select_related('exercise').order_by('position', 'id'))
+
+
+def append_to_plan(workout, exercises):
+    # New steps go after the existing ones; exercises already in the plan are left where they are
+    last = WorkoutExercise.objects.filter(workout=workout).aggregate(last=Max('position'))['last'] or 0
+    WorkoutExercise.objects.bulk_create(
+        [WorkoutExercise(workout=workout, exercise=exercise, position=last + index) for index, exercise in enumerate(exercises, 1)],
+        ignore_conflicts=True,
+    )
+    # bulk_create sends neither post_save nor m2m_changed
+    invalidate_workouts([workout.id])
+
+
+def session_key(user_id, workout_id):
+    return 'guided:%s:%s' % (user_id, workout_id)
+
+
+class GuidedSession:
+    def __init__(self, user_id, profile_id, workout_id, steps, cursor=0):
+        self.user_id = user_id
+        self.profile_id = profile_id
+        self.workout_id = workout_id
+        self.steps = steps
+        self.cursor = cursor
+
+    @classmethod
+    def start(cls, user_id, workout, restart=False):
+        steps = plan_steps(workout.id)
+        cursor = 0
+        if not restart:
+            # Resuming after the cached state was lost: pick up at the first step with nothing logged yet
+            logged = set(ExerciseProgress.objects.filter(workout=workout, profile_id=workout.profile_id).values_list('exercise_id', flat=True))
+            cursor = next((index for index, step in enumerate(steps) if step.exercise_id not in logged), len(steps))
+        session = cls(user_id, workout.profile_id, workout.id, steps, cursor)
+        session.save()
+        return session
+
+    @classmethod
+    def load(cls, user_id, workout_id):
+        return get_cache().get(session_key(user_id, workout_id))
+
+    @property
+    def current(self):
+        return self.steps[self.cursor] if self.cursor < len(self.steps) else None
+
+    @property
+    def finished(self):
+        return self.current is None
+
+    def save(self):
+        get_cache().set(session_key(self.user_id, self.workout_id), self, getattr(settings, 'GUIDED_SESSION_TIMEOUT', 4 * 60 * 60))
+
+    def log(self, sets, repetitions, weight):
+        # The only write for a step; returns any personal-best achievements it earned
+        step = self.current
+        progress = ExerciseProgress(
+            profile_id=self.profile_id, workout_id=self.workout_id, exercise=step.exercise,
+            sets=sets, repetitions=repetitions, weight=weight,
+        )
+        achievements = log_exercise(progress)
+        self.advance()
+        return achievements
+
+    def skip(self):
+        self.advance()
+
+    def advance(self):
+        self.cursor += 1
+        if self.finished:
+            self.finish()
+        else:
+            self.save()
+
+    def finish(self):
+        Workout.objects.filter(pk=self.workout_id).update(completed=True)
+        # QuerySet.update() sends no signals
+        invalidate_workouts([self.workout_id])
+        get_cache().delete(session_key(self.user_id, self.workout_id))
@@ -0,0 +1,254 @@
+import codecs
+import csv
+import hashlib
+import io
+import json
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.utils.dateparse import parse_date
+
+from workout_app.sqlite_backend.retry import retry_on_locked
+
+from .caching import invalidate_progress, invalidate_workouts
+from .models import Exercise, ExerciseProgress, ExerciseType, ImportCheckpoint, Workout
+from .records import replay_personal_bests
+from .rollups import add_to_rollups
+from .search import get_index
+
+DEFAULT_BATCH_SIZE = 5000
+DEFAULT_WORKOUT_NAME = 'Imported workout'
+DEFAULT_EXERCISE_TYPE = 'Imported'
+# Imported workouts have no duration of their own
+DEFAULT_DURATION = 0
+MAX_REPORTED_ERRORS = 20
+
+
+class ImportRowError(ValueError):
+    pass
+
+
+def text_lines(stream):
+    # Decode a binary stream (an open file or an UploadedFile) lazily, line by line
+    if isinstance(stream, io.TextIOBase):
+        return stream
+    return codecs.iterdecode(stream, 'utf-8-sig')
+
+
+def read_rows(stream, import_format):
+    lines = text_lines(stream)
+    if import_format == 'csv':
+        yield from csv.DictReader(lines)
+        return
+    for line in lines:
+        line = line.strip()
+        if line:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield None
+
+
+def source_for(name, stream):
+    # Checkpoints are keyed by the file's content as well as its name, so a different file that happens to
+    # share a name (every export is called <username>-training-history.csv) starts from its first row.
+    # Only a re-run of the same bytes resumes. The stream is rewound for the import itself.
+    digest = hashlib.sha256()
+    size = 0
+    for chunk in iter(lambda: stream.read(1 << 16), b''):
+        digest.update(chunk)
+        size += len(chunk)
+    stream.seek(0)
+    return '%s:%d:%s' % (name[:180], size, digest.hexdigest())
+
+
+def parse_row(row):
+    # Accepts our own export columns plus the common aliases other trackers use
+    if not isinstance(row, dict):
+        raise ImportRowError('not a JSON object')
+    if row.get('dataset', 'exercise_progress') != 'exercise_progress':
+        return None
+
+    exercise = (row.get('exercise') or row.get('exercise_name') or '').strip()
+    if not exercise:
+        raise ImportRowError('missing exercise')
+    date = parse_date(str(row.get('date') or '')[:10])
+    if date is None:
+        raise ImportRowError('missing or invalid date')
+    try:
+        sets = int(row.get('sets') or 0)
+        repetitions = int(row.get('repetitions') or row.get('reps') or 0)
+        weight = row.get('weight')
+        weight = Decimal(str(weight)).quantize(Decimal('0.01')) if weight not in (None, '') else None
+    except (TypeError, ValueError, InvalidOperation):
+        raise ImportRowError('sets, repetitions and weight must be numbers')
+    if sets < 0 or repetitions < 0 or (weight is not None and not Decimal('0') <= weight < Decimal('1000')):
+        raise ImportRowError('sets, repetitions or weight out of range')
+
+    return {
+        'date': date,
+        'workout': (row.get('workout') or row.get('workout_name') or DEFAULT_WORKOUT_NAME).strip()[:100],
+        'exercise': exercise[:100],
+        'type': (row.get('exercise_type') or row.get('type') or DEFAULT_EXERCISE_TYPE).strip()[:100],
+        'sets': sets,
+        'repetitions': repetitions,
+        'weight': weight,
+    }
+
+
+class HistoryImporter:
+    # Streams parsed rows into Workout, the Workout.exercises through table and ExerciseProgress
+    # with one bulk_create per table per batch. Names resolve through in-memory lookup tables
+    # loaded once, so the database sees a constant number of queries per batch, not per row.
+
+    def __init__(self, profile, source, batch_size=DEFAULT_BATCH_SIZE, resume=True, replay_records=True, progress=None):
+        self.profile = profile
+        self.source = source[:255]
+        self.batch_size = batch_size
+        self.resume = resume
+        self.replay_records = replay_records
+        self.progress = progress
+        self.types = {}
+        self.exercises = {}
+        self.workouts = {}
+        self.reused = set()
+        self.stats = {'rows': 0, 'imported': 0, 'skipped': 0, 'resumed_from': 0, 'errors': [], 'seconds': 0.0, 'rows_per_second': 0.0}
+
+    def load_lookups(self):
+        self.types = {name.lower(): pk for pk, name in ExerciseType.objects.values_list('id', 'name').order_by('-id')}
+        self.exercises = {name.lower(): pk for pk, name in Exercise.objects.values_list('id', 'name').order_by('-id')}
+
+    def run(self, rows):
+        start = time.perf_counter()
+        self.load_lookups()
+        checkpoint, created = ImportCheckpoint.objects.get_or_create(profile=self.profile, source=self.source)
+        skip = checkpoint.rows_done if self.resume else 0
+        self.stats['resumed_from'] = skip
+
+        batch = []
+        line = 0
+        for line, row in enumerate(rows, start=1):
+            if line <= skip:
+                continue
+            try:
+                parsed = parse_row(row)
+            except ImportRowError as error:
+                self.record_error(line, error)
+                continue
+            if parsed is None:
+                self.stats['skipped'] += 1
+                continue
+            batch.append(parsed)
+            if len(batch) >= self.batch_size:
+                self.write_batch(batch, checkpoint, line)
+                batch = []
+                self.report(start)
+        self.write_batch(batch, checkpoint, max(line, skip))
+        self.stats['rows'] = max(line - skip, 0)
+
+        if self.replay_records and self.stats['imported']:
+            replay_personal_bests(self.profile.id)
+        self.report(start)
+        return self.stats
+
+    def record_error(self, line, error):
+        self.stats['skipped'] += 1
+        if len(self.stats['errors']) < MAX_REPORTED_ERRORS:
+            self.stats['errors'].append('Row %d: %s' % (line, error))
+
+    def report(self, start):
+        self.stats['seconds'] = round(time.perf_counter() - start, 3)
+        done = self.stats['imported'] + self.stats['skipped']
+        self.stats['rows_per_second'] = round(done / self.stats['seconds'], 1) if self.stats['seconds'] else 0.0
+        if self.progress:
+            self.progress(self.stats)
+
+    def resolve_types(self, batch):
+        missing = {row['type'].lower(): row['type'] for row in batch if row['type'].lower() not in self.types}
+        if missing:
+            created = ExerciseType.objects.bulk_create([ExerciseType(name=name, description='') for name in missing.values()])
+            self.types.update({exercise_type.name.lower(): exercise_type.pk for exercise_type in created})
+
+    def resolve_exercises(self, batch):
+        missing = {}
+        for row in batch:
+            if row['exercise'].lower() not in self.exercises:
+                missing.setdefault(row['exercise'].lower(), row)
+        if missing:
+            created = Exercise.objects.bulk_create([
+                Exercise(name=row['exercise'], type_id=self.types[row['type'].lower()], description='') for row in missing.values()
+            ])
+            self.exercises.update({exercise.name.lower(): exercise.pk for exercise in created})
+            get_index().update([exercise.pk for exercise in created])
+
+    def resolve_workouts(self, batch):
+        keys = {(row['date'], row['workout']) for row in batch} - set(self.workouts)
+        if not keys:
+            return
+        # Workouts from an earlier, interrupted run of this import are reused rather than duplicated
+        existing = Workout.objects.filter(
+            profile=self.profile, date__in={date for date, name in keys}, name__in={name for date, name in keys},
+        ).values_list('date', 'name', 'id')
+        for date, name, pk in existing:
+            if (date, name) in keys:
+                self.workouts[(date, name)] = pk
+                keys.discard((date, name))
+                self.reused.add(pk)
+        created = Workout.objects.bulk_create([
+            Workout(profile=self.profile, name=name, date=date, duration=DEFAULT_DURATION, completed=True)
+            for date, name in sorted(keys)
+        ])
+        self.workouts.update({(workout.date, workout.name): workout.pk for workout in created})
+
+    def write_batch(self, batch, checkpoint, rows_done):
+        lookups = (dict(self.types), dict(self.exercises), dict(self.workouts), set(self.reused))
+
+        def attempt():
+            # A locked database rolls the batch back, ids it created included, so a retry starts from the lookups as they were
+            self.types, self.exercises, self.workouts, self.reused = dict(lookups[0]), dict(lookups[1]), dict(lookups[2]), set(lookups[3])
+            return self.insert_batch(batch, checkpoint, rows_done)
+
+        self.stats['imported'] += retry_on_locked(attempt)()
+
+    def insert_batch(self, batch, checkpoint, rows_done):
+        imported = 0
+        with transaction.atomic():
+            if batch:
+                self.resolve_types(batch)
+                self.resolve_exercises(batch)
+                self.resolve_workouts(batch)
+
+                through = Workout.exercises.through
+                links = {(self.workouts[(row['date'], row['workout'])], self.exercises[row['exercise'].lower()]) for row in batch}
+                through.objects.bulk_create(
+                    [through(workout_id=workout_id, exercise_id=exercise_id) for workout_id, exercise_id in links],
+                    ignore_conflicts=True,
+                )
+
+                progresses = ExerciseProgress.objects.bulk_create([
+                    ExerciseProgress(
+                        profile=self.profile,
+                        workout_id=self.workouts[(row['date'], row['workout'])],
+                        exercise_id=self.exercises[row['exercise'].lower()],
+                        date=row['date'],
+                        sets=row['sets'],
+                        repetitions=row['repetitions'],
+                        weight=row['weight'],
+                    )
+                    for row in batch
+                ])
+                add_to_rollups(progresses)
+                # bulk_create sends no signals, so cached pages of workouts we appended to are dropped here
+                invalidate_workouts({progress.workout_id for progress in progresses} & self.reused)
+                invalidate_progress([self.profile.id])
+                imported = len(progresses)
+
+            # Advanced in the same transaction as the rows, so a resumed import never inserts them twice
+            checkpoint.rows_done = rows_done
+            checkpoint.save(update_fields=['rows_done', 'updated'])
+        return imported
+
+
+def import_history(profile, stream, import_format, source, **options):
+    return HistoryImporter(profile, source, **options).run(read_rows(stream, import_format))
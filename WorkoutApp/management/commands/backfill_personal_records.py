@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from WorkoutApp.models import Profile
+from WorkoutApp.records import replay_personal_bests
+
+
+class Command(BaseCommand):
+    help = 'Replay ExerciseProgress history in date order to rebuild personal bests and their Achievements.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profile', type=int, action='append', dest='profiles', help='Only replay this profile id (repeatable).')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows fetched and written per batch.')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        if chunk_size < 1:
+            raise CommandError('--chunk-size must be positive')
+
+        profiles = Profile.objects.order_by('id')
+        if options['profiles']:
+            profiles = profiles.filter(id__in=options['profiles'])
+
+        count = 0
+        for profile_id in profiles.values_list('id', flat=True).iterator(chunk_size=chunk_size):
+            replay_personal_bests(profile_id, chunk_size)
+            count += 1
+
+        self.stdout.write(self.style.SUCCESS('Replayed personal records for %d profiles' % count))
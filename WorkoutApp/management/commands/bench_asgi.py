@@ -0,0 +1,89 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from WorkoutApp.benchmarks import benchmark_profile, drive_asgi, drive_wsgi, sample_objects
+
+# mode: (server model, WORKOUT_ASYNC_VIEWS for the child process)
+MODES = {
+    'wsgi': ('threads', '0'),
+    'asgi': ('event loop', '1'),
+}
+
+
+class Command(BaseCommand):
+    help = 'Compare requests/s of the hot read views: sync views under WSGI threads versus async views under ASGI.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', help='Defaults to the profile with the most workouts.')
+        parser.add_argument('--requests', type=int, default=500, help='Requests per mode, spread over the views.')
+        parser.add_argument('--concurrency', type=int, default=32, help='WSGI worker threads, or ASGI connections in flight.')
+        parser.add_argument('--json', action='store_true', help='Print results as JSON.')
+        parser.add_argument('--mode', choices=list(MODES), help='Run one mode in this process (used internally).')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--requests and --concurrency must be positive')
+        if options['mode']:
+            self.stdout.write(json.dumps(self.run_mode(options)))
+            return
+
+        # Each mode runs in a fresh process, because ASYNC_READ_VIEWS is read when the URLconf loads
+        results = {}
+        for mode, (server, async_views) in MODES.items():
+            command = [
+                sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'bench_asgi', '--mode', mode,
+                '--requests', str(options['requests']), '--concurrency', str(options['concurrency']),
+            ]
+            if options['username']:
+                command += ['--username', options['username']]
+            child = subprocess.run(command, env={**os.environ, 'WORKOUT_ASYNC_VIEWS': async_views}, capture_output=True, text=True)
+            if child.returncode:
+                raise CommandError('%s run failed:\n%s' % (mode, child.stderr))
+            results[mode] = json.loads(child.stdout.strip().splitlines()[-1])
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for mode, result in results.items():
+            self.stdout.write('%-5s %-10s %8.1f req/s  %8.2fms p50  %8.2fms p95  %d errors' % (
+                mode, MODES[mode][0], result['requests_per_second'], result['p50_ms'], result['p95_ms'], result['errors'],
+            ))
+        if results['wsgi']['requests_per_second']:
+            self.stdout.write('ASGI/WSGI throughput: %.2fx' % (results['asgi']['requests_per_second'] / results['wsgi']['requests_per_second']))
+
+    def run_mode(self, options):
+        profile = benchmark_profile(options['username'])
+        if profile is None:
+            raise CommandError('No profile to benchmark as; run generate_data first')
+        workout = sample_objects(profile)['workout']
+        if workout is None:
+            raise CommandError('%s has no workouts' % profile.user.username)
+
+        views = [
+            reverse('workout_summary', args=[workout.id]),
+            reverse('workout_detail', args=[workout.id]),
+            reverse('workout_list', args=[profile.id]),
+            reverse('progress_data') + '?period=week',
+        ]
+        urls = [views[index % len(views)] for index in range(options['requests'])]
+
+        client = Client()
+        client.force_login(profile.user)
+        cookie = '%s=%s' % (settings.SESSION_COOKIE_NAME, client.cookies[settings.SESSION_COOKIE_NAME].value)
+
+        with override_settings(ALLOWED_HOSTS=['localhost']):
+            if options['mode'] == 'wsgi':
+                from django.core.wsgi import get_wsgi_application
+                result = drive_wsgi(get_wsgi_application(), urls, cookie, options['concurrency'])
+            else:
+                from django.core.asgi import get_asgi_application
+                result = drive_asgi(get_asgi_application(), urls, cookie, options['concurrency'])
+        result['async_views'] = settings.ASYNC_READ_VIEWS
+        return result
@@ -0,0 +1,57 @@
+import os
+
+from django.contrib.auth import authenticate
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from WorkoutApp.benchmarks import drive_logins
+from workout_app import hashing
+from workout_app.hashing import HashPoolBusy
+
+
+class Command(BaseCommand):
+    help = 'Measure logins/s and the latency of a cheap request during a login burst, hashing inline versus on pools of different sizes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prefix', default='synthetic', help='Log in as users generate_data created with this prefix.')
+        parser.add_argument('--password', default='benchmark-password')
+        parser.add_argument('--logins', type=int, default=200, help='Logins per pool size.')
+        parser.add_argument('--concurrency', type=int, default=32, help='Request threads logging in at once.')
+        parser.add_argument('--workers', default='0,1,2,%d' % (os.cpu_count() or 1), help='Comma-separated pool sizes; 0 hashes inline on the request thread.')
+
+    def handle(self, *args, **options):
+        if options['logins'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--logins and --concurrency must be positive')
+        try:
+            pool_sizes = [int(size) for size in options['workers'].split(',')]
+        except ValueError:
+            raise CommandError('--workers must be a comma-separated list of integers')
+        usernames = list(User.objects.filter(username__startswith='%s_' % options['prefix']).order_by('id').values_list('username', flat=True)[:options['concurrency']])
+        if not usernames:
+            raise CommandError('No %s_* users; run generate_data first' % options['prefix'])
+
+        def login(index):
+            try:
+                return authenticate(None, username=usernames[index % len(usernames)], password=options['password']) is not None
+            except HashPoolBusy:
+                return False
+            finally:
+                connection.close()
+
+        client = Client()
+        probe_path = reverse('login')
+        try:
+            with override_settings(ALLOWED_HOSTS=['testserver']):
+                for workers in pool_sizes:
+                    # Queue room and time for every login, so the comparison is throughput rather than rejections
+                    hashing.configure(workers, max_queue=options['logins'], timeout=None)
+                    result = drive_logins(login, lambda: client.get(probe_path), options['logins'], options['concurrency'])
+                    self.stdout.write('%-8s %8.1f logins/s  %8.2fms p50  %8.2fms p95  probe %8.2fms p50  %8.2fms p95  %d failed' % (
+                        'inline' if not workers else '%d thr' % workers, result['requests_per_second'], result['p50_ms'], result['p95_ms'],
+                        result['probe_p50_ms'] or 0, result['probe_p95_ms'] or 0, result['errors'],
+                    ))
+        finally:
+            hashing.reset()
@@ -0,0 +1,146 @@
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+
+from WorkoutApp.models import Exercise, ExerciseProgress, ExerciseType, Workout
+from WorkoutApp.progress import log_exercise
+from workout_app.sqlite_backend.retry import is_locked_error
+
+# Django's stock SQLite setup versus the production profile in settings.DATABASE_PROFILE
+PROFILES = {
+    'development': {'ENGINE': 'django.db.backends.sqlite3'},
+    'production': settings.PRODUCTION_DATABASE,
+}
+
+
+class RetryCounter(logging.Handler):
+    # Counts the retries workout_app.sqlite_backend.retry logs; handle() serializes emit() across threads
+    def __init__(self):
+        super().__init__()
+        self.count = 0
+
+    def emit(self, record):
+        self.count += 1
+
+
+class Command(BaseCommand):
+    help = 'Measure write throughput of many parallel writers logging progress through the ORM under each DATABASES profile.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=16)
+        parser.add_argument('--transactions', type=int, default=200, help='Transactions per writer.')
+        parser.add_argument('--profiles', type=int, default=8, help='Distinct profiles the writers log for.')
+        parser.add_argument('--timeout', type=float, default=5.0, help='SQLite busy timeout in seconds.')
+        parser.add_argument('--json', action='store_true', help='Print results as JSON.')
+
+    def handle(self, *args, **options):
+        results = {}
+        for name, profile in PROFILES.items():
+            with tempfile.TemporaryDirectory() as directory:
+                results[name] = self.run(os.path.join(directory, 'bench.sqlite3'), profile, options)
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for name, result in results.items():
+            self.stdout.write(
+                '%-12s %8.1f commits/s  %6d committed  %5d failed  %5d retries  %.2fs' % (
+                    name, result['commits_per_second'], result['committed'], result['failed'], result['retries'], result['seconds'],
+                )
+            )
+
+    def run(self, path, profile, options):
+        # The default alias points at a scratch database while the writers run. Connections are per
+        # thread, so only threads started here see it; the caller's own connection is left alone.
+        original = connections.settings[DEFAULT_DB_ALIAS]
+        connections.settings[DEFAULT_DB_ALIAS] = {
+            **original, **profile, 'NAME': path,
+            'OPTIONS': {**profile.get('OPTIONS', {}), 'timeout': options['timeout']},
+        }
+        try:
+            targets = self.in_thread(self.set_up, options['profiles'])
+            return self.measure(targets, options)
+        finally:
+            connections.settings[DEFAULT_DB_ALIAS] = original
+
+    def in_thread(self, func, *args):
+        result = []
+        thread = threading.Thread(target=lambda: result.append(self.closing(func, *args)))
+        thread.start()
+        thread.join()
+        return result[0]
+
+    def closing(self, func, *args):
+        try:
+            return func(*args)
+        finally:
+            connections.close_all()
+
+    def set_up(self, profiles):
+        call_command('migrate', verbosity=0, interactive=False)
+        exercise_type = ExerciseType.objects.create(name='Benchmark', description='')
+        exercise = Exercise.objects.create(name='Bench press', type=exercise_type, description='')
+        targets = []
+        for number in range(profiles):
+            user = User.objects.create(username='writer_%d' % number)
+            workout = Workout.objects.create(profile=user.profile, name='Benchmark', duration=60)
+            # Sets the baseline personal best, so the timed writes all take the same path
+            log_exercise(ExerciseProgress(profile=user.profile, workout=workout, exercise=exercise, sets=1, repetitions=1, weight=1))
+            targets.append((user.profile.id, workout.id, exercise))
+        return targets
+
+    def measure(self, targets, options):
+        counter = RetryCounter()
+        logger = logging.getLogger('workout_app.sqlite_backend')
+        propagate, logger.propagate = logger.propagate, False
+        handlers, logger.handlers = logger.handlers, [counter]
+
+        counters = {'committed': 0, 'failed': 0}
+        lock = threading.Lock()
+
+        def writer(seed):
+            rng = random.Random(seed)
+            committed = failed = 0
+            for _ in range(options['transactions']):
+                profile_id, workout_id, exercise = rng.choice(targets)
+                progress = ExerciseProgress(
+                    profile_id=profile_id, workout_id=workout_id, exercise=exercise,
+                    sets=rng.randint(1, 5), repetitions=rng.randint(1, 12), weight=rng.randint(10, 150),
+                )
+                try:
+                    # The same call exercise_progress_create makes: retried on "database is locked"
+                    log_exercise(progress)
+                    committed += 1
+                except OperationalError as error:
+                    if not is_locked_error(error):
+                        raise
+                    failed += 1
+            with lock:
+                counters['committed'] += committed
+                counters['failed'] += failed
+
+        threads = [threading.Thread(target=self.closing, args=(writer, seed)) for seed in range(options['writers'])]
+        start = time.perf_counter()
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            logger.propagate, logger.handlers = propagate, handlers
+        seconds = time.perf_counter() - start
+
+        return {
+            **counters, 'retries': counter.count, 'seconds': round(seconds, 3),
+            'commits_per_second': round(counters['committed'] / seconds, 1),
+        }
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from WorkoutApp.benchmarks import DEFAULT_TOLERANCE, benchmark_profile, compare_results, load_results, run_benchmark, write_results
+
+
+class Command(BaseCommand):
+    help = 'Request every WorkoutApp URL as one user and record p50/p95 latency and SQL query count per view.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', help='Defaults to the profile with the most workouts.')
+        parser.add_argument('--iterations', type=int, default=20, help='Timed requests per URL.')
+        parser.add_argument('--warmup', type=int, default=1, help='Untimed requests per URL first.')
+        parser.add_argument('--output', help='Write the results to this JSON file.')
+        parser.add_argument('--baseline', help='Results JSON from an earlier run; regressions against it fail the command.')
+        parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help='Allowed relative p95 slowdown.')
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError('--iterations must be positive')
+        profile = benchmark_profile(options['username'])
+        if profile is None:
+            raise CommandError('No profile to benchmark as; run generate_data first')
+
+        results = run_benchmark(profile, options['iterations'], options['warmup'])
+        for name, result in sorted(results['views'].items()):
+            self.stdout.write('%-32s %3s %9.2fms p50 %9.2fms p95 %4d queries' % (
+                name, result['status'], result['p50_ms'], result['p95_ms'], result['queries'],
+            ))
+        for name, reason in sorted(results['skipped'].items()):
+            self.stdout.write('%-32s skipped: %s' % (name, reason))
+        if options['output']:
+            write_results(results, options['output'])
+
+        if options['baseline']:
+            regressions = compare_results(results, load_results(options['baseline']), options['tolerance'])
+            if regressions:
+                raise CommandError('Regressions against %s:\n  %s' % (options['baseline'], '\n  '.join(regressions)))
+            self.stdout.write(self.style.SUCCESS('No regressions against %s' % options['baseline']))
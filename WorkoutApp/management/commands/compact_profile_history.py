@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from WorkoutApp.models import Profile
+from WorkoutApp.trends import DAILY_AFTER_DAYS, WEEKLY_AFTER_DAYS, compact_history
+
+
+class Command(BaseCommand):
+    help = 'Downsample old ProfileHistory samples to one point per day, and older ones to one per week.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profile', type=int, action='append', dest='profiles', help='Only compact this profile id (repeatable).')
+        parser.add_argument('--daily-after', type=int, default=DAILY_AFTER_DAYS, help='Days after which samples are kept one per day.')
+        parser.add_argument('--weekly-after', type=int, default=WEEKLY_AFTER_DAYS, help='Days after which samples are kept one per week.')
+
+    def handle(self, *args, **options):
+        if not 0 < options['daily_after'] <= options['weekly_after']:
+            raise CommandError('--daily-after must be positive and no more than --weekly-after')
+
+        profiles = Profile.objects.filter(profilehistory__isnull=False).distinct().order_by('id')
+        if options['profiles']:
+            profiles = profiles.filter(id__in=options['profiles'])
+
+        total = 0
+        for profile_id in list(profiles.values_list('id', flat=True)):
+            total += compact_history(profile_id, daily_after=options['daily_after'], weekly_after=options['weekly_after'])
+        self.stdout.write(self.style.SUCCESS('Removed %d history samples' % total))
@@ -0,0 +1,33 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from WorkoutApp.exports import DATASETS, FORMATS, export_chunks
+from WorkoutApp.models import Profile
+
+
+class Command(BaseCommand):
+    help = "Stream a user's training history to a file or stdout as CSV or NDJSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('--format', choices=list(FORMATS), default='ndjson')
+        parser.add_argument('--dataset', action='append', choices=list(DATASETS), dest='datasets', help='Repeatable; defaults to every dataset.')
+        parser.add_argument('--gzip', action='store_true', help='Compress the output on the fly.')
+        parser.add_argument('--output', help='File to write; defaults to stdout.')
+
+    def handle(self, *args, **options):
+        profile = Profile.objects.select_related('user').filter(user__username=options['username']).first()
+        if profile is None:
+            raise CommandError('No user named "%s"' % options['username'])
+        datasets = options['datasets'] or list(DATASETS)
+
+        output = open(options['output'], 'wb') if options['output'] else sys.stdout.buffer
+        try:
+            for chunk in export_chunks(profile, datasets, options['format'], options['gzip']):
+                output.write(chunk)
+        finally:
+            if options['output']:
+                output.close()
+            else:
+                output.flush()
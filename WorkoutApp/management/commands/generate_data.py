@@ -0,0 +1,180 @@
+import datetime
+import random
+import re
+import time
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models.functions import Length
+
+from WorkoutApp.models import (
+    DailyTracking, Exercise, ExerciseProgress, ExerciseType, NutritionTracking, Profile, Workout,
+)
+from WorkoutApp.programs import save_as_template
+from WorkoutApp.records import replay_personal_bests
+from WorkoutApp.rollups import rebuild_rollups
+
+# (type, exercise, starting weight in kg; None for bodyweight and cardio)
+CATALOGUE = (
+    ('Upper Body', 'Bench Press', 60), ('Upper Body', 'Overhead Press', 40), ('Upper Body', 'Barbell Row', 50),
+    ('Upper Body', 'Pull Up', None), ('Upper Body', 'Dumbbell Curl', 12), ('Upper Body', 'Tricep Dip', None),
+    ('Upper Body', 'Incline Dumbbell Press', 22), ('Upper Body', 'Lat Pulldown', 45),
+    ('Lower Body', 'Back Squat', 80), ('Lower Body', 'Deadlift', 100), ('Lower Body', 'Front Squat', 60),
+    ('Lower Body', 'Romanian Deadlift', 70), ('Lower Body', 'Walking Lunge', 20), ('Lower Body', 'Leg Press', 120),
+    ('Lower Body', 'Calf Raise', 40),
+    ('Core', 'Plank', None), ('Core', 'Hanging Leg Raise', None), ('Core', 'Cable Crunch', 30), ('Core', 'Russian Twist', 8),
+    ('Cardio', 'Rowing Machine', None), ('Cardio', 'Treadmill Run', None), ('Cardio', 'Jump Rope', None),
+    ('Mobility', 'Hip Flexor Stretch', None), ('Mobility', 'Foam Rolling', None),
+)
+
+SPLITS = {
+    'Push Day': ('Upper Body', 'Core'),
+    'Pull Day': ('Upper Body', 'Core'),
+    'Leg Day': ('Lower Body', 'Mobility'),
+    'Full Body': ('Upper Body', 'Lower Body', 'Core'),
+    'Conditioning': ('Cardio', 'Core', 'Mobility'),
+}
+
+FOODS = (
+    ('Oatmeal', 80, 300), ('Eggs', 2, 140), ('Chicken Breast', 150, 250), ('Brown Rice', 150, 170),
+    ('Greek Yogurt', 170, 150), ('Banana', 1, 105), ('Salmon', 140, 290), ('Protein Shake', 1, 180),
+    ('Almonds', 30, 170), ('Broccoli', 100, 35), ('Pasta', 180, 280), ('Apple', 1, 95),
+)
+
+ACTIVITIES = ('walking', 'running', 'cycling', 'yoga', 'swimming', 'hiking')
+
+GOALS = ('Build strength', 'Lose fat', 'Run a half marathon', 'Improve mobility', 'Stay healthy')
+
+
+class Command(BaseCommand):
+    help = 'Generate realistic synthetic users and training history with bulk inserts, for load tests and benchmarks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', type=int, default=50)
+        parser.add_argument('--workouts', type=int, default=100, help='Workouts per profile.')
+        parser.add_argument('--progress', type=int, default=12, help='Exercise progress rows per workout.')
+        parser.add_argument('--nutrition', type=int, default=200, help='Nutrition entries per profile.')
+        parser.add_argument('--tracking', type=int, default=100, help='Daily tracking entries per profile.')
+        parser.add_argument('--days', type=int, default=365, help='How far back the history reaches.')
+        parser.add_argument('--prefix', default='synthetic', help='Username prefix; existing users with it are left alone.')
+        parser.add_argument('--password', default='benchmark-password')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=2000, help='Rows per INSERT.')
+        parser.add_argument('--profiles-per-transaction', type=int, default=10)
+
+    def handle(self, *args, **options):
+        for option in ('profiles', 'batch_size', 'profiles_per_transaction', 'days'):
+            if options[option] < 1:
+                raise CommandError('--%s must be positive' % option.replace('_', '-'))
+        self.rng = random.Random(options['seed'])
+        self.options = options
+        self.today = datetime.date.today()
+
+        start = time.perf_counter()
+        self.load_catalogue()
+        # Hashing is deliberately slow, so every synthetic user shares one hash of the same password
+        self.password = make_password(options['password'])
+        offset = self.next_number(options['prefix'])
+
+        rows = 0
+        step = options['profiles_per_transaction']
+        for first in range(0, options['profiles'], step):
+            numbers = range(offset + first, offset + min(first + step, options['profiles']))
+            rows += self.generate_profiles(numbers)
+            self.stdout.write('%d/%d profiles, %d rows' % (min(first + step, options['profiles']), options['profiles'], rows))
+
+        seconds = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS('Generated %d rows in %.1fs (%.0f rows/s)' % (rows, seconds, rows / seconds)))
+
+    def next_number(self, prefix):
+        # One past the highest generated suffix, so earlier runs' deleted users cannot cause a name clash.
+        # Suffixes have no leading zeros, so the longest, then greatest, name is the highest number.
+        last = (
+            User.objects.filter(username__regex=r'^%s_[0-9]+$' % re.escape(prefix))
+            .order_by(Length('username').desc(), '-username').values_list('username', flat=True).first()
+        )
+        return int(last.rsplit('_', 1)[1]) + 1 if last else 0
+
+    def load_catalogue(self):
+        types = {}
+        for type_name in dict.fromkeys(type_name for type_name, name, weight in CATALOGUE):
+            types[type_name], created = ExerciseType.objects.get_or_create(name=type_name, defaults={'description': ''})
+        # Created one at a time so the search index receivers see them; the catalogue is small
+        self.exercises = {}
+        for type_name, name, weight in CATALOGUE:
+            exercise, created = Exercise.objects.get_or_create(name=name, defaults={'type': types[type_name], 'description': ''})
+            self.exercises.setdefault(type_name, []).append((exercise.pk, weight))
+
+    def generate_profiles(self, numbers):
+        rng = self.rng
+        options = self.options
+        batch_size = options['batch_size']
+
+        with transaction.atomic():
+            users = User.objects.bulk_create([
+                User(username='%s_%d' % (options['prefix'], number), email='%s_%d@example.com' % (options['prefix'], number), password=self.password)
+                for number in numbers
+            ], batch_size=batch_size)
+            # bulk_create skips the post_save receiver that normally creates the profile
+            profiles = Profile.objects.bulk_create([
+                Profile(
+                    user=user, email=user.email, age=rng.randint(18, 65), gender=rng.choice('MFO'),
+                    height=Decimal(rng.randint(150, 200)), weight=Decimal(rng.randint(50, 110)), fitness_goal=rng.choice(GOALS),
+                )
+                for user in users
+            ], batch_size=batch_size)
+
+            workouts = []
+            for profile in profiles:
+                for date in self.dates(options['workouts']):
+                    workouts.append(Workout(
+                        profile=profile, name=rng.choice(list(SPLITS)), date=date, duration=rng.randint(30, 90),
+                        completed=date < self.today or rng.random() < 0.5,
+                    ))
+            workouts = Workout.objects.bulk_create(workouts, batch_size=batch_size)
+
+            links = []
+            progresses = []
+            for workout in workouts:
+                choices = [exercise for type_name in SPLITS[workout.name] for exercise in self.exercises[type_name]]
+                chosen = rng.sample(choices, min(len(choices), rng.randint(3, 6)))
+                links.extend(Workout.exercises.through(workout_id=workout.pk, exercise_id=pk) for pk, weight in chosen)
+                # Weights creep up over the year, so personal records and trends look like real training
+                progress_ratio = 1 + (options['days'] - (self.today - workout.date).days) / options['days'] * 0.3
+                for index in range(options['progress']):
+                    exercise_id, weight = chosen[index % len(chosen)]
+                    if weight is not None:
+                        weight = Decimal(round(weight * progress_ratio * rng.uniform(0.9, 1.05) * 2) / 2).quantize(Decimal('0.01'))
+                    progresses.append(ExerciseProgress(
+                        profile_id=workout.profile_id, workout_id=workout.pk, exercise_id=exercise_id, date=workout.date,
+                        sets=rng.randint(2, 5), repetitions=rng.randint(3, 15), weight=weight,
+                    ))
+            Workout.exercises.through.objects.bulk_create(links, batch_size=batch_size)
+            ExerciseProgress.objects.bulk_create(progresses, batch_size=batch_size)
+            # Each batch shares one of its workouts, so the template browser has something to list
+            templates = [save_as_template(workouts[0], public=True)] if workouts else []
+
+            nutrition = []
+            tracking = []
+            for profile in profiles:
+                for date in self.dates(options['nutrition']):
+                    food, quantity, calories = rng.choice(FOODS)
+                    nutrition.append(NutritionTracking(profile=profile, date=date, food_item=food, quantity=quantity, calories=calories))
+                for date in self.dates(options['tracking']):
+                    tracking.append(DailyTracking(profile=profile, date=date, activity=rng.choice(ACTIVITIES), duration=rng.randint(10, 120)))
+            NutritionTracking.objects.bulk_create(nutrition, batch_size=batch_size)
+            DailyTracking.objects.bulk_create(tracking, batch_size=batch_size)
+
+            # The derived tables are rebuilt once per batch rather than maintained row by row
+            profile_ids = [profile.pk for profile in profiles]
+            rebuild_rollups(profile_ids)
+            for profile_id in profile_ids:
+                replay_personal_bests(profile_id)
+
+        return len(users) + len(profiles) + len(workouts) + len(links) + len(progresses) + len(templates) + len(nutrition) + len(tracking)
+
+    def dates(self, count):
+        return sorted(self.today - datetime.timedelta(days=self.rng.randrange(self.options['days'])) for _ in range(count))
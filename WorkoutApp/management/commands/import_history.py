@@ -0,0 +1,54 @@
+import gzip
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from WorkoutApp.imports import DEFAULT_BATCH_SIZE, import_history, source_for
+from WorkoutApp.models import Profile
+
+
+class Command(BaseCommand):
+    help = "Bulk-import a user's training history from a CSV or NDJSON file (optionally gzipped)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=('csv', 'ndjson'), help='Defaults to the file extension.')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--source', help='Checkpoint name; defaults to the file name and a hash of its contents. Re-running with the same source resumes.')
+        parser.add_argument('--no-resume', action='store_true', help='Start from the first row even if a checkpoint exists.')
+        parser.add_argument('--skip-records', action='store_true', help='Do not replay personal records after the import.')
+
+    def handle(self, *args, **options):
+        profile = Profile.objects.filter(user__username=options['username']).first()
+        if profile is None:
+            raise CommandError('No user named "%s"' % options['username'])
+        path = options['path']
+        name = path[:-3] if path.endswith('.gz') else path
+        import_format = options['format'] or ('csv' if name.endswith('.csv') else 'ndjson')
+
+        def report(stats):
+            self.stdout.write('%(imported)d rows imported, %(skipped)d skipped, %(rows_per_second).0f rows/s' % stats)
+
+        opener = gzip.open if path.endswith('.gz') else open
+        try:
+            source = options['source']
+            if not source:
+                with open(path, 'rb') as raw:
+                    source = source_for(os.path.basename(path), raw)
+            with opener(path, 'rb') as stream:
+                stats = import_history(
+                    profile, stream, import_format, source,
+                    batch_size=options['batch_size'], resume=not options['no_resume'],
+                    replay_records=not options['skip_records'], progress=report,
+                )
+        except OSError as error:
+            raise CommandError(error)
+
+        if stats['resumed_from']:
+            self.stdout.write('Resumed after row %d' % stats['resumed_from'])
+        for error in stats['errors']:
+            self.stderr.write(error)
+        self.stdout.write(self.style.SUCCESS(
+            'Imported %(imported)d rows in %(seconds).1fs (%(rows_per_second).0f rows/s)' % stats
+        ))
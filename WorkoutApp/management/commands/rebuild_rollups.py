@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from WorkoutApp.models import Profile
+from WorkoutApp.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuild or backfill the DailyRollup table from the raw tracking tables, a batch of profiles at a time.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profile', type=int, action='append', dest='profiles', help='Only rebuild this profile id (repeatable).')
+        parser.add_argument('--since', help='Only rebuild days on or after this date (YYYY-MM-DD).')
+        parser.add_argument('--batch-size', type=int, default=100, help='Profiles per transaction.')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            since = parse_date(options['since'])
+            if since is None:
+                raise CommandError('--since must be a date in YYYY-MM-DD format')
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be positive')
+
+        profiles = Profile.objects.order_by('id')
+        if options['profiles']:
+            profiles = profiles.filter(id__in=options['profiles'])
+
+        last_id = 0
+        total = 0
+        while True:
+            batch = list(profiles.filter(id__gt=last_id).values_list('id', flat=True)[:batch_size])
+            if not batch:
+                break
+            total += rebuild_rollups(batch, since)
+            last_id = batch[-1]
+            self.stdout.write('Rebuilt profiles up to id %d (%d rollup rows so far)' % (last_id, total))
+
+        self.stdout.write(self.style.SUCCESS('Wrote %d rollup rows' % total))
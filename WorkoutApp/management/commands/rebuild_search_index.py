@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from WorkoutApp.search import get_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the exercise search index from the Exercise and ExerciseType tables.'
+
+    def handle(self, *args, **options):
+        index = get_index()
+        index.rebuild()
+        self.stdout.write(self.style.SUCCESS('Rebuilt the %s' % type(index).__name__))
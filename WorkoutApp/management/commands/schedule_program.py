@@ -0,0 +1,41 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from WorkoutApp.models import Profile, WorkoutTemplate
+from WorkoutApp.programs import DEFAULT_BATCH_SIZE, schedule_program
+
+WEEKDAYS = ('mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun')
+
+
+class Command(BaseCommand):
+    help = 'Schedule a workout template as a recurring program, creating one workout per profile per session.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('template', type=int, help='WorkoutTemplate id.')
+        parser.add_argument('--start', help='First day of the program (YYYY-MM-DD, default today).')
+        parser.add_argument('--weeks', type=int, default=12, help='Length of the program in weeks.')
+        parser.add_argument('--day', action='append', dest='days', choices=WEEKDAYS, help='Weekday to train on (repeatable, default the start day).')
+        parser.add_argument('--profile', type=int, action='append', dest='profiles', help='Only schedule for this profile id (repeatable, default every profile).')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='Workouts inserted per batch.')
+
+    def handle(self, *args, **options):
+        template = WorkoutTemplate.objects.filter(pk=options['template']).first()
+        if template is None:
+            raise CommandError('No workout template with id %s' % options['template'])
+        start = parse_date(options['start']) if options['start'] else datetime.date.today()
+        if start is None:
+            raise CommandError('--start must be a date in YYYY-MM-DD format')
+        if options['weeks'] < 1 or options['batch_size'] < 1:
+            raise CommandError('--weeks and --batch-size must be positive')
+
+        profiles = Profile.objects.order_by('id')
+        if options['profiles']:
+            profiles = profiles.filter(id__in=options['profiles'])
+        weekdays = [WEEKDAYS.index(day) for day in options['days'] or []]
+
+        created = schedule_program(
+            template, profiles.values_list('id', flat=True), start, options['weeks'], weekdays, options['batch_size'],
+        )
+        self.stdout.write(self.style.SUCCESS('Scheduled %d workouts' % created))
@@ -0,0 +1,41 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from workout_app.routers import PRIMARY_ALIAS, REPLICA_ALIAS, replica_staleness
+
+
+class Command(BaseCommand):
+    help = 'Copy the primary SQLite database into the read replica with the online backup API.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, help='Keep syncing every INTERVAL seconds instead of once.')
+        parser.add_argument('--pages', type=int, default=1024, help='Pages copied per backup step; the primary stays writable between steps.')
+
+    def handle(self, *args, **options):
+        if REPLICA_ALIAS not in settings.DATABASES:
+            raise CommandError('No "%s" database configured; set WORKOUT_READ_REPLICA=1.' % REPLICA_ALIAS)
+        primary = str(settings.DATABASES[PRIMARY_ALIAS]['NAME'])
+        replica = str(settings.DATABASES[REPLICA_ALIAS]['NAME'])
+
+        while True:
+            staleness = replica_staleness()
+            start = time.perf_counter()
+            self.sync(primary, replica, options['pages'])
+            self.stdout.write('Synced replica in %.2fs (previous sync: %s)' % (
+                time.perf_counter() - start, 'never' if staleness is None else '%.0fs ago' % staleness,
+            ))
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+    def sync(self, primary, replica, pages):
+        source = sqlite3.connect(primary)
+        target = sqlite3.connect(replica)
+        try:
+            source.backup(target, pages=pages)
+        finally:
+            target.close()
+            source.close()
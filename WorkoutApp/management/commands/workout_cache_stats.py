@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from WorkoutApp.caching import cache_stats, reset_cache_stats
+
+
+class Command(BaseCommand):
+    help = 'Show hit and miss counters for the workout detail and summary cache.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Zero the counters after printing them.')
+
+    def handle(self, *args, **options):
+        for kind, stats in cache_stats().items():
+            self.stdout.write('%s: %d hits, %d misses (%.1f%% hit ratio)' % (kind, stats['hits'], stats['misses'], stats['hit_ratio'] * 100))
+        if options['reset']:
+            reset_cache_stats()
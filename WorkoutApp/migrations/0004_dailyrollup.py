@@ -0,0 +1,32 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('WorkoutApp', '0003_remove_workout_public_nutritiontracking_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('exercise_volume', models.FloatField(default=0, help_text='Sum of sets x repetitions x weight.')),
+                ('calories', models.IntegerField(default=0)),
+                ('active_minutes', models.IntegerField(default=0)),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='WorkoutApp.profile')),
+            ],
+            options={
+                'ordering': ['date'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='dailyrollup',
+            constraint=models.UniqueConstraint(fields=('profile', 'date'), name='unique_daily_rollup'),
+        ),
+    ]
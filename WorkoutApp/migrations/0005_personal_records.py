@@ -0,0 +1,45 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:45
+
+import datetime
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('WorkoutApp', '0004_dailyrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='achievement',
+            name='exercise',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='WorkoutApp.exercise'),
+        ),
+        migrations.AddField(
+            model_name='achievement',
+            name='record_type',
+            field=models.CharField(blank=True, choices=[('weight', 'Heaviest weight'), ('one_rep_max', 'Best estimated 1RM'), ('set_volume', 'Best set volume')], max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='achievement',
+            name='date_achieved',
+            field=models.DateField(default=datetime.date.today),
+        ),
+        migrations.CreateModel(
+            name='PersonalBest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weight', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('one_rep_max', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('set_volume', models.DecimalField(decimal_places=2, default=0, help_text='Repetitions x weight for a single set.', max_digits=10)),
+                ('exercise', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='WorkoutApp.exercise')),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='WorkoutApp.profile')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='personalbest',
+            constraint=models.UniqueConstraint(fields=('profile', 'exercise'), name='unique_personal_best'),
+        ),
+    ]
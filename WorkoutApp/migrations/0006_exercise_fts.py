@@ -0,0 +1,44 @@
+from django.db import migrations
+
+FTS_TABLE = 'WorkoutApp_exercise_fts'
+
+
+def fts5_available(schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return False
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('PRAGMA compile_options')
+        return any(option == 'ENABLE_FTS5' for option, in cursor.fetchall())
+
+
+def create_fts_table(apps, schema_editor):
+    # Without FTS5 the app falls back to its in-process index, so there is nothing to create
+    if not fts5_available(schema_editor):
+        return
+    Exercise = apps.get_model('WorkoutApp', 'Exercise')
+    schema_editor.execute(
+        'CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5('
+        "name, type_name, description, tokenize='unicode61 remove_diacritics 2', prefix='2 3')" % FTS_TABLE
+    )
+    documents = Exercise.objects.values_list('id', 'name', 'type__name', 'description')
+    with schema_editor.connection.cursor() as cursor:
+        cursor.executemany(
+            'INSERT INTO %s (rowid, name, type_name, description) VALUES (%%s, %%s, %%s, %%s)' % FTS_TABLE,
+            [list(document) for document in documents.iterator(chunk_size=2000)],
+        )
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS %s' % FTS_TABLE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('WorkoutApp', '0005_personal_records'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:53
+
+from django.conf import settings
+from django.db import migrations, models
+
+USERNAME_INDEX = 'user_username_lower_idx'
+
+
+def create_username_index(apps, schema_editor):
+    # The user model belongs to another app, so its case-insensitive login lookup gets a hand-written functional index
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    quote = schema_editor.quote_name
+    schema_editor.execute('CREATE INDEX %s ON %s (LOWER(%s))' % (
+        quote(USERNAME_INDEX), quote(User._meta.db_table), quote(User._meta.get_field('username').column),
+    ))
+
+
+def drop_username_index(apps, schema_editor):
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute('DROP INDEX %s ON %s' % (schema_editor.quote_name(USERNAME_INDEX), schema_editor.quote_name(User._meta.db_table)))
+    else:
+        schema_editor.execute('DROP INDEX %s' % schema_editor.quote_name(USERNAME_INDEX))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        # SQLite rebuilds auth_user when auth alters its fields, dropping any index added before that
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('WorkoutApp', '0006_exercise_fts'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='exerciseprogress',
+            index=models.Index(fields=['workout', 'profile'], name='progress_workout_profile_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='exerciseprogress',
+            index=models.Index(fields=['profile', 'date'], name='progress_profile_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='exerciseprogress',
+            index=models.Index(fields=['profile', 'exercise', 'date'], name='progress_profile_exercise_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(fields=['email'], name='profile_email_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='workout',
+            index=models.Index(fields=['profile', 'completed', 'date', 'id'], name='workout_profile_completed_idx'),
+        ),
+        migrations.RunPython(create_username_index, drop_username_index),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:58
+
+import datetime
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('WorkoutApp', '0007_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='exerciseprogress',
+            name='date',
+            field=models.DateField(default=datetime.date.today),
+        ),
+        migrations.AlterField(
+            model_name='workout',
+            name='date',
+            field=models.DateField(default=datetime.date.today),
+        ),
+        migrations.CreateModel(
+            name='ImportCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=255)),
+                ('rows_done', models.PositiveIntegerField(default=0)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='WorkoutApp.profile')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='importcheckpoint',
+            constraint=models.UniqueConstraint(fields=('profile', 'source'), name='unique_import_checkpoint'),
+        ),
+    ]
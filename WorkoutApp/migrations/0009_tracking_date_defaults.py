@@ -0,0 +1,24 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:02
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('WorkoutApp', '0008_import_history'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='dailytracking',
+            name='date',
+            field=models.DateField(default=datetime.date.today),
+        ),
+        migrations.AlterField(
+            model_name='nutritiontracking',
+            name='date',
+            field=models.DateField(default=datetime.date.today),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('WorkoutApp', '0009_tracking_date_defaults'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='profilehistory',
+            index=models.Index(fields=['profile', 'date_recorded', 'id'], name='history_profile_date_idx'),
+        ),
+    ]
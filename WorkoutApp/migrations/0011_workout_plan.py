@@ -0,0 +1,62 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('WorkoutApp', '0010_profile_history_index'),
+    ]
+
+    operations = [
+        # Adopt the auto-created M2M table as an explicit through model without copying rows
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='WorkoutExercise',
+                    fields=[
+                        ('id', models.AutoField(primary_key=True, serialize=False)),
+                        ('workout', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='WorkoutApp.workout')),
+                        ('exercise', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='WorkoutApp.exercise')),
+                    ],
+                    options={
+                        'db_table': 'WorkoutApp_workout_exercises',
+                        'unique_together': {('workout', 'exercise')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='workout',
+                    name='exercises',
+                    field=models.ManyToManyField(through='WorkoutApp.WorkoutExercise', to='WorkoutApp.exercise'),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='workoutexercise',
+            name='position',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='workoutexercise',
+            name='target_sets',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='workoutexercise',
+            name='target_repetitions',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='workoutexercise',
+            name='target_weight',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True),
+        ),
+        migrations.AlterModelOptions(
+            name='workoutexercise',
+            options={'ordering': ['position', 'id']},
+        ),
+        migrations.AddIndex(
+            model_name='workoutexercise',
+            index=models.Index(fields=['workout', 'position', 'id'], name='workout_exercise_position_idx'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('WorkoutApp', '0011_workout_plan'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TemplateExercise',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField(default=0)),
+                ('target_sets', models.PositiveIntegerField(blank=True, null=True)),
+                ('target_repetitions', models.PositiveIntegerField(blank=True, null=True)),
+                ('target_weight', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True)),
+                ('exercise', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='WorkoutApp.exercise')),
+            ],
+            options={
+                'ordering': ['position', 'id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='WorkoutTemplate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('duration', models.IntegerField(help_text='Duration in minutes')),
+                ('description', models.TextField(blank=True, null=True)),
+                ('public', models.BooleanField(default=False)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('exercises', models.ManyToManyField(through='WorkoutApp.TemplateExercise', to='WorkoutApp.exercise')),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='WorkoutApp.profile')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='templateexercise',
+            name='template',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='WorkoutApp.workouttemplate'),
+        ),
+        migrations.AddIndex(
+            model_name='workouttemplate',
+            index=models.Index(fields=['public', 'id'], name='template_public_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='templateexercise',
+            unique_together={('template', 'exercise')},
+        ),
+    ]
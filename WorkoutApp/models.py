@@ -1,10 +1,84 @@
-from django.db import models
+from django.db import models, router, transaction
 from django.db.models.signals import post_save
 from django.contrib.auth.models import User
 from django.dispatch import receiver
 import datetime
 
-class Profile(models.Model):
+from workout_app.sqlite_backend.retry import retry_on_locked
+
+class AtomicSaveModel(models.Model):
+    # Wrapping save() means post_save receivers (e.g. the daily rollups) commit or roll back with the row itself.
+    # Run on its own, the transaction is retried when SQLite reports the database as locked.
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        adding, pk = self._state.adding, self.pk
+
+        def attempt():
+            # A failed attempt rolled back, so the instance goes back to how it arrived
+            self._state.adding, self.pk = adding, pk
+            with transaction.atomic(using=using):
+                super(AtomicSaveModel, self).save(*args, **kwargs)
+
+        retry_on_locked(attempt, using=using)()
+
+class ChangeTrackingModel(models.Model):
+    # Remembers the values loaded from the database, so save() updates only the columns that changed
+    # and skips the UPDATE (and its signals) altogether when nothing did
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.snapshot()
+        return instance
+
+    def snapshot(self, fields=None):
+        loaded = self.__dict__.setdefault('_loaded_values', {})
+        deferred = self.get_deferred_fields()
+        for field in self._meta.concrete_fields:
+            if field.attname not in deferred and (fields is None or field.name in fields or field.attname in fields):
+                loaded[field.attname] = getattr(self, field.attname)
+
+    def changed_fields(self):
+        loaded = self.__dict__.get('_loaded_values', {})
+        deferred = self.get_deferred_fields()
+        return [
+            field.name for field in self._meta.concrete_fields
+            if not field.primary_key and field.attname not in deferred
+            and (field.attname not in loaded or loaded[field.attname] != getattr(self, field.attname))
+        ]
+
+    def as_loaded(self):
+        # An unsaved copy holding the values as loaded, or None when some were deferred
+        loaded = self.__dict__.get('_loaded_values')
+        if loaded is None or len(loaded) < len(self._meta.concrete_fields):
+            return None
+        return type(self)(**loaded)
+
+    def save(self, *args, **kwargs):
+        loaded = self.__dict__.get('_loaded_values')
+        tracked = (
+            loaded is not None and not args and not self._state.adding
+            and loaded.get(self._meta.pk.attname) == self.pk
+            and not any(kwargs.get(option) for option in ('update_fields', 'force_insert', 'force_update'))
+        )
+        if tracked:
+            changed = self.changed_fields()
+            if not changed:
+                return
+            kwargs['update_fields'] = changed
+        super().save(*args, **kwargs)
+        self.snapshot(kwargs.get('update_fields'))
+
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using, fields)
+        self.snapshot(fields)
+
+class Profile(ChangeTrackingModel):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     first_name = models.CharField(max_length=100, blank=True, null=True)
     last_name = models.CharField(max_length=100, blank=True, null=True)
@@ -16,6 +90,11 @@ class Profile(models.Model):
     birthdate = models.DateField(null=True, blank=True)
     fitness_goal = models.CharField(max_length=200)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['email'], name='profile_email_idx'),
+        ]
+
     def __str__(self):
         return self.user.username
     
@@ -25,6 +104,12 @@ class ProfileHistory(models.Model):
     height = models.DecimalField(null=True, max_digits=5, decimal_places=2)
     weight = models.DecimalField(null=True, max_digits=5, decimal_places=2)
 
+    class Meta:
+        indexes = [
+            # The weight trend and the compaction job read one profile's samples in date order
+            models.Index(fields=['profile', 'date_recorded', 'id'], name='history_profile_date_idx'),
+        ]
+
 class ExerciseType(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField()
@@ -40,24 +125,87 @@ class Exercise(models.Model):
     def __str__(self):
         return self.name
 
-class Workout(models.Model):
+class Workout(ChangeTrackingModel):
     profile = models.ForeignKey(Profile, on_delete=models.CASCADE)
     name = models.CharField(max_length=100)
-    date = models.DateField(auto_now_add=True)
-    exercises = models.ManyToManyField(Exercise)
+    date = models.DateField(default=datetime.date.today)
+    exercises = models.ManyToManyField(Exercise, through='WorkoutExercise')
     duration = models.IntegerField(help_text="Duration in minutes")
     description = models.TextField(blank=True, null=True)
     completed = models.BooleanField(default=False)
 
-class ExerciseProgress(models.Model):
+    class Meta:
+        indexes = [
+            # Covers the open/completed workout lists, which page on (date, id)
+            models.Index(fields=['profile', 'completed', 'date', 'id'], name='workout_profile_completed_idx'),
+        ]
+
+class WorkoutExercise(models.Model):
+    # One step of a workout's plan. It reuses the plain M2M's table, so existing links keep working, and
+    # steps added through workout.exercises.add() sort by insertion order
+    id = models.AutoField(primary_key=True)  # The M2M table's integer key
+    workout = models.ForeignKey(Workout, on_delete=models.CASCADE)
+    exercise = models.ForeignKey(Exercise, on_delete=models.CASCADE)
+    position = models.PositiveIntegerField(default=0)
+    target_sets = models.PositiveIntegerField(null=True, blank=True)
+    target_repetitions = models.PositiveIntegerField(null=True, blank=True)
+    target_weight = models.DecimalField(null=True, blank=True, max_digits=5, decimal_places=2)
+
+    class Meta:
+        db_table = 'WorkoutApp_workout_exercises'
+        unique_together = [('workout', 'exercise')]
+        ordering = ['position', 'id']
+        indexes = [
+            models.Index(fields=['workout', 'position', 'id'], name='workout_exercise_position_idx'),
+        ]
+
+class WorkoutTemplate(models.Model):
+    # A reusable plan that is cloned into a profile's Workout, rather than a Workout shared in place
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE)
+    name = models.CharField(max_length=100)
+    duration = models.IntegerField(help_text="Duration in minutes")
+    description = models.TextField(blank=True, null=True)
+    exercises = models.ManyToManyField(Exercise, through='TemplateExercise')
+    public = models.BooleanField(default=False)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Covers browsing the shared templates newest first
+            models.Index(fields=['public', 'id'], name='template_public_idx'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+class TemplateExercise(models.Model):
+    template = models.ForeignKey(WorkoutTemplate, on_delete=models.CASCADE)
+    exercise = models.ForeignKey(Exercise, on_delete=models.CASCADE)
+    position = models.PositiveIntegerField(default=0)
+    target_sets = models.PositiveIntegerField(null=True, blank=True)
+    target_repetitions = models.PositiveIntegerField(null=True, blank=True)
+    target_weight = models.DecimalField(null=True, blank=True, max_digits=5, decimal_places=2)
+
+    class Meta:
+        unique_together = [('template', 'exercise')]
+        ordering = ['position', 'id']
+
+class ExerciseProgress(ChangeTrackingModel, AtomicSaveModel):
     profile = models.ForeignKey(Profile, on_delete=models.CASCADE)
     workout = models.ForeignKey(Workout, on_delete=models.CASCADE)
     exercise = models.ForeignKey(Exercise, on_delete=models.CASCADE)
-    date = models.DateField(auto_now_add=True)
+    date = models.DateField(default=datetime.date.today)
     repetitions = models.IntegerField(default=0)
     sets = models.IntegerField(default=0)
     weight = models.DecimalField(null=True, max_digits=5, decimal_places=2, help_text="Weight in kilograms or pounds.")
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['workout', 'profile'], name='progress_workout_profile_idx'),
+            models.Index(fields=['profile', 'date'], name='progress_profile_date_idx'),
+            models.Index(fields=['profile', 'exercise', 'date'], name='progress_profile_exercise_idx'),
+        ]
+
 class WorkoutProgress(models.Model):
     workout = models.ForeignKey(Workout, on_delete=models.CASCADE)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -65,27 +213,68 @@ class WorkoutProgress(models.Model):
     notes = models.TextField(blank=True)
     completed = models.BooleanField(default=False) 
 
-class DailyTracking(models.Model):
+class DailyTracking(AtomicSaveModel):
     profile = models.ForeignKey(Profile, on_delete=models.CASCADE)
-    date = models.DateField(auto_now_add=True)
+    date = models.DateField(default=datetime.date.today)
     activity = models.CharField(max_length=200, help_text="E.g., walking, running, yoga, etc.")
     duration = models.IntegerField(help_text="Duration in minutes")
     notes = models.TextField(blank=True)
 
 class Achievement(models.Model):
+    RECORD_TYPES = (('weight', 'Heaviest weight'), ('one_rep_max', 'Best estimated 1RM'), ('set_volume', 'Best set volume'))
+
     profile = models.ForeignKey(Profile, on_delete=models.CASCADE)
     title = models.CharField(max_length=150)
     description = models.TextField(blank=True)
-    date_achieved = models.DateField(auto_now_add=True)
+    date_achieved = models.DateField(default=datetime.date.today)
+    exercise = models.ForeignKey(Exercise, on_delete=models.CASCADE, null=True, blank=True)
+    record_type = models.CharField(max_length=20, choices=RECORD_TYPES, blank=True)
 
-class NutritionTracking(models.Model):
+class PersonalBest(models.Model):
     profile = models.ForeignKey(Profile, on_delete=models.CASCADE)
-    date = models.DateField(auto_now_add=True)
+    exercise = models.ForeignKey(Exercise, on_delete=models.CASCADE)
+    weight = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    one_rep_max = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    set_volume = models.DecimalField(max_digits=10, decimal_places=2, default=0, help_text="Repetitions x weight for a single set.")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['profile', 'exercise'], name='unique_personal_best'),
+        ]
+
+class NutritionTracking(AtomicSaveModel):
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE)
+    date = models.DateField(default=datetime.date.today)
     food_item = models.CharField(max_length=200)
     quantity = models.DecimalField(max_digits=5, decimal_places=2, help_text="E.g., grams, ounces, cups, etc.")
     calories = models.IntegerField(help_text="Calories contained in the food item.")
     notes = models.TextField(blank=True)
 
+class ImportCheckpoint(models.Model):
+    # Rows of a history import already committed; advanced in the same transaction as each batch
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE)
+    source = models.CharField(max_length=255)
+    rows_done = models.PositiveIntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['profile', 'source'], name='unique_import_checkpoint'),
+        ]
+
+class DailyRollup(models.Model):
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE)
+    date = models.DateField()
+    exercise_volume = models.FloatField(default=0, help_text="Sum of sets x repetitions x weight.")
+    calories = models.IntegerField(default=0)
+    active_minutes = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['profile', 'date'], name='unique_daily_rollup'),
+        ]
+        ordering = ['date']
+
 
 @receiver(post_save, sender=User)
 def create_profile(sender, instance, created, **kwargs):
@@ -94,4 +283,7 @@ def create_profile(sender, instance, created, **kwargs):
 
 @receiver(post_save, sender=User)
 def save_profile(sender, instance, **kwargs):
-    instance.profile.save()
\ No newline at end of file
+    # Only a profile already loaded onto this user can hold unsaved changes, and saving it writes just
+    # those, so the last_login update on every login no longer rewrites the profile row
+    if User.profile.is_cached(instance):
+        instance.profile.save()
\ No newline at end of file
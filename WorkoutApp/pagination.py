@@ -0,0 +1,119 @@
+from django.core import signing
+from django.core.exceptions import BadRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+DEFAULT_PAGE_SIZE = 25
+MAX_PAGE_SIZE = 100
+
+
+class KeysetPage:
+    def __init__(self, object_list, page_size, next_cursor, next_query):
+        self.object_list = object_list
+        self.page_size = page_size
+        self.next_cursor = next_cursor
+        self.next_query = next_query
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+class CursorSerializer:
+    def dumps(self, obj):
+        return DjangoJSONEncoder(separators=(',', ':')).encode(obj).encode('latin-1')
+
+    def loads(self, data):
+        return signing.JSONSerializer().loads(data)
+
+
+def cursor_salt(queryset, ordering):
+    # Tie tokens to the model and ordering so a cursor from one listing is rejected by another
+    return 'keyset:%s:%s' % (queryset.model._meta.label_lower, ','.join(ordering))
+
+
+def encode_cursor(queryset, ordering, obj):
+    values = [getattr(obj, field.lstrip('-')) for field in ordering]
+    return signing.dumps(values, salt=cursor_salt(queryset, ordering), compress=True, serializer=CursorSerializer)
+
+
+def decode_cursor(queryset, ordering, token):
+    try:
+        values = signing.loads(token, salt=cursor_salt(queryset, ordering), serializer=CursorSerializer)
+    except signing.BadSignature:
+        raise BadRequest('Invalid page cursor.')
+    if not isinstance(values, list) or len(values) != len(ordering):
+        raise BadRequest('Invalid page cursor.')
+    opts = queryset.model._meta
+    return [opts.get_field(field.lstrip('-')).to_python(value) for field, value in zip(ordering, values)]
+
+
+def rows_after(ordering, values):
+    # (a, b) > (x, y) expanded as a > x OR (a = x AND b > y), honouring each field's direction
+    condition = Q()
+    for i, field in enumerate(ordering):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        step = Q(**{'%s__%s' % (name, lookup): values[i]})
+        for previous, value in zip(ordering[:i], values[:i]):
+            step &= Q(**{previous.lstrip('-'): value})
+        condition |= step
+    return condition
+
+
+def page_size_from(request, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    try:
+        size = int(request.GET.get('page_size', default))
+    except ValueError:
+        raise BadRequest('page_size must be an integer.')
+    return max(1, min(size, maximum))
+
+
+def page_queryset(request, queryset, ordering, default_size=DEFAULT_PAGE_SIZE, max_size=MAX_PAGE_SIZE):
+    # ``ordering`` must end in a unique, non-null field (normally id) so every row has exactly one position
+    page_size = page_size_from(request, default_size, max_size)
+    queryset = queryset.order_by(*ordering)
+
+    token = request.GET.get('cursor')
+    if token:
+        queryset = queryset.filter(rows_after(ordering, decode_cursor(queryset, ordering, token)))
+    return queryset, page_size
+
+
+def build_page(request, queryset, ordering, rows, page_size):
+    # ``rows`` holds up to page_size + 1 objects; the extra one only tells us another page exists
+    next_cursor = next_query = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(queryset, ordering, rows[-1])
+        params = request.GET.copy()
+        params['cursor'] = next_cursor
+        next_query = params.urlencode()
+    return KeysetPage(rows, page_size, next_cursor, next_query)
+
+
+def keyset_paginate(request, queryset, ordering, default_size=DEFAULT_PAGE_SIZE, max_size=MAX_PAGE_SIZE):
+    queryset, page_size = page_queryset(request, queryset, ordering, default_size, max_size)
+    return build_page(request, queryset, ordering, list(queryset[:page_size + 1]), page_size)
+
+
+async def akeyset_paginate(request, queryset, ordering, default_size=DEFAULT_PAGE_SIZE, max_size=MAX_PAGE_SIZE):
+    queryset, page_size = page_queryset(request, queryset, ordering, default_size, max_size)
+    return build_page(request, queryset, ordering, [obj async for obj in queryset[:page_size + 1]], page_size)
+
+
+class KeysetPaginationMixin:
+    # For ListViews: replaces OFFSET pagination with a ``cursor`` query parameter
+    keyset_ordering = ('-id',)
+    page_size = DEFAULT_PAGE_SIZE
+    max_page_size = MAX_PAGE_SIZE
+
+    def get_context_data(self, **kwargs):
+        page = keyset_paginate(self.request, self.object_list, self.keyset_ordering, self.page_size, self.max_page_size)
+        kwargs['object_list'] = page.object_list
+        kwargs['page'] = page
+        # The page is a plain list, so name it from the queryset the way ListView would
+        context_object_name = self.get_context_object_name(self.object_list)
+        if context_object_name is not None:
+            kwargs[context_object_name] = page.object_list
+        return super().get_context_data(**kwargs)
@@ -0,0 +1,91 @@
+import datetime
+
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from .models import TemplateExercise, Workout, WorkoutExercise, WorkoutTemplate
+
+# Templates are cloned with a fixed number of queries however long the plan is: one read of the
+# template's steps, the Workout insert and a single bulk insert of the through rows. Scheduling a
+# program for many profiles does the same per batch of workouts instead of per workout.
+
+STEP_FIELDS = ('exercise_id', 'position', 'target_sets', 'target_repetitions', 'target_weight')
+DEFAULT_BATCH_SIZE = 500
+
+
+def template_steps(template_id):
+    return [dict(zip(STEP_FIELDS, row)) for row in TemplateExercise.objects.filter(template_id=template_id).order_by('position', 'id').values_list(*STEP_FIELDS)]
+
+
+def save_as_template(workout, profile=None, public=False):
+    steps = WorkoutExercise.objects.filter(workout=workout).order_by('position', 'id').values_list(*STEP_FIELDS)
+    with transaction.atomic():
+        template = WorkoutTemplate.objects.create(
+            profile=profile or workout.profile, name=workout.name, duration=workout.duration,
+            description=workout.description, public=public,
+        )
+        TemplateExercise.objects.bulk_create([TemplateExercise(template=template, **dict(zip(STEP_FIELDS, step))) for step in steps])
+    return template
+
+
+def clone_template(template, profile, date=None):
+    steps = template_steps(template.id)
+    with transaction.atomic():
+        workout = Workout.objects.create(
+            profile=profile, name=template.name, duration=template.duration,
+            description=template.description, date=date or timezone.localdate(),
+        )
+        # A new workout has nothing cached yet, so the missing m2m_changed for these rows costs nothing
+        WorkoutExercise.objects.bulk_create([WorkoutExercise(workout=workout, **step) for step in steps])
+    return workout
+
+
+def program_dates(start, weeks, weekdays=None):
+    # Every listed weekday (Monday is 0) in the `weeks` weeks from `start`, defaulting to start's own weekday
+    weekdays = sorted(set(weekdays)) if weekdays else [start.weekday()]
+    end = start + datetime.timedelta(weeks=weeks)
+    dates = []
+    for week in range(weeks + 1):
+        monday = start - datetime.timedelta(days=start.weekday()) + datetime.timedelta(weeks=week)
+        dates.extend(day for day in (monday + datetime.timedelta(days=weekday) for weekday in weekdays) if start <= day < end)
+    return dates
+
+
+def schedule_program(template, profile_ids, start, weeks, weekdays=None, batch_size=DEFAULT_BATCH_SIZE):
+    # Materializes the template as one Workout per profile per date. Dates a profile already has this
+    # program on are skipped, so a rerun, or a widened program, only adds what is missing.
+    steps = template_steps(template.id)
+    dates = program_dates(start, weeks, weekdays)
+    if not dates:
+        return 0
+    profile_ids = list(profile_ids)
+    per_batch = max(1, batch_size // len(dates))
+    can_return_ids = connections[router.db_for_write(Workout)].features.can_return_rows_from_bulk_insert
+
+    created = 0
+    for offset in range(0, len(profile_ids), per_batch):
+        batch = profile_ids[offset:offset + per_batch]
+        with transaction.atomic():
+            existing = set(Workout.objects.filter(
+                profile_id__in=batch, name=template.name, date__gte=dates[0], date__lte=dates[-1],
+            ).values_list('profile_id', 'date'))
+            workouts = [
+                Workout(profile_id=profile_id, name=template.name, duration=template.duration, description=template.description, date=date)
+                for profile_id in batch for date in dates if (profile_id, date) not in existing
+            ]
+            Workout.objects.bulk_create(workouts, batch_size=batch_size)
+            if workouts and not can_return_ids:
+                # Backends without RETURNING leave the new primary keys unset, so read them back
+                ids = {
+                    (profile_id, date): pk for pk, profile_id, date in Workout.objects.filter(
+                        profile_id__in=batch, name=template.name, date__gte=dates[0], date__lte=dates[-1],
+                    ).values_list('id', 'profile_id', 'date')
+                }
+                for workout in workouts:
+                    workout.pk = ids[(workout.profile_id, workout.date)]
+            WorkoutExercise.objects.bulk_create(
+                [WorkoutExercise(workout_id=workout.pk, **step) for workout in workouts for step in steps],
+                batch_size=batch_size,
+            )
+        created += len(workouts)
+    return created
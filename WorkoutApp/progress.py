@@ -0,0 +1,42 @@
+from django.db import transaction
+
+from workout_app.sqlite_backend.retry import retry_on_locked
+
+from .caching import invalidate_progress
+from .models import ExerciseProgress
+from .records import record_personal_bests, record_personal_bests_bulk
+from .rollups import add_to_rollups
+
+
+@retry_on_locked
+def log_exercise(progress):
+    # Insert one new entry together with any personal best it sets; returns the achievements.
+    # force_insert, so a retry after a rollback inserts again instead of trusting the instance's saved state.
+    with transaction.atomic():
+        progress.save(force_insert=True)
+        return record_personal_bests(progress)
+
+
+@retry_on_locked
+def log_workout(workout, profile, entries, exercises):
+    # Insert every entry of a workout in one transaction and mark it completed.
+    # ``entries`` are cleaned ExerciseLogForm dicts and ``exercises`` maps id -> Exercise.
+    progresses = [
+        ExerciseProgress(
+            profile=profile,
+            workout=workout,
+            exercise=exercises[entry['exercise']],
+            repetitions=entry['repetitions'],
+            sets=entry['sets'],
+            weight=entry['weight'],
+        )
+        for entry in entries
+    ]
+    with transaction.atomic():
+        ExerciseProgress.objects.bulk_create(progresses)
+        add_to_rollups(progresses)
+        invalidate_progress([profile.id])
+        achievements = record_personal_bests_bulk(progresses)
+        workout.completed = True
+        workout.save(update_fields=['completed'])
+    return progresses, achievements
@@ -0,0 +1,128 @@
+from decimal import Decimal
+
+from django.db import transaction
+
+from .models import Achievement, ExerciseProgress, PersonalBest
+
+RECORD_LABELS = dict(Achievement.RECORD_TYPES)
+CENTS = Decimal('0.01')
+
+
+def set_metrics(repetitions, weight):
+    # Heaviest weight, Epley estimated 1RM and single-set volume for one logged entry
+    weight = Decimal(weight or 0)
+    repetitions = repetitions or 0
+    if weight <= 0 or repetitions <= 0:
+        return None
+    if repetitions == 1:
+        one_rep_max = weight
+    else:
+        one_rep_max = weight * (1 + Decimal(repetitions) / 30)
+    return {
+        'weight': weight.quantize(CENTS),
+        'one_rep_max': one_rep_max.quantize(CENTS),
+        'set_volume': (weight * repetitions).quantize(CENTS),
+    }
+
+
+def beat_bests(best, metrics, exercise, date):
+    # Raise the bests on ``best`` in place and return unsaved Achievements for each record that was beaten
+    achievements = []
+    for record_type, value in metrics.items():
+        previous = getattr(best, record_type)
+        if value <= previous:
+            continue
+        setattr(best, record_type, value)
+        if previous > 0:
+            achievements.append(Achievement(
+                profile_id=best.profile_id,
+                exercise=exercise,
+                record_type=record_type,
+                date_achieved=date,
+                title='New %s: %s' % (RECORD_LABELS[record_type].lower(), exercise.name),
+                description='%s lb (previous best %s lb)' % (value, previous),
+            ))
+    return achievements
+
+
+def record_personal_bests(progress):
+    return record_personal_bests_bulk([progress])
+
+
+def record_personal_bests_bulk(progresses):
+    # Check a batch of new entries from one profile against its bests with one read and at most three
+    # writes, plus an insert and a second read the first time an exercise is logged
+    progresses = [progress for progress in progresses if set_metrics(progress.repetitions, progress.weight)]
+    if not progresses:
+        return []
+    profile_id = progresses[0].profile_id
+    exercise_ids = {progress.exercise_id for progress in progresses}
+
+    def locked_bests(exercise_ids):
+        return {
+            best.exercise_id: best
+            for best in PersonalBest.objects.select_for_update().filter(profile_id=profile_id, exercise_id__in=exercise_ids)
+        }
+
+    with transaction.atomic():
+        bests = locked_bests(exercise_ids)
+        missing = exercise_ids - set(bests)
+        if missing:
+            # A zeroed row is the baseline the first entry sets. Two first logs can race to insert it, so
+            # conflicts are ignored and both continue from whichever row was stored.
+            PersonalBest.objects.bulk_create(
+                [PersonalBest(profile_id=profile_id, exercise_id=exercise_id) for exercise_id in missing], ignore_conflicts=True,
+            )
+            bests.update(locked_bests(missing))
+        changed = set()
+        achievements = []
+        for progress in progresses:
+            metrics = set_metrics(progress.repetitions, progress.weight)
+            best = bests[progress.exercise_id]
+            before = [getattr(best, field) for field in metrics]
+            # Nothing beats a zero, so the first entry only sets the baseline
+            achievements.extend(beat_bests(best, metrics, progress.exercise, progress.date))
+            if [getattr(best, field) for field in metrics] != before:
+                changed.add(best)
+
+        if changed:
+            PersonalBest.objects.bulk_update(changed, ['weight', 'one_rep_max', 'set_volume'])
+        Achievement.objects.bulk_create(achievements)
+    return achievements
+
+
+def replay_personal_bests(profile_id, chunk_size=2000):
+    # Rebuild one profile's bests by streaming its history per exercise in date order.
+    # Only the current exercise's best and one chunk of pending rows are held in memory.
+    with transaction.atomic():
+        PersonalBest.objects.filter(profile_id=profile_id).delete()
+        Achievement.objects.filter(profile_id=profile_id).exclude(record_type='').delete()
+
+        history = (
+            ExerciseProgress.objects.filter(profile_id=profile_id)
+            .select_related('exercise')
+            .order_by('exercise_id', 'date', 'id')
+            .iterator(chunk_size=chunk_size)
+        )
+        bests = []
+        achievements = []
+        best = None
+        for progress in history:
+            metrics = set_metrics(progress.repetitions, progress.weight)
+            if metrics is None:
+                continue
+            if best is None or best.exercise_id != progress.exercise_id:
+                best = PersonalBest(profile_id=profile_id, exercise_id=progress.exercise_id)
+                bests.append(best)
+            achievements.extend(beat_bests(best, metrics, progress.exercise, progress.date))
+
+            # The open best is still changing, so only flush the finished ones
+            if len(bests) > chunk_size:
+                PersonalBest.objects.bulk_create(bests[:-1])
+                bests = bests[-1:]
+            if len(achievements) >= chunk_size:
+                Achievement.objects.bulk_create(achievements)
+                achievements = []
+
+        PersonalBest.objects.bulk_create(bests)
+        Achievement.objects.bulk_create(achievements)
@@ -0,0 +1,132 @@
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.db.models import F, FloatField, QuerySet, Sum
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import ChangeTrackingModel, DailyRollup, DailyTracking, ExerciseProgress, NutritionTracking, Profile
+
+# Which rollup column each source model feeds
+ROLLUP_FIELDS = {
+    ExerciseProgress: 'exercise_volume',
+    NutritionTracking: 'calories',
+    DailyTracking: 'active_minutes',
+}
+
+
+def exercise_volume(sets, repetitions, weight):
+    return float(sets or 0) * float(repetitions or 0) * float(weight or 0)
+
+
+def contribution(instance):
+    if isinstance(instance, ExerciseProgress):
+        return exercise_volume(instance.sets, instance.repetitions, instance.weight)
+    if isinstance(instance, NutritionTracking):
+        return instance.calories or 0
+    return instance.duration or 0
+
+
+def apply_delta(profile_id, date, field, delta):
+    if not delta:
+        return
+    rollups = DailyRollup.objects.filter(profile_id=profile_id, date=date)
+    if rollups.update(**{field: F(field) + delta}):
+        return
+    try:
+        with transaction.atomic():
+            DailyRollup.objects.create(profile_id=profile_id, date=date, **{field: delta})
+    except IntegrityError:
+        # Another writer created the row between our update and insert
+        rollups.update(**{field: F(field) + delta})
+
+
+def add_to_rollups(instances):
+    # bulk_create skips the signals below, so bulk writers hand their new rows here instead
+    deltas = {}
+    for instance in instances:
+        key = (instance.profile_id, instance.date, ROLLUP_FIELDS[type(instance)])
+        deltas[key] = deltas.get(key, 0) + contribution(instance)
+    for (profile_id, date, field), delta in deltas.items():
+        apply_delta(profile_id, date, field, delta)
+
+
+@receiver(pre_save, sender=ExerciseProgress)
+@receiver(pre_save, sender=NutritionTracking)
+@receiver(pre_save, sender=DailyTracking)
+def remember_previous_contribution(sender, instance, **kwargs):
+    instance._rollup_previous = None
+    if instance._state.adding or instance.pk is None:
+        return
+    # Change-tracked rows remember what they were loaded with, which spares a query
+    previous = instance.as_loaded() if isinstance(instance, ChangeTrackingModel) else None
+    if previous is None:
+        previous = sender.objects.filter(pk=instance.pk).first()
+    if previous is not None:
+        instance._rollup_previous = (previous.profile_id, previous.date, contribution(previous))
+
+
+@receiver(post_save, sender=ExerciseProgress)
+@receiver(post_save, sender=NutritionTracking)
+@receiver(post_save, sender=DailyTracking)
+def update_rollup_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    field = ROLLUP_FIELDS[sender]
+    previous = getattr(instance, '_rollup_previous', None)
+    if previous is not None:
+        apply_delta(previous[0], previous[1], field, -previous[2])
+    apply_delta(instance.profile_id, instance.date, field, contribution(instance))
+
+
+@receiver(post_delete, sender=ExerciseProgress)
+@receiver(post_delete, sender=NutritionTracking)
+@receiver(post_delete, sender=DailyTracking)
+def update_rollup_on_delete(sender, instance, origin=None, **kwargs):
+    # When the whole profile goes away its rollups are cascaded too, so there is nothing to adjust.
+    # A queryset delete (the admin's, say) is the origin of its cascade too.
+    if issubclass(origin.model if isinstance(origin, QuerySet) else type(origin), (Profile, User)):
+        return
+    apply_delta(instance.profile_id, instance.date, ROLLUP_FIELDS[sender], -contribution(instance))
+
+
+def daily_totals(profile_ids, since=None):
+    volume = F('sets') * F('repetitions') * Coalesce(F('weight'), 0, output_field=FloatField())
+    sources = [
+        (ExerciseProgress, 'exercise_volume', Sum(volume, output_field=FloatField())),
+        (NutritionTracking, 'calories', Sum('calories')),
+        (DailyTracking, 'active_minutes', Sum('duration')),
+    ]
+    totals = {}
+    for model, field, aggregate in sources:
+        queryset = model.objects.filter(profile_id__in=profile_ids)
+        if since:
+            queryset = queryset.filter(date__gte=since)
+        for row in queryset.values('profile_id', 'date').annotate(total=aggregate).order_by():
+            key = (row['profile_id'], row['date'])
+            totals.setdefault(key, {})[field] = row['total'] or 0
+    return totals
+
+
+def rebuild_rollups(profile_ids, since=None):
+    # Recompute the rollups for a batch of profiles from the raw tables; GROUP BY keeps this O(days) in Python
+    with transaction.atomic():
+        stale = DailyRollup.objects.filter(profile_id__in=profile_ids)
+        if since:
+            stale = stale.filter(date__gte=since)
+        stale.delete()
+        rollups = [
+            DailyRollup(profile_id=profile_id, date=date, **fields)
+            for (profile_id, date), fields in daily_totals(profile_ids, since).items()
+        ]
+        DailyRollup.objects.bulk_create(rollups)
+    return len(rollups)
+
+
+def rollup_summary(profile, start=None, end=None):
+    rollups = DailyRollup.objects.filter(profile=profile)
+    if start:
+        rollups = rollups.filter(date__gte=start)
+    if end:
+        rollups = rollups.filter(date__lte=end)
+    return rollups
@@ -0,0 +1,188 @@
+import bisect
+import math
+import re
+from collections import defaultdict
+
+from django.db import connection
+from django.db.models import Count
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Exercise, ExerciseProgress, ExerciseType
+
+FTS_TABLE = 'WorkoutApp_exercise_fts'
+# How much one extra log of an exercise is worth relative to text relevance
+USAGE_WEIGHT = 1.0
+# Relevance weight of a match in name, type name and description
+FIELD_WEIGHTS = (3.0, 2.0, 1.0)
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or '').lower())
+
+
+def exercise_documents(exercise_ids=None):
+    exercises = Exercise.objects.values_list('id', 'name', 'type__name', 'description').order_by('id')
+    if exercise_ids is not None:
+        exercises = exercises.filter(id__in=exercise_ids)
+    return exercises.iterator(chunk_size=2000)
+
+
+class FtsIndex:
+    # SQLite FTS5 table keyed by exercise id (created by migration 0006), ranked with bm25()
+
+    def search(self, query, limit):
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        match = ' '.join('"%s"*' % token for token in tokens)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT rowid, bm25({table}, %s, %s, %s) FROM {table} WHERE {table} MATCH %s ORDER BY 2 LIMIT %s'.format(table=FTS_TABLE),
+                [*FIELD_WEIGHTS, match, limit],
+            )
+            # bm25() is lower-is-better, flip it so every backend returns higher-is-better scores
+            return [(exercise_id, -rank) for exercise_id, rank in cursor.fetchall()]
+
+    def update(self, exercise_ids):
+        with connection.cursor() as cursor:
+            cursor.executemany('DELETE FROM {table} WHERE rowid = %s'.format(table=FTS_TABLE), [[pk] for pk in exercise_ids])
+            cursor.executemany(
+                'INSERT INTO {table} (rowid, name, type_name, description) VALUES (%s, %s, %s, %s)'.format(table=FTS_TABLE),
+                [list(document) for document in exercise_documents(exercise_ids)],
+            )
+
+    def remove(self, exercise_id):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM {table} WHERE rowid = %s'.format(table=FTS_TABLE), [exercise_id])
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM {table}'.format(table=FTS_TABLE))
+        self.update([document[0] for document in exercise_documents()])
+
+
+class MemoryIndex:
+    # Inverted index for databases without FTS5: token -> {exercise id: weighted hits}, plus a
+    # sorted vocabulary so prefix lookups are a bisect instead of a scan
+
+    def __init__(self):
+        self.postings = None
+        self.vocabulary = []
+        self.documents = {}
+
+    def ensure_built(self):
+        if self.postings is None:
+            self.rebuild()
+
+    def rebuild(self):
+        self.postings = defaultdict(dict)
+        self.documents = {}
+        for document in exercise_documents():
+            self.add(document)
+        self.vocabulary = sorted(self.postings)
+
+    def add(self, document):
+        exercise_id, fields = document[0], document[1:]
+        tokens = set()
+        for weight, text in zip(FIELD_WEIGHTS, fields):
+            for token in tokenize(text):
+                postings = self.postings[token]
+                postings[exercise_id] = postings.get(exercise_id, 0) + weight
+                tokens.add(token)
+        self.documents[exercise_id] = tokens
+
+    def remove(self, exercise_id):
+        if self.postings is None:
+            return
+        for token in self.documents.pop(exercise_id, ()):
+            postings = self.postings[token]
+            postings.pop(exercise_id, None)
+            if not postings:
+                del self.postings[token]
+        self.vocabulary = sorted(self.postings)
+
+    def update(self, exercise_ids):
+        if self.postings is None:
+            return
+        for exercise_id in exercise_ids:
+            self.remove(exercise_id)
+        for document in exercise_documents(exercise_ids):
+            self.add(document)
+        self.vocabulary = sorted(self.postings)
+
+    def prefix_matches(self, prefix):
+        start = bisect.bisect_left(self.vocabulary, prefix)
+        for token in self.vocabulary[start:]:
+            if not token.startswith(prefix):
+                break
+            yield token
+
+    def search(self, query, limit):
+        self.ensure_built()
+        scores = None
+        for prefix in tokenize(query):
+            hits = {}
+            for token in self.prefix_matches(prefix):
+                for exercise_id, weight in self.postings[token].items():
+                    hits[exercise_id] = hits.get(exercise_id, 0) + weight
+            # Every query term has to match, as with FTS5
+            if scores is None:
+                scores = hits
+            else:
+                scores = {pk: score + hits[pk] for pk, score in scores.items() if pk in hits}
+        if not scores:
+            return []
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+
+
+memory_index = MemoryIndex()
+_fts_available = {}
+
+
+def get_index():
+    alias = connection.alias
+    if alias not in _fts_available:
+        available = connection.vendor == 'sqlite' and FTS_TABLE in connection.introspection.table_names()
+        _fts_available[alias] = available
+    return FtsIndex() if _fts_available[alias] else memory_index
+
+
+def usage_counts(profile, exercise_ids):
+    if profile is None or not exercise_ids:
+        return {}
+    rows = (
+        ExerciseProgress.objects.filter(profile=profile, exercise_id__in=exercise_ids)
+        .values('exercise_id').annotate(uses=Count('id')).order_by()
+    )
+    return {row['exercise_id']: row['uses'] for row in rows}
+
+
+def search_exercises(query, profile=None, limit=10):
+    # Rank the best text matches, then re-rank them by how often this profile logs each one
+    candidates = get_index().search(query, limit * 5)
+    uses = usage_counts(profile, [exercise_id for exercise_id, score in candidates])
+    ranked = sorted(
+        candidates,
+        key=lambda item: (-(item[1] + USAGE_WEIGHT * math.log1p(uses.get(item[0], 0))), item[0]),
+    )[:limit]
+    exercises = Exercise.objects.select_related('type').in_bulk([exercise_id for exercise_id, score in ranked])
+    return [exercises[exercise_id] for exercise_id, score in ranked if exercise_id in exercises]
+
+
+@receiver(post_save, sender=Exercise)
+def index_exercise(sender, instance, raw=False, **kwargs):
+    if not raw:
+        get_index().update([instance.pk])
+
+
+@receiver(post_delete, sender=Exercise)
+def unindex_exercise(sender, instance, **kwargs):
+    get_index().remove(instance.pk)
+
+
+@receiver(post_save, sender=ExerciseType)
+def reindex_exercise_type(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        get_index().update(list(instance.exercise_set.values_list('id', flat=True)))
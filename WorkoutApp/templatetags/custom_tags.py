@@ -3,5 +3,6 @@ from django import template
 register = template.Library()
 
 @register.filter(name='get_progress')
-def get_progress(queryset, exercise):
-    return queryset.filter(exercise=exercise).first()
+def get_progress(progress_map, exercise):
+    # progress_map is built by the view as {exercise_id: ExerciseProgress}, so this never hits the database
+    return progress_map.get(exercise.id)
@@ -1,5 +1,36 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import csv
+import io
+import gzip
+import json
+import threading
+from decimal import Decimal
+import time
+from django.contrib.auth import authenticate
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import OperationalError, connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.core.management import CommandError, call_command
+from unittest import mock, skipUnless
+from asgiref.sync import sync_to_async
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from workout_app.sqlite_backend.retry import retry_on_locked
+from workout_app import hashing, profiling, querylog, routers
+from django.test import RequestFactory
+from django.http import HttpResponse
+from . import caching, search, trends, usercache
+from .trends import compact_history, compute_trend, weight_trend
+from .analytics import lttb
+from .guided import GuidedSession, append_to_plan, plan_steps
+from .programs import clone_template, program_dates, save_as_template, schedule_program
+from django.db.models.functions import Lower
+from django.db.models import Count, Value
+from .models import ProfileHistory, WorkoutProgress, Profile, Exercise, ExerciseType, Workout, ExerciseProgress, DailyRollup, DailyTracking, NutritionTracking, Achievement, PersonalBest, WorkoutExercise, WorkoutTemplate, TemplateExercise
 
 def test_registration(self):
     data = {
@@ -11,3 +42,1661 @@ def test_registration(self):
 
     self.assertEqual(response.status_code, 302)
     self.assertEqual(response['Location'], reverse('home'))
+
+
+# What deployments with a shared cache (WORKOUT_CACHE_BACKEND=file) run; the query counts below assume it
+shared_cache = override_settings(SESSION_ENGINE='django.contrib.sessions.backends.cached_db', SHARED_CACHE=True)
+
+
+class ClearCachesMixin:
+    # Cache backends outlive the per-test transaction, and test row ids get reused
+    def setUp(self):
+        super().setUp()
+        for cache in caches.all():
+            cache.clear()
+
+
+class WorkoutDetailViewTests(ClearCachesMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='lifter', password='testpassword')
+        self.profile = self.user.profile
+        self.type = ExerciseType.objects.create(name='Upper Body', description='')
+        self.client.force_login(self.user)
+
+    def make_workout(self, exercise_count):
+        workout = Workout.objects.create(profile=self.profile, name='Push day', duration=60)
+        for i in range(exercise_count):
+            exercise = Exercise.objects.create(name='Exercise %d' % i, type=self.type, description='')
+            workout.exercises.add(exercise)
+            ExerciseProgress.objects.create(profile=self.profile, workout=workout, exercise=exercise, repetitions=10, sets=3, weight=50)
+        return workout
+
+    def count_queries(self, workout):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('workout_detail', args=[workout.id]))
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_exercises(self):
+        small = self.make_workout(2)
+        large = self.make_workout(12)
+        self.client.get(reverse('home'))
+        self.assertEqual(self.count_queries(small), self.count_queries(large))
+
+    def test_shows_latest_progress_per_exercise(self):
+        workout = self.make_workout(1)
+        exercise = workout.exercises.get()
+        ExerciseProgress.objects.create(profile=self.profile, workout=workout, exercise=exercise, repetitions=8, sets=5, weight=60)
+        untracked = Exercise.objects.create(name='Untracked', type=self.type, description='')
+        workout.exercises.add(untracked)
+
+        response = self.client.get(reverse('workout_detail', args=[workout.id]))
+        self.assertEqual(response.context['exercise_progresses'][exercise.id].repetitions, 8)
+        self.assertContains(response, 'No recorded progress.')
+
+
+@shared_cache
+class ProgressDataTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='lifter', password='testpassword')
+        self.profile = self.user.profile
+        exercise_type = ExerciseType.objects.create(name='Lower Body', description='')
+        self.squat = Exercise.objects.create(name='Squat', type=exercise_type, description='')
+        self.lunge = Exercise.objects.create(name='Lunge', type=exercise_type, description='')
+        workout = Workout.objects.create(profile=self.profile, name='Leg day', duration=45)
+        days = [datetime.date(2023, 8, 1), datetime.date(2023, 8, 1), datetime.date(2023, 8, 9)]
+        for day, exercise in zip(days, [self.squat, self.lunge, self.squat]):
+            progress = ExerciseProgress.objects.create(profile=self.profile, workout=workout, exercise=exercise, repetitions=5, sets=3, weight=100)
+            ExerciseProgress.objects.filter(pk=progress.pk).update(date=day)
+        self.client.force_login(self.user)
+
+    def test_daily_buckets(self):
+        response = self.client.get(reverse('progress_data'))
+        data = response.json()
+        self.assertEqual(data['labels'], ['2023-08-01', '2023-08-09'])
+        self.assertEqual(data['count'], [2, 1])
+        self.assertEqual(data['sets'], [6, 3])
+        self.assertEqual(data['reps'], [10, 5])
+        self.assertEqual(data['volume'], [3000, 1500])
+
+    def test_monthly_buckets_with_filters(self):
+        response = self.client.get(reverse('progress_data'), {'period': 'month', 'exercise': self.squat.id, 'start': '2023-08-02'})
+        data = response.json()
+        self.assertEqual(data['labels'], ['2023-08-01'])
+        self.assertEqual(data['count'], [1])
+
+    def test_invalid_period(self):
+        response = self.client.get(reverse('progress_data'), {'period': 'year'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_query_count_is_constant(self):
+        # The first request caches the session and profile; after that only the user row and the series are read
+        self.client.get(reverse('progress_data'), {'period': 'week'})
+        with self.assertNumQueries(2):
+            self.client.get(reverse('progress_data'), {'period': 'week'})
+
+
+@shared_cache
+class ProgressDownsamplingTests(ClearCachesMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='lifter', password='testpassword')
+        self.profile = self.user.profile
+        exercise_type = ExerciseType.objects.create(name='Lower Body', description='')
+        self.squat = Exercise.objects.create(name='Squat', type=exercise_type, description='')
+        self.workout = Workout.objects.create(profile=self.profile, name='Leg day', duration=45)
+        ExerciseProgress.objects.bulk_create([
+            ExerciseProgress(
+                profile=self.profile, workout=self.workout, exercise=self.squat, repetitions=5, sets=3,
+                weight=300 if day == 17 else 100 + day, date=datetime.date(2023, 1, 1) + datetime.timedelta(days=day),
+            )
+            for day in range(60)
+        ])
+        self.client.force_login(self.user)
+
+    def test_lttb_keeps_the_ends_and_the_spike(self):
+        ys = [0.0] * 100
+        ys[41] = 50.0
+        keep = lttb(list(range(100)), ys, 10)
+        self.assertEqual(len(keep), 10)
+        self.assertEqual((keep[0], keep[-1]), (0, 99))
+        self.assertIn(41, keep)
+        self.assertEqual(lttb([1, 2, 3], [1, 2, 3], 10), [0, 1, 2])
+
+    def test_series_is_cut_to_the_requested_points_and_cached(self):
+        response = self.client.get(reverse('progress_data'), {'points': 12})
+        data = response.json()
+        self.assertEqual((len(data['labels']), len(data['volume']), data['total']), (12, 12, 60))
+        self.assertIn('2023-01-18', data['labels'])
+        self.assertEqual(data['labels'][0], '2023-01-01')
+        # Only the signed-in user's row is read
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(reverse('progress_data'), {'points': 12}).json(), data)
+
+    def test_zoomed_slice(self):
+        data = self.client.get(reverse('progress_data'), {'points': 5, 'start': '2023-02-01', 'end': '2023-02-10'}).json()
+        self.assertEqual(data['total'], 10)
+        self.assertEqual((data['labels'][0], data['labels'][-1]), ('2023-02-01', '2023-02-10'))
+
+    def test_new_progress_invalidates(self):
+        self.client.get(reverse('progress_data'), {'points': 12})
+        with self.captureOnCommitCallbacks(execute=True):
+            ExerciseProgress.objects.create(profile=self.profile, workout=self.workout, exercise=self.squat, repetitions=5, sets=3, weight=100, date=datetime.date(2023, 6, 1))
+        data = self.client.get(reverse('progress_data'), {'points': 12}).json()
+        self.assertEqual((data['total'], data['labels'][-1]), (61, '2023-06-01'))
+
+    async def test_async_view_matches(self):
+        from django.test import AsyncRequestFactory
+        from . import async_views
+        request = AsyncRequestFactory().get('/', {'points': 12})
+        request.user = self.user
+        response = await async_views.progress_data(request)
+        sync_response = await sync_to_async(self.client.get)(reverse('progress_data'), {'points': 12})
+        self.assertEqual(json.loads(response.content), sync_response.json())
+
+    def test_invalid_points(self):
+        for params in ({'points': 2}, {'points': 'many'}, {'points': 10, 'metric': 'calories'}):
+            self.assertEqual(self.client.get(reverse('progress_data'), params).status_code, 400)
+
+
+class DailyRollupTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='lifter', password='testpassword')
+        self.profile = self.user.profile
+        exercise_type = ExerciseType.objects.create(name='Core', description='')
+        self.exercise = Exercise.objects.create(name='Plank', type=exercise_type, description='')
+        self.workout = Workout.objects.create(profile=self.profile, name='Core day', duration=20)
+
+    def rollup(self):
+        return DailyRollup.objects.get(profile=self.profile)
+
+    def test_tracks_inserts_updates_and_deletes(self):
+        progress = ExerciseProgress.objects.create(profile=self.profile, workout=self.workout, exercise=self.exercise, repetitions=10, sets=3, weight=20)
+        NutritionTracking.objects.create(profile=self.profile, food_item='Oats', quantity=1, calories=300)
+        activity = DailyTracking.objects.create(profile=self.profile, activity='Walking', duration=40)
+        rollup = self.rollup()
+        self.assertEqual((rollup.exercise_volume, rollup.calories, rollup.active_minutes), (600, 300, 40))
+
+        progress.sets = 4
+        progress.save()
+        activity.delete()
+        rollup = self.rollup()
+        self.assertEqual((rollup.exercise_volume, rollup.calories, rollup.active_minutes), (800, 300, 0))
+
+    def test_rebuild_command_matches_incremental_rollups(self):
+        ExerciseProgress.objects.create(profile=self.profile, workout=self.workout, exercise=self.exercise, repetitions=5, sets=5, weight=10)
+        NutritionTracking.objects.create(profile=self.profile, food_item='Rice', quantity=2, calories=450)
+        expected = self.rollup()
+        DailyRollup.objects.all().delete()
+
+        call_command('rebuild_rollups', '--batch-size', '1', stdout=io.StringIO())
+        rebuilt = self.rollup()
+        self.assertEqual((rebuilt.exercise_volume, rebuilt.calories), (expected.exercise_volume, expected.calories))
+
+    def test_deleting_user_removes_rollups(self):
+        ExerciseProgress.objects.create(profile=self.profile, workout=self.workout, exercise=self.exercise, repetitions=5, sets=5, weight=10)
+        self.user.delete()
+        self.assertFalse(DailyRollup.objects.exists())
+
+    def test_deleting_users_in_bulk_removes_rollups(self):
+        ExerciseProgress.objects.create(profile=self.profile, workout=self.workout, exercise=self.exercise, repetitions=5, sets=5, weight=10)
+        User.objects.filter(pk=self.user.pk).delete()
+        self.assertFalse(DailyRollup.objects.exists())
+
+
+class PersonalRecordTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='lifter', password='testpassword')
+        self.profile = self.user.profile
+        exercise_type = ExerciseType.objects.create(name='Upper Body', description='')
+        self.bench = Exercise.objects.create(name='Bench press', type=exercise_type, description='')
+        self.workout = Workout.objects.create(profile=self.profile, name='Push day', duration=60)
+        self.workout.exercises.add(self.bench)
+        self.client.force_login(self.user)
+
+    def log(self, repetitions, weight):
+        url = reverse('exercise_progress_create', args=[self.workout.id, self.bench.id])
+        return self.client.post(url, {'repetitions': repetitions, 'sets': 3, 'weight': weight})
+
+    def test_achievements_only_when_a_best_is_beaten(self):
+        self.log(5, 100)
+        self.assertFalse(Achievement.objects.exists())
+
+        self.log(5, 90)
+        self.assertFalse(Achievement.objects.exists())
+
+        self.log(3, 105)
+        record_types = set(Achievement.objects.values_list('record_type', flat=True))
+        self.assertEqual(record_types, {'weight'})
+
+        self.log(10, 100)
+        record_types = set(Achievement.objects.values_list('record_type', flat=True))
+        self.assertEqual(record_types, {'weight', 'one_rep_max', 'set_volume'})
+
+        best = PersonalBest.objects.get(profile=self.profile, exercise=self.bench)
+        self.assertEqual(best.weight, 105)
+        self.assertEqual(best.set_volume, 1000)
+
+    def test_racing_first_logs_share_one_best(self):
+        bulk_create = PersonalBest.objects.bulk_create
+
+        def racing(objs, **kwargs):
+            # Another request's first log stores its best between this one's read and its insert
+            PersonalBest.objects.create(profile=self.profile, exercise=self.bench, weight=90, one_rep_max=105, set_volume=450)
+            return bulk_create(objs, **kwargs)
+
+        with mock.patch.object(PersonalBest.objects, 'bulk_create', side_effect=racing):
+            response = self.log(5, 100)
+        self.assertEqual(response.status_code, 302)
+        best = PersonalBest.objects.get(profile=self.profile, exercise=self.bench)
+        self.assertEqual((best.weight, best.set_volume), (100, 500))
+        self.assertEqual(set(Achievement.objects.values_list('record_type', flat=True)), {'weight', 'one_rep_max', 'set_volume'})
+
+    def test_backfill_replays_history(self):
+        for repetitions, weight in [(5, 100), (3, 105), (10, 100)]:
+            self.log(repetitions, weight)
+        live = sorted(Achievement.objects.values_list('record_type', 'title'))
+
+        call_command('backfill_personal_records', '--chunk-size', '1', stdout=io.StringIO())
+        self.assertEqual(sorted(Achievement.objects.values_list('record_type', 'title')), live)
+        self.assertEqual(PersonalBest.objects.get(profile=self.profile).weight, 105)
+
+
+class WorkoutLogTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='lifter', password='testpassword')
+        self.profile = self.user.profile
+        exercise_type = ExerciseType.objects.create(name='Full Body', description='')
+        self.workout = Workout.objects.create(profile=self.profile, name='Full body', duration=60)
+        self.exercises = [Exercise.objects.create(name='Exercise %d' % i, type=exercise_type, description='') for i in range(3)]
+        self.workout.exercises.add(*self.exercises)
+        self.client.force_login(self.user)
+
+    def formset_data(self, rows):
+        data = {'form-TOTAL_FORMS': len(rows), 'form-INITIAL_FORMS': len(rows)}
+        for i, (exercise, repetitions, sets, weight) in enumerate(rows):
+            data.update({
+                'form-%d-exercise' % i: exercise.id,
+                'form-%d-repetitions' % i: repetitions,
+                'form-%d-sets' % i: sets,
+                'form-%d-weight' % i: weight,
+            })
+        return data
+
+    def test_formset_logs_every_exercise_and_completes_workout(self):
+        response = self.client.get(reverse('workout_log', args=[self.workout.id]))
+        self.assertEqual(len(response.context['formset'].forms), 3)
+
+        rows = [(exercise, 10, 3, 20) for exercise in self.exercises]
+        response = self.client.post(reverse('workout_log', args=[self.workout.id]), self.formset_data(rows))
+        self.assertRedirects(response, reverse('workout_summary', args=[self.workout.id]))
+        self.assertEqual(ExerciseProgress.objects.filter(workout=self.workout).count(), 3)
+        self.workout.refresh_from_db()
+        self.assertTrue(self.workout.completed)
+        self.assertEqual(DailyRollup.objects.get(profile=self.profile).exercise_volume, 1800)
+
+    def test_invalid_row_logs_nothing(self):
+        other = Exercise.objects.create(name='Not in workout', type=self.exercises[0].type, description='')
+        rows = [(self.exercises[0], 10, 3, 20), (other, 10, 3, 20)]
+        response = self.client.post(reverse('workout_log', args=[self.workout.id]), self.formset_data(rows))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(ExerciseProgress.objects.exists())
+
+    def test_json_query_count_does_not_grow_with_entries(self):
+        def post(count):
+            entries = [{'exercise': self.exercises[i % 3].id, 'repetitions': 5, 'sets': 3, 'weight': 50} for i in range(count)]
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(reverse('workout_log_json', args=[self.workout.id]), json.dumps({'entries': entries}), content_type='application/json')
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(len(response.json()['logged']), count)
+            return len(queries)
+
+        post(3)
+        self.assertEqual(post(3), post(12))
+
+    def test_json_reports_errors(self):
+        response = self.client.post(reverse('workout_log_json', args=[self.workout.id]), json.dumps({'entries': [{'exercise': self.exercises[0].id}]}), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('repetitions', response.json()['errors']['0'])
+
+    def test_weight_the_column_cannot_hold_is_rejected(self):
+        entry = {'exercise': self.exercises[0].id, 'repetitions': 5, 'sets': 3, 'weight': 1500}
+        response = self.client.post(reverse('workout_log_json', args=[self.workout.id]), json.dumps({'entries': [entry]}), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('weight', response.json()['errors']['0'])
+        response = self.client.post(reverse('workout_log', args=[self.workout.id]), self.formset_data([(self.exercises[0], 5, 3, '1000')]))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(ExerciseProgress.objects.exists())
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='lifter', password='testpassword')
+        self.profile = self.user.profile
+        for i in range(5):
+            workout = Workout.objects.create(profile=self.profile, name='Workout %d' % i, duration=30)
+            Workout.objects.filter(pk=workout.pk).update(date=datetime.date(2023, 8, 1 + i % 2))
+        self.client.force_login(self.user)
+
+    def test_walks_every_workout_once_in_order(self):
+        url = reverse('workout_list', args=[self.profile.id])
+        seen = []
+        query = 'page_size=2'
+        while query:
+            response = self.client.get(url + '?' + query)
+            seen.extend(response.context['workout_list'])
+            query = response.context['page'].next_query
+        expected = list(Workout.objects.order_by('-date', '-id'))
+        self.assertEqual(seen, expected)
+
+    def test_page_size_is_capped(self):
+        response = self.client.get(reverse('exercise_list', args=[self.profile.id]), {'page_size': 10000})
+        self.assertEqual(response.context['page'].page_size, 100)
+
+    def test_tampered_cursor_is_rejected(self):
+        response = self.client.get(reverse('workout_list', args=[self.profile.id]), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ApiTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='lifter', password='testpassword')
+        self.profile = self.user.profile
+        self.type = ExerciseType.objects.create(name='Upper Body', description='')
+        self.exercise = Exercise.objects.create(name='Row', type=self.type, description='Pull towards the chest')
+        self.client.force_login(self.user)
+
+    def make_workouts(self, count):
+        for i in range(count):
+            workout = Workout.objects.create(profile=self.profile, name='Workout %d' % i, duration=30)
+            workout.exercises.add(self.exercise)
+            ExerciseProgress.objects.create(profile=self.profile, workout=workout, exercise=self.exercise, repetitions=8, sets=3, weight=40)
+
+    def test_shared_exercises_cannot_be_changed_or_deleted(self):
+        self.make_workouts(1)
+        url = reverse('api_v1_exercises_detail', args=[self.exercise.id])
+        self.assertEqual(self.client.get(url).json()['name'], 'Row')
+        response = self.client.patch(url, json.dumps({'name': 'Renamed'}), content_type='application/json')
+        self.assertEqual(response.status_code, 405)
+        self.assertEqual(self.client.delete(url).status_code, 405)
+        self.exercise.refresh_from_db()
+        self.assertEqual(self.exercise.name, 'Row')
+        self.assertEqual(ExerciseProgress.objects.filter(exercise=self.exercise).count(), 1)
+
+    def test_sparse_fields_and_embeds(self):
+        self.make_workouts(1)
+        response = self.client.get(reverse('api_v1_workouts_list'), {'fields': 'name', 'embed': 'exercises'})
+        self.assertEqual(response.json()['data'][0], {
+            'id': Workout.objects.get().id,
+            'name': 'Workout 0',
+            'exercises': [{'id': self.exercise.id, 'name': 'Row', 'type': self.type.id, 'description': 'Pull towards the chest'}],
+        })
+
+    def test_unknown_field_is_rejected(self):
+        response = self.client.get(reverse('api_v1_workouts_list'), {'fields': 'password'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_list_query_count_is_bounded(self):
+        def count_queries():
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse('api_v1_progress_list'), {'embed': 'exercise,workout'})
+            self.assertEqual(response.status_code, 200)
+            return len(queries)
+
+        self.make_workouts(2)
+        count_queries()
+        small = count_queries()
+        self.make_workouts(10)
+        self.assertEqual(count_queries(), small)
+
+    def test_cursor_pagination(self):
+        self.make_workouts(3)
+        data = self.client.get(reverse('api_v1_workouts_list'), {'page_size': 2}).json()
+        self.assertEqual(len(data['data']), 2)
+        rest = self.client.get(reverse('api_v1_workouts_list'), {'page_size': 2, 'cursor': data['next']}).json()
+        self.assertEqual(len(rest['data']), 1)
+        self.assertIsNone(rest['next'])
+
+    def test_create_update_and_delete(self):
+        response = self.client.post(reverse('api_v1_workouts_list'), json.dumps({'name': 'Pull day', 'duration': 40}), content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        workout_id = response.json()['id']
+        self.assertEqual(Workout.objects.get(pk=workout_id).profile, self.profile)
+
+        url = reverse('api_v1_workouts_detail', args=[workout_id])
+        response = self.client.patch(url, json.dumps({'exercises': [self.exercise.id]}), content_type='application/json')
+        self.assertEqual(response.json()['exercises'], [self.exercise.id])
+        self.assertEqual(response.json()['name'], 'Pull day')
+
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertFalse(Workout.objects.filter(pk=workout_id).exists())
+
+    def test_other_users_data_is_hidden(self):
+        other = User.objects.create_user(username='other', password='testpassword')
+        workout = Workout.objects.create(profile=other.profile, name='Private', duration=30)
+        response = self.client.get(reverse('api_v1_workouts_detail', args=[workout.id]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_gzip(self):
+        self.make_workouts(5)
+        response = self.client.get(reverse('api_v1_workouts_list'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(len(json.loads(gzip.decompress(response.content))['data']), 5)
+
+
+class ExerciseSearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='lifter', password='testpassword')
+        self.profile = self.user.profile
+        upper = ExerciseType.objects.create(name='Upper Body', description='')
+        lower = ExerciseType.objects.create(name='Lower Body', description='')
+        self.bench = Exercise.objects.create(name='Bench press', type=upper, description='Flat barbell press')
+        self.incline = Exercise.objects.create(name='Incline bench press', type=upper, description='')
+        self.squat = Exercise.objects.create(name='Back squat', type=lower, description='Barbell on the upper back')
+        self.client.force_login(self.user)
+
+    def names(self, query):
+        response = self.client.get(reverse('exercise_search'), {'q': query})
+        return [result['name'] for result in response.json()['results']]
+
+    def check_search(self):
+        self.assertEqual(self.names('squ'), ['Back squat'])
+        self.assertEqual(set(self.names('ben pr')), {'Bench press', 'Incline bench press'})
+        self.assertEqual(self.names('lower'), ['Back squat'])
+        self.assertEqual(self.names('!!'), [])
+
+        # Usage frequency lifts an exercise above an equally relevant one
+        workout = Workout.objects.create(profile=self.profile, name='Push', duration=30)
+        for _ in range(5):
+            ExerciseProgress.objects.create(profile=self.profile, workout=workout, exercise=self.incline, repetitions=5, sets=3, weight=40)
+        self.assertEqual(self.names('bench')[0], 'Incline bench press')
+
+        # Signals keep the index in sync
+        self.squat.name = 'Front squat'
+        self.squat.save()
+        self.assertEqual(self.names('front'), ['Front squat'])
+        self.squat.delete()
+        self.assertEqual(self.names('squat'), [])
+
+    def test_fts5_backend(self):
+        self.assertIsInstance(search.get_index(), search.FtsIndex)
+        self.check_search()
+
+    def test_memory_backend(self):
+        with mock.patch.object(search, 'get_index', return_value=search.MemoryIndex()) as get_index:
+            get_index.return_value.rebuild()
+            self.check_search()
+
+    def test_add_exercises_form_does_not_render_catalog(self):
+        workout = Workout.objects.create(profile=self.profile, name='Push', duration=30)
+        response = self.client.get(reverse('add_exercises_to_workout', args=[workout.id]))
+        self.assertNotContains(response, 'Back squat')
+        response = self.client.post(reverse('add_exercises_to_workout', args=[workout.id]), {'exercises': [self.bench.id, self.squat.id]})
+        self.assertEqual(set(workout.exercises.all()), {self.bench, self.squat})
+
+
+class WorkoutCacheTests(ClearCachesMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='lifter', password='testpassword')
+        self.profile = self.user.profile
+        self.type = ExerciseType.objects.create(name='Upper Body', description='')
+        self.exercise = Exercise.objects.create(name='Curl', type=self.type, description='')
+        self.workout = Workout.objects.create(profile=self.profile, name='Arms', duration=30)
+        self.workout.exercises.add(self.exercise)
+        self.client.force_login(self.user)
+
+    def get(self, name):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(name, args=[self.workout.id]))
+        return response, len(queries)
+
+    def test_hits_skip_queries_and_are_counted(self):
+        first, cold = self.get('workout_detail')
+        second, warm = self.get('workout_detail')
+        self.assertLess(warm, cold)
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(caching.cache_stats()['workout_detail'], {'hits': 1, 'misses': 1, 'hit_ratio': 0.5})
+
+    def test_progress_save_invalidates_summary(self):
+        self.get('workout_summary')
+        with self.captureOnCommitCallbacks(execute=True):
+            ExerciseProgress.objects.create(profile=self.profile, workout=self.workout, exercise=self.exercise, repetitions=12, sets=3, weight=15)
+        response, queries = self.get('workout_summary')
+        self.assertContains(response, 'Reps: 12')
+        self.assertEqual(caching.cache_stats()['workout_summary']['misses'], 2)
+
+    def test_m2m_and_exercise_changes_invalidate_detail(self):
+        self.get('workout_detail')
+        other = Exercise.objects.create(name='Dip', type=self.type, description='')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.workout.exercises.add(other)
+        self.assertContains(self.get('workout_detail')[0], 'Dip')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.exercise.name = 'Hammer curl'
+            self.exercise.save()
+        self.assertContains(self.get('workout_detail')[0], 'Hammer curl')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            other.workout_set.clear()
+        self.assertNotContains(self.get('workout_detail')[0], 'Dip')
+
+    def test_cache_is_per_user(self):
+        self.get('workout_detail')
+        other = User.objects.create_user(username='coach', password='testpassword')
+        self.client.force_login(other)
+        response, queries = self.get('workout_detail')
+        self.assertEqual(caching.cache_stats()['workout_detail']['misses'], 2)
+
+
+class QueryPlanTests(TestCase):
+    # EXPLAIN QUERY PLAN reports "SCAN <table>" with no "USING ... INDEX" when SQLite reads the whole table
+
+    def assertUsesIndex(self, queryset):
+        self.assertEqual(connection.vendor, 'sqlite')
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            plan = [row[-1] for row in cursor.fetchall()]
+        scans = [detail for detail in plan if detail.startswith('SCAN ') and 'USING' not in detail]
+        self.assertEqual(scans, [], 'Full table scan in plan: %s' % plan)
+
+    def test_workout_detail_progress(self):
+        self.assertUsesIndex(ExerciseProgress.objects.filter(workout_id=1, profile_id=1).order_by('date', 'id'))
+
+    def test_progress_by_exercise(self):
+        self.assertUsesIndex(ExerciseProgress.objects.filter(exercise_id=1))
+
+    def test_open_workouts_page(self):
+        self.assertUsesIndex(Workout.objects.filter(profile_id=1, completed=False).order_by('-date', '-id')[:26])
+
+    def test_profile_email_uniqueness_check(self):
+        self.assertUsesIndex(Profile.objects.filter(email='lifter@example.com').exclude(pk=1).values('pk')[:1])
+
+    def test_case_insensitive_username_lookup(self):
+        users = User.objects.annotate(username_lower=Lower('username')).filter(username_lower=Lower(Value('Lifter'))).order_by('pk')[:1]
+        self.assertUsesIndex(users)
+
+    def test_progress_analytics(self):
+        self.assertUsesIndex(
+            ExerciseProgress.objects.filter(profile_id=1, date__gte=datetime.date(2023, 1, 1))
+            .values('date').annotate(count=Count('id')).order_by('date')
+        )
+
+    def test_exercise_usage_counts(self):
+        self.assertUsesIndex(
+            ExerciseProgress.objects.filter(profile_id=1, exercise_id__in=[1, 2, 3])
+            .values('exercise_id').annotate(uses=Count('id')).order_by()
+        )
+
+
+class RetryOnLockedTests(SimpleTestCase):
+    def test_retries_locked_errors_then_succeeds(self):
+        calls = []
+
+        @retry_on_locked(attempts=3)
+        def write():
+            calls.append(1)
+            if len(calls) < 3:
+                raise OperationalError('database is locked')
+            return 'done'
+
+        with mock.patch('workout_app.sqlite_backend.retry.time.sleep'), self.assertLogs('workout_app.sqlite_backend', 'WARNING') as logs:
+            self.assertEqual(write(), 'done')
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(len(logs.records), 2)
+
+    def test_other_errors_are_not_retried(self):
+        calls = []
+
+        @retry_on_locked
+        def write():
+            calls.append(1)
+            raise OperationalError('no such table: nowhere')
+
+        with self.assertRaises(OperationalError):
+            write()
+        self.assertEqual(len(calls), 1)
+
+
+def locked_once(func):
+    # Fails the first call the way a busy SQLite database does, then behaves normally
+    calls = []
+
+    def side_effect(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 1:
+            raise OperationalError('database is locked')
+        return func(*args, **kwargs)
+    return side_effect
+
+
+@mock.patch('workout_app.sqlite_backend.retry.time.sleep')
+class LockedWriteRetryTests(ClearCachesMixin, TransactionTestCase):
+    # TestCase wraps every test in a transaction, where nothing can be retried
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='lifter', password='testpassword')
+        self.profile = self.user.profile
+        self.exercise_type = ExerciseType.objects.create(name='Lower Body', description='')
+        self.squat = Exercise.objects.create(name='Squat', type=self.exercise_type, description='')
+        self.workout = Workout.objects.create(profile=self.profile, name='Legs', duration=40)
+        # Each test hits exactly one locked error, and its retry is logged
+        self.enterContext(self.assertLogs('workout_app.sqlite_backend', 'WARNING'))
+
+    def test_model_save_retries_with_its_receivers(self, sleep):
+        from .rollups import apply_delta
+        with mock.patch('WorkoutApp.rollups.apply_delta', side_effect=locked_once(apply_delta)):
+            ExerciseProgress.objects.create(profile=self.profile, workout=self.workout, exercise=self.squat, sets=3, repetitions=5, weight=100)
+        self.assertEqual(ExerciseProgress.objects.count(), 1)
+        self.assertEqual(DailyRollup.objects.get(profile=self.profile).exercise_volume, 1500)
+
+    def test_logged_exercise_and_its_record_retry_together(self, sleep):
+        from .progress import log_exercise
+        from .records import record_personal_bests
+        progress = ExerciseProgress(profile=self.profile, workout=self.workout, exercise=self.squat, sets=3, repetitions=5, weight=100)
+        with mock.patch('WorkoutApp.progress.record_personal_bests', side_effect=locked_once(record_personal_bests)):
+            log_exercise(progress)
+        self.assertEqual(ExerciseProgress.objects.count(), 1)
+        self.assertEqual(PersonalBest.objects.get(profile=self.profile).weight, 100)
+
+    def test_api_write_retries_from_the_top(self, sleep):
+        from .records import record_personal_bests
+        self.client.force_login(self.user)
+        body = {'workout': self.workout.id, 'exercise': self.squat.id, 'sets': 3, 'repetitions': 5, 'weight': 100}
+        with mock.patch('WorkoutApp.api.record_personal_bests', side_effect=locked_once(record_personal_bests)):
+            response = self.client.post(reverse('api_v1_progress_list'), json.dumps(body), content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(ExerciseProgress.objects.count(), 1)
+
+    def test_import_batch_retries_with_fresh_lookups(self, sleep):
+        from .imports import import_history
+        from .rollups import add_to_rollups
+        rows = b'date,workout,exercise,sets,repetitions,weight\n2024-01-01,Pull,Deadlift,3,5,140\n2024-01-02,Pull,Deadlift,3,5,145\n'
+        with mock.patch('WorkoutApp.imports.add_to_rollups', side_effect=locked_once(add_to_rollups)):
+            stats = import_history(self.profile, io.BytesIO(rows), 'csv', 'pull.csv')
+        self.assertEqual(stats['imported'], 2)
+        deadlift = Exercise.objects.get(name='Deadlift')
+        self.assertEqual(ExerciseProgress.objects.filter(exercise=deadlift).count(), 2)
+        self.assertEqual(Workout.objects.filter(profile=self.profile, name='Pull').count(), 2)
+
+
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = routers.PrimaryReplicaRouter()
+        patcher = mock.patch.object(routers, 'replica_available', return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        routers._state.pinned = False
+        self.addCleanup(setattr, routers._state, 'pinned', False)
+
+    def test_only_analytics_reads_use_the_replica(self):
+        self.assertEqual(self.router.db_for_read(Workout), 'default')
+        with routers.analytics_reads():
+            self.assertEqual(self.router.db_for_read(Workout), 'replica')
+        self.assertEqual(self.router.db_for_write(Workout), 'default')
+
+    def test_write_pins_rest_of_request_to_primary(self):
+        with routers.analytics_reads():
+            self.router.db_for_write(ExerciseProgress)
+            self.assertEqual(self.router.db_for_read(ExerciseProgress), 'default')
+
+    def test_stale_replica_falls_back_to_primary(self):
+        with mock.patch.object(routers, 'replica_available', return_value=False), routers.analytics_reads():
+            self.assertEqual(self.router.db_for_read(Workout), 'default')
+
+    def test_replica_freshness_is_checked_once_per_block(self):
+        patcher = mock.patch.object(routers, 'replica_available', return_value=True)
+        with patcher as available, routers.analytics_reads():
+            for _ in range(5):
+                self.assertEqual(self.router.db_for_read(Workout), 'replica')
+            with routers.analytics_reads():
+                self.assertEqual(self.router.db_for_read(Workout), 'replica')
+        self.assertEqual(available.call_count, 1)
+
+    def test_replica_requires_fresh_sync(self):
+        with self.settings(DATABASES={'default': {}, 'replica': {'NAME': '/nonexistent/replica.sqlite3'}}):
+            self.assertIsNone(routers.replica_staleness())
+
+    def test_middleware_pins_client_after_write(self):
+        def write_view(request):
+            self.router.db_for_write(Workout)
+            return HttpResponse()
+
+        def read_view(request):
+            with routers.analytics_reads():
+                return HttpResponse(self.router.db_for_read(Workout))
+
+        factory = RequestFactory()
+        response = routers.PrimaryPinMiddleware(write_view)(factory.post('/'))
+        cookie = response.cookies[routers.PIN_COOKIE].value
+
+        self.assertEqual(routers.PrimaryPinMiddleware(read_view)(factory.get('/')).content, b'replica')
+        pinned = factory.get('/')
+        pinned.COOKIES[routers.PIN_COOKIE] = cookie
+        self.assertEqual(routers.PrimaryPinMiddleware(read_view)(pinned).content, b'default')
+
+
+    async def test_async_middleware_pins_client_after_write(self):
+        async def write_view(request):
+            # The write happens in a worker thread, as it does for an async view's ORM calls
+            await sync_to_async(self.router.db_for_write)(Workout)
+            return HttpResponse()
+
+        middleware = routers.PrimaryPinMiddleware(write_view)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        response = await middleware(RequestFactory().post('/'))
+        self.assertIn(routers.PIN_COOKIE, response.cookies)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='lifter', password='testpassword')
+        self.profile = self.user.profile
+        exercise_type = ExerciseType.objects.create(name='Lower Body', description='')
+        exercise = Exercise.objects.create(name='Deadlift', type=exercise_type, description='')
+        workout = Workout.objects.create(profile=self.profile, name='Pull, heavy', duration=50)
+        for weight in (100, 110, 120):
+            ExerciseProgress.objects.create(profile=self.profile, workout=workout, exercise=exercise, repetitions=5, sets=3, weight=weight)
+        WorkoutProgress.objects.create(workout=workout, user=self.user, notes='Felt "strong"')
+        NutritionTracking.objects.create(profile=self.profile, food_item='Eggs', quantity=2, calories=140)
+        ProfileHistory.objects.create(profile=self.profile, height=70, weight=180)
+        other = User.objects.create_user(username='other', password='testpassword')
+        NutritionTracking.objects.create(profile=other.profile, food_item='Secret', quantity=1, calories=1)
+        self.client.force_login(self.user)
+
+    def export(self, **params):
+        response = self.client.get(reverse('export_history'), params)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content)
+
+    def test_ndjson_covers_every_dataset(self):
+        records = [json.loads(line) for line in self.export().decode().splitlines()]
+        counts = {}
+        for record in records:
+            counts[record['dataset']] = counts.get(record['dataset'], 0) + 1
+        self.assertEqual(counts, {'exercise_progress': 3, 'workout_progress': 1, 'nutrition': 1, 'profile_history': 1})
+        self.assertEqual(records[2]['weight'], 120.0)
+        self.assertEqual(records[0]['exercise'], 'Deadlift')
+
+    def test_csv_single_dataset(self):
+        rows = list(csv.reader(io.StringIO(self.export(format='csv', dataset='exercise_progress').decode())))
+        self.assertEqual(rows[0], ['dataset', 'id', 'date', 'workout', 'exercise', 'sets', 'repetitions', 'weight'])
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[1][3], 'Pull, heavy')
+
+    def test_gzip(self):
+        response = self.client.get(reverse('export_history'), {'format': 'csv', 'compress': 'gzip'})
+        self.assertIn('.csv.gz', response['Content-Disposition'])
+        text = gzip.decompress(b''.join(response.streaming_content)).decode()
+        self.assertIn('Felt ""strong""', text)
+        self.assertNotIn('Secret', text)
+
+    def test_flushes_in_chunks(self):
+        with mock.patch('WorkoutApp.exports.FLUSH_BYTES', 10):
+            response = self.client.get(reverse('export_history'))
+            self.assertGreater(len(list(response.streaming_content)), 1)
+
+    def test_management_command(self):
+        out = io.BytesIO()
+        with mock.patch('sys.stdout', mock.Mock(buffer=out)):
+            call_command('export_history', 'lifter', '--dataset', 'nutrition')
+        self.assertEqual(json.loads(out.getvalue())['food_item'], 'Eggs')
+
+
+class ImportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='lifter', password='testpassword')
+        self.profile = self.user.profile
+        exercise_type = ExerciseType.objects.create(name='Lower Body', description='')
+        self.squat = Exercise.objects.create(name='Squat', type=exercise_type, description='')
+
+    def csv_file(self, rows):
+        lines = ['date,workout,exercise,exercise_type,sets,repetitions,weight'] + rows
+        return io.BytesIO(('\n'.join(lines) + '\n').encode())
+
+    def test_csv_import_resolves_names_and_creates_rows(self):
+        from .imports import import_history
+        stream = self.csv_file([
+            '2024-01-01,Legs,squat,,3,5,100',
+            '2024-01-01,Legs,Front Squat,Lower Body,3,5,80',
+            '2024-01-03,Legs,Squat,,3,5,105',
+            'not-a-date,Legs,Squat,,3,5,105',
+        ])
+        stats = import_history(self.profile, stream, 'csv', 'tracker.csv')
+
+        self.assertEqual((stats['imported'], stats['skipped']), (3, 1))
+        self.assertIn('Row 4', stats['errors'][0])
+        self.assertEqual(Exercise.objects.filter(name__iexact='squat').count(), 1)
+        self.assertEqual(Workout.objects.filter(profile=self.profile).count(), 2)
+        legs = Workout.objects.get(profile=self.profile, date=datetime.date(2024, 1, 1))
+        self.assertEqual(legs.exercises.count(), 2)
+        self.assertEqual(ExerciseProgress.objects.filter(workout=legs).count(), 2)
+        self.assertEqual(DailyRollup.objects.get(profile=self.profile, date=datetime.date(2024, 1, 3)).exercise_volume, 1575)
+        self.assertEqual(PersonalBest.objects.get(profile=self.profile, exercise=self.squat).weight, 105)
+        self.assertEqual([exercise.name for exercise in search.search_exercises('front')], ['Front Squat'])
+
+    def test_query_count_does_not_grow_with_rows(self):
+        from .imports import import_history
+
+        def queries(month, count):
+            # Rollups are updated once per day touched, so both files cover five new days
+            rows = ['2024-%02d-%02d,Legs,Squat,,3,5,%d' % (month, row % 5 + 1, 100 + row) for row in range(count)]
+            with CaptureQueriesContext(connection) as captured:
+                import_history(self.profile, self.csv_file(rows), 'csv', 'file-%d' % month, replay_records=False)
+            return len(captured)
+
+        self.assertEqual(queries(2, 10), queries(3, 200))
+
+    def test_resumes_from_checkpoint(self):
+        from .imports import import_history
+        rows = ['2024-03-01,Legs,Squat,,3,5,%d' % weight for weight in range(100, 110)]
+        import_history(self.profile, self.csv_file(rows[:4]), 'csv', 'big.csv', batch_size=2)
+        stats = import_history(self.profile, self.csv_file(rows), 'csv', 'big.csv', batch_size=2)
+
+        self.assertEqual((stats['resumed_from'], stats['imported']), (4, 6))
+        self.assertEqual(ExerciseProgress.objects.filter(profile=self.profile).count(), 10)
+        self.assertEqual(Workout.objects.filter(profile=self.profile).count(), 1)
+
+    def test_uploads_with_the_same_name_are_told_apart_by_content(self):
+        self.client.force_login(self.user)
+
+        def upload(rows):
+            stream = self.csv_file(rows)
+            stream.name = 'export.csv'
+            return self.client.post(reverse('import_history'), {'file': stream}).context['stats']
+
+        first = ['2024-03-01,Legs,Squat,,3,5,100', '2024-03-02,Legs,Squat,,3,5,105']
+        self.assertEqual(upload(first)['imported'], 2)
+        stats = upload(first + ['2024-03-03,Legs,Squat,,3,5,110'])
+        self.assertEqual((stats['resumed_from'], stats['imported']), (0, 3))
+        # Uploading the same bytes again resumes past every row
+        stats = upload(first)
+        self.assertEqual((stats['resumed_from'], stats['imported']), (2, 0))
+        self.assertEqual(ExerciseProgress.objects.filter(profile=self.profile).count(), 5)
+
+    def test_ndjson_round_trips_an_export(self):
+        from .exports import export_chunks
+        workout = Workout.objects.create(profile=self.profile, name='Legs', duration=40)
+        ExerciseProgress.objects.create(profile=self.profile, workout=workout, exercise=self.squat, repetitions=5, sets=3, weight=100)
+        NutritionTracking.objects.create(profile=self.profile, food_item='Eggs', quantity=2, calories=140)
+        export = b''.join(export_chunks(self.profile, ['exercise_progress', 'nutrition'], 'ndjson', compress=True))
+
+        other = User.objects.create_user(username='other', password='testpassword')
+        self.client.force_login(other)
+        upload = io.BytesIO(export)
+        upload.name = 'history.ndjson.gz'
+        response = self.client.post(reverse('import_history'), {'file': upload})
+
+        self.assertEqual(response.context['stats']['imported'], 1)
+        self.assertEqual(response.context['stats']['skipped'], 1)
+        progress = ExerciseProgress.objects.get(profile=other.profile)
+        self.assertEqual((progress.exercise_id, progress.weight), (self.squat.id, 100))
+
+    def test_management_command(self):
+        import tempfile
+        with tempfile.NamedTemporaryFile('wb', suffix='.csv') as handle:
+            handle.write(self.csv_file(['2024-04-01,Legs,Squat,,3,5,100']).getvalue())
+            handle.flush()
+            out = io.StringIO()
+            call_command('import_history', 'lifter', handle.name, stdout=out)
+        self.assertIn('Imported 1 rows', out.getvalue())
+
+
+class BenchmarkTests(TestCase):
+    def setUp(self):
+        call_command('generate_data', profiles=2, workouts=3, progress=4, nutrition=2, tracking=2, seed=1, stdout=io.StringIO())
+        self.profile = Profile.objects.get(user__username='synthetic_0')
+
+    def test_generate_data(self):
+        self.assertEqual(Workout.objects.filter(profile=self.profile).count(), 3)
+        self.assertEqual(ExerciseProgress.objects.filter(profile=self.profile).count(), 12)
+        self.assertEqual(NutritionTracking.objects.filter(profile=self.profile).count(), 2)
+        self.assertEqual(DailyTracking.objects.filter(profile=self.profile).count(), 2)
+        self.assertTrue(DailyRollup.objects.filter(profile=self.profile).exists())
+        self.assertTrue(PersonalBest.objects.filter(profile=self.profile).exists())
+        self.assertTrue(self.client.login(username='synthetic_1', password='benchmark-password'))
+
+        call_command('generate_data', profiles=1, workouts=1, progress=1, nutrition=0, tracking=0, stdout=io.StringIO())
+        self.assertTrue(User.objects.filter(username='synthetic_2').exists())
+
+        # Numbering continues past the highest name even after earlier users were deleted
+        User.objects.filter(username='synthetic_0').delete()
+        call_command('generate_data', profiles=1, workouts=1, progress=1, nutrition=0, tracking=0, stdout=io.StringIO())
+        self.assertTrue(User.objects.filter(username='synthetic_3').exists())
+
+    def test_benchmark_covers_every_url(self):
+        from .benchmarks import SKIP, run_benchmark, url_patterns
+        results = run_benchmark(self.profile, iterations=2, warmup=0)
+
+        self.assertEqual(set(results['views']) | set(results['skipped']), {name for name, pattern in url_patterns()})
+        self.assertEqual(set(results['skipped']), set(SKIP))
+        self.assertEqual(results['views']['workout_detail']['status'], 200)
+        self.assertIn('/api/v1/workouts/', results['views']['api_v1_workouts_detail']['path'])
+        self.assertGreater(results['views']['workout_list']['queries'], 0)
+
+    def test_compare_results(self):
+        from .benchmarks import compare_results
+        baseline = {'views': {'home': {'status': 200, 'p50_ms': 5, 'p95_ms': 10, 'queries': 3}}}
+        same = {'views': {'home': {'status': 200, 'p50_ms': 5, 'p95_ms': 11, 'queries': 3}, 'new': {}}}
+        worse = {'views': {'home': {'status': 500, 'p50_ms': 9, 'p95_ms': 20, 'queries': 4}}}
+
+        self.assertEqual(compare_results(same, baseline), [])
+        self.assertEqual(len(compare_results(worse, baseline)), 3)
+
+    def test_command_fails_on_regression(self):
+        import tempfile
+        from .benchmarks import write_results
+        with tempfile.NamedTemporaryFile('w', suffix='.json') as handle:
+            write_results({'views': {'home': {'status': 200, 'p50_ms': 0, 'p95_ms': 0, 'queries': 0}}}, handle.name)
+            with self.assertRaisesMessage(CommandError, 'home: 0 ->'):
+                call_command('bench_views', iterations=1, baseline=handle.name, stdout=io.StringIO())
+
+
+    def test_sqlite_writers_run_through_the_orm_under_each_profile(self):
+        output = io.StringIO()
+        call_command('bench_sqlite_writers', writers=2, transactions=3, profiles=1, json=True, stdout=output)
+        results = json.loads(output.getvalue())
+        self.assertEqual(set(results), {'development', 'production'})
+        for result in results.values():
+            self.assertEqual(result['committed'] + result['failed'], 6)
+            self.assertIn('retries', result)
+        # The scratch databases never touch the test database
+        self.assertFalse(User.objects.filter(username__startswith='writer_').exists())
+
+
+class ProfilingMiddlewareTests(ClearCachesMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        profiling.reset_metrics()
+        self.user = User.objects.create_user(username='lifter', password='testpassword')
+        exercise_type = ExerciseType.objects.create(name='Strength', description='')
+        exercise = Exercise.objects.create(name='Squat', type=exercise_type, description='')
+        self.workout = Workout.objects.create(profile=self.user.profile, name='Legs', duration=45)
+        self.workout.exercises.add(exercise)
+        self.client.force_login(self.user)
+
+    def test_server_timing_header(self):
+        response = self.client.get(reverse('workout_detail', args=[self.workout.id]))
+        timings = dict(part.split(';', 1) for part in response['Server-Timing'].split(', '))
+        self.assertEqual(set(timings), {'total', 'db', 'tpl'})
+        self.assertRegex(timings['db'], r'desc="[1-9]\d* queries"')
+
+    def test_metrics_histograms_per_route(self):
+        self.client.get(reverse('workout_detail', args=[self.workout.id]))
+        self.client.get(reverse('workout_detail', args=[self.workout.id]))
+        text = self.client.get(reverse('metrics')).content.decode()
+
+        self.assertIn('# TYPE workout_request_duration_seconds histogram', text)
+        self.assertIn('workout_request_duration_seconds_count{route="workout/<int:pk>/",method="GET"} 2', text)
+        self.assertIn('workout_request_queries_bucket{route="workout/<int:pk>/",method="GET",le="+Inf"} 2', text)
+        self.assertNotIn('route="metrics/"', text)
+
+    def test_unknown_methods_share_one_series(self):
+        for method in ('BREW', 'FROB'):
+            self.client.generic(method, reverse('home'))
+        text = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('workout_request_duration_seconds_count{route="",method="other"} 2', text)
+        self.assertNotIn('BREW', text)
+
+    def test_metrics_are_local_only(self):
+        response = self.client.get(reverse('metrics'), REMOTE_ADDR='203.0.113.9')
+        self.assertEqual(response.status_code, 404)
+
+    def test_sampling_and_switches(self):
+        with self.settings(PROFILING_SAMPLE_RATE=0):
+            client = self.client_class()
+            client.force_login(self.user)
+            self.assertNotIn('Server-Timing', client.get(reverse('home')))
+        with self.settings(PROFILING_TRACE_SQL=False, PROFILING_TRACE_TEMPLATES=False):
+            client = self.client_class()
+            client.force_login(self.user)
+            self.assertEqual(client.get(reverse('home'))['Server-Timing'].count('dur='), 1)
+
+    async def test_async_chain_stays_async_and_counts_worker_queries(self):
+        async def view(request):
+            await Workout.objects.filter(pk=self.workout.id).afirst()
+            return HttpResponse()
+
+        middleware = profiling.ProfilingMiddleware(view)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        response = await middleware(RequestFactory().get('/'))
+        self.assertIn('desc="1 queries"', response['Server-Timing'])
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = profiling.Histogram('test_seconds', 'Test.', (0.1, 1))
+        for value in (0.05, 0.5, 5):
+            histogram.observe((('route', 'a'),), value)
+        self.assertEqual(histogram.render()[2:5], [
+            'test_seconds_bucket{route="a",le="0.1"} 1',
+            'test_seconds_bucket{route="a",le="1.0"} 2',
+            'test_seconds_bucket{route="a",le="+Inf"} 3',
+        ])
+
+
+class QueryInspectionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='lifter', password='testpassword')
+        exercise_type = ExerciseType.objects.create(name='Strength', description='')
+        self.exercises = [Exercise.objects.create(name='Lift %d' % number, type=exercise_type, description='') for number in range(4)]
+        self.request = RequestFactory().get('/')
+
+    def per_row_view(self, request):
+        return HttpResponse(', '.join(Exercise.objects.get(pk=exercise.pk).type.name for exercise in self.exercises))
+
+    def middleware(self, view, **overrides):
+        with self.settings(**overrides):
+            return querylog.QueryInspectionMiddleware(view)
+
+    def test_n_plus_one_raises_with_its_origin(self):
+        middleware = self.middleware(self.per_row_view, NPLUSONE_THRESHOLD=3, NPLUSONE_RAISE=True)
+        with self.assertRaisesRegex(querylog.NPlusOneError, r'ran 3 times .*WorkoutApp/tests\.py:\d+'):
+            middleware(self.request)
+
+    def test_n_plus_one_logs_outside_tests(self):
+        middleware = self.middleware(self.per_row_view, NPLUSONE_THRESHOLD=3, NPLUSONE_RAISE=False)
+        with self.assertLogs('workout_app.queries', 'WARNING') as logs:
+            middleware(self.request)
+        # Each repeated shape is reported once per request
+        self.assertEqual(len(logs.output), 2)
+
+    def test_batched_code_can_opt_out(self):
+        middleware = self.middleware(querylog.allow_repeated_queries(self.per_row_view), NPLUSONE_THRESHOLD=3, NPLUSONE_RAISE=True)
+        self.assertEqual(middleware(self.request).status_code, 200)
+
+    def test_slow_query_log_names_template_line(self):
+        from django.template import Context, Template
+
+        def view(request):
+            return HttpResponse(Template('{% for exercise in exercises %}\n{{ exercise.type }}{% endfor %}').render(Context({'exercises': Exercise.objects.all()[:1]})))
+
+        middleware = self.middleware(view, SLOW_QUERY_MS=0, NPLUSONE_RAISE=False)
+        with self.assertLogs('workout_app.queries', 'WARNING') as logs:
+            middleware(self.request)
+        self.assertTrue(any('Slow query' in line and 'template <unknown source>:2' in line for line in logs.output))
+
+    async def test_async_requests_are_inspected(self):
+        async def view(request):
+            return await sync_to_async(self.per_row_view)(request)
+
+        middleware = self.middleware(view, NPLUSONE_THRESHOLD=3, NPLUSONE_RAISE=True)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        with self.assertRaises(querylog.NPlusOneError):
+            await middleware(self.request)
+
+    def test_query_shape_collapses_placeholder_lists(self):
+        self.assertEqual(
+            querylog.query_shape('SELECT 1 WHERE id IN (%s, %s, %s) AND x = %s'),
+            querylog.query_shape('SELECT 1 WHERE id IN (%s) AND x = %s'),
+        )
+
+
+class AsyncReadViewTests(ClearCachesMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='lifter', password='testpassword')
+        self.profile = self.user.profile
+        exercise_type = ExerciseType.objects.create(name='Strength', description='')
+        self.squat = Exercise.objects.create(name='Squat', type=exercise_type, description='')
+        self.workout = Workout.objects.create(profile=self.profile, name='Legs', duration=45)
+        self.workout.exercises.add(self.squat)
+        for weight in (100, 110):
+            ExerciseProgress.objects.create(profile=self.profile, workout=self.workout, exercise=self.squat, sets=3, repetitions=5, weight=weight)
+        self.client.force_login(self.user)
+
+    def request(self, path, user=None):
+        from django.contrib.messages.storage.fallback import FallbackStorage
+        from django.test import AsyncRequestFactory
+        request = AsyncRequestFactory().get(path)
+        request.user = user or self.user
+        request.session = {}
+        request._messages = FallbackStorage(request)
+        return request
+
+    async def test_workout_summary(self):
+        from . import async_views
+        response = await async_views.workout_summary(self.request('/'), pk=self.workout.id)
+        self.assertContains(response, 'Squat (Reps: 5, Sets: 3)', count=2)
+
+        other = await User.objects.acreate(username='other')
+        response = await async_views.workout_summary(self.request('/', other), pk=self.workout.id)
+        self.assertEqual(response.status_code, 302)
+
+    async def test_workout_detail_shares_the_sync_cache(self):
+        from . import async_views
+        view = async_views.WorkoutDetailView.as_view()
+        response = await view(self.request('/'), pk=self.workout.id)
+        self.assertContains(response, '110.00 lb')
+        self.assertEqual(caching.cache_stats()['workout_detail']['misses'], 1)
+
+        sync_response = await sync_to_async(self.client.get)(reverse('workout_detail', args=[self.workout.id]))
+        self.assertEqual(caching.cache_stats()['workout_detail']['hits'], 1)
+        self.assertContains(sync_response, '110.00 lb')
+
+    async def test_workout_list_paginates(self):
+        from . import async_views
+        await Workout.objects.acreate(profile=self.profile, name='Done', duration=10, completed=True)
+        view = async_views.WorkoutListView.as_view()
+        response = await view(self.request('/?page_size=1'), profile_id=self.profile.id)
+        self.assertContains(response, 'Legs')
+        self.assertNotContains(response, 'Done')
+
+    async def test_progress_data_matches_sync_view(self):
+        from . import async_views
+        response = await async_views.progress_data(self.request('/?period=week'))
+        sync_response = await sync_to_async(self.client.get)(reverse('progress_data'), {'period': 'week'})
+        self.assertEqual(json.loads(response.content), json.loads(sync_response.content))
+
+        response = await async_views.progress_data(self.request('/?period=year'))
+        self.assertEqual(response.status_code, 400)
+
+    async def test_login_required(self):
+        from django.contrib.auth.models import AnonymousUser
+        from . import async_views
+        response = await async_views.progress_data(self.request('/progress/data/', AnonymousUser()))
+        self.assertEqual(response.status_code, 302)
+
+    def test_asgi_and_wsgi_drivers(self):
+        from .benchmarks import drive_asgi, drive_wsgi
+
+        def wsgi_app(environ, start_response):
+            start_response('200 OK' if environ['QUERY_STRING'] == 'ok=1' else '404 Not Found', [])
+            return [b'ok']
+
+        async def asgi_app(scope, receive, send):
+            await receive()
+            await send({'type': 'http.response.start', 'status': 200 if scope['query_string'] == b'ok=1' else 404, 'headers': []})
+            await send({'type': 'http.response.body', 'body': b'ok'})
+
+        for drive, app in ((drive_wsgi, wsgi_app), (drive_asgi, asgi_app)):
+            result = drive(app, ['/a/?ok=1'] * 9 + ['/b/'], 'sessionid=x', 4)
+            self.assertEqual((result['requests'], result['errors']), (10, 1))
+
+
+class PasswordHashPoolTests(TestCase):
+    def setUp(self):
+        self.addCleanup(hashing.reset)
+        self.user = User.objects.create_user(username='Lifter', password='testpassword')
+
+    def test_login_is_case_insensitive(self):
+        response = self.client.post(reverse('login'), {'username': 'lifter', 'password': 'testpassword'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(int(self.client.session['_auth_user_id']), self.user.id)
+        self.assertIsNone(authenticate(None, username='lifter', password='wrong'))
+        self.assertIsNone(authenticate(None, username='nobody', password='testpassword'))
+
+    def test_login_with_a_non_ascii_username(self):
+        user = User.objects.create_user(username='Émile', password='testpassword')
+        self.assertEqual(authenticate(None, username='Émile', password='testpassword'), user)
+        # SQLite only folds ASCII, so the ASCII letters are case-insensitive and the accented one must match
+        self.assertEqual(authenticate(None, username='ÉMILE', password='testpassword'), user)
+
+    @override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.PBKDF2PasswordHasher', 'django.contrib.auth.hashers.MD5PasswordHasher'])
+    def test_outdated_hash_is_upgraded(self):
+        self.user.password = make_password('testpassword', hasher='md5')
+        self.user.save()
+        self.assertEqual(authenticate(None, username='lifter', password='testpassword'), self.user)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$'))
+
+    def test_full_pool_rejects(self):
+        pool = hashing.HashPool(1, 0, 10)
+        self.addCleanup(pool.shutdown)
+        started, release = threading.Event(), threading.Event()
+
+        def block():
+            started.set()
+            release.wait()
+        worker = threading.Thread(target=pool.run, args=('verify', block))
+        worker.start()
+        started.wait()
+        with self.assertRaises(hashing.HashPoolBusy):
+            pool.run('verify', lambda: None)
+        release.set()
+        worker.join()
+        self.assertEqual((pool.stats()['completed'], pool.stats()['rejected']), (1, 1))
+
+    def test_timed_out_hash_keeps_its_slot_until_it_finishes(self):
+        pool = hashing.HashPool(1, 0, 0.05)
+        self.addCleanup(pool.shutdown)
+        release = threading.Event()
+        self.addCleanup(release.set)
+        with self.assertRaisesRegex(hashing.HashPoolBusy, 'timed out'):
+            pool.run('verify', release.wait)
+        # Still hashing, so the pool is still full
+        with self.assertRaisesRegex(hashing.HashPoolBusy, 'in progress'):
+            pool.run('verify', lambda: None)
+        self.assertEqual((pool.stats()['running'], pool.stats()['queued']), (1, 0))
+        release.set()
+        pool.shutdown()
+        self.assertEqual(pool.pending, 0)
+
+    def test_busy_admin_login_returns_503(self):
+        with mock.patch('workout_app.hashing.check_password', side_effect=hashing.HashPoolBusy):
+            response = self.client.post(reverse('admin:login'), {'username': 'lifter', 'password': 'testpassword'})
+        self.assertEqual(response.status_code, 503)
+
+    def test_busy_login_returns_503(self):
+        with mock.patch('workout_app.hashing.check_password', side_effect=hashing.HashPoolBusy):
+            response = self.client.post(reverse('login'), {'username': 'lifter', 'password': 'testpassword'})
+        self.assertEqual(response.status_code, 503)
+
+    def test_registration_hashes_once(self):
+        with mock.patch('workout_app.hashing.hashers.make_password', wraps=make_password) as hashed:
+            response = self.client.post(reverse('register'), {'username': 'newlifter', 'password1': 'Sturdy-pass-42', 'password2': 'Sturdy-pass-42'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(hashed.call_count, 1)
+        self.assertTrue(User.objects.get(username='newlifter').check_password('Sturdy-pass-42'))
+        self.assertEqual(self.client.session['_auth_user_id'], str(User.objects.get(username='newlifter').id))
+
+    def test_metrics(self):
+        authenticate(None, username='lifter', password='testpassword')
+        metrics = profiling.render_metrics()
+        self.assertIn('workout_password_hash_seconds_count{operation="verify"}', metrics)
+        self.assertIn('workout_password_hash_completed_total', metrics)
+
+    def test_login_benchmark_driver(self):
+        from .benchmarks import drive_logins
+        result = drive_logins(lambda index: index % 4 != 0, lambda: time.sleep(0.001), 8, 2)
+        self.assertEqual((result['requests'], result['errors']), (8, 2))
+        self.assertIsNotNone(result['probe_p50_ms'])
+
+
+@shared_cache
+class UserCacheTests(ClearCachesMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='lifter', password='testpassword')
+        self.client.force_login(self.user)
+
+    def identity_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('progress_data'))
+        self.assertEqual(response.status_code, 200)
+        tables = ('"auth_user"', '"WorkoutApp_profile"', '"django_session"')
+        return [query['sql'] for query in queries if any(table in query['sql'] for table in tables)], response
+
+    def test_user_is_read_each_request_and_profile_comes_from_cache(self):
+        queries, response = self.identity_queries()
+        self.assertEqual(len(queries), 2)
+        queries, response = self.identity_queries()
+        self.assertEqual(len(queries), 1)
+        self.assertIn('FROM "auth_user"', queries[0])
+        self.assertNotIn('"WorkoutApp_profile"', queries[0])
+        self.assertEqual(response.wsgi_request.user.profile.id, self.user.profile.id)
+
+    def test_password_hash_is_never_cached(self):
+        self.identity_queries()
+        cache = caching.get_cache()
+        self.assertIsInstance(cache.get(usercache.profile_key(self.user.id)), Profile)
+        self.assertFalse(any(self.user.password.encode() in value for value in cache._cache.values()))
+
+    def test_saving_the_profile_invalidates(self):
+        self.identity_queries()
+        profile = Profile.objects.get(user=self.user)
+        profile.weight = 80
+        profile.save()
+        queries, response = self.identity_queries()
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(response.wsgi_request.user.profile.weight, 80)
+
+    def test_password_change_ends_cached_sessions(self):
+        self.identity_queries()
+        self.user.set_password('a-new-password')
+        self.user.save()
+        response = self.client.get(reverse('progress_data'))
+        self.assertEqual(response.status_code, 302)
+
+    def test_change_in_another_worker_ends_its_sessions(self):
+        # Each worker process has its own cache unless SHARED_CACHE is set
+        workers = [LocMemCache('worker-%s' % number, {}) for number in (1, 2)]
+        for shared in (True, False):
+            with self.subTest(shared=shared), self.settings(SHARED_CACHE=shared):
+                self.user.is_active = True
+                self.user.save()
+                self.client.force_login(self.user)
+                with mock.patch('WorkoutApp.usercache.get_cache', return_value=workers[1]):
+                    self.assertEqual(self.client.get(reverse('progress_data')).status_code, 200)
+                with mock.patch('WorkoutApp.usercache.get_cache', return_value=workers[0]):
+                    self.user.set_password('changed-in-worker-one')
+                    self.user.save()
+                with mock.patch('WorkoutApp.usercache.get_cache', return_value=workers[1]):
+                    self.assertEqual(self.client.get(reverse('progress_data')).status_code, 302)
+
+                self.client.force_login(self.user)
+                with mock.patch('WorkoutApp.usercache.get_cache', return_value=workers[0]):
+                    self.user.is_active = False
+                    self.user.save()
+                with mock.patch('WorkoutApp.usercache.get_cache', return_value=workers[1]):
+                    self.assertEqual(self.client.get(reverse('progress_data')).status_code, 302)
+
+    def test_without_a_shared_cache_nothing_is_cached(self):
+        with self.settings(SHARED_CACHE=False):
+            for _ in range(2):
+                queries, response = self.identity_queries()
+                self.assertEqual(len(queries), 1)
+                self.assertIn('LEFT OUTER JOIN "WorkoutApp_profile"', queries[0])
+        self.assertIsNone(caching.get_cache().get(usercache.profile_key(self.user.id)))
+
+
+class ChangeTrackingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='lifter', password='testpassword')
+        exercise_type = ExerciseType.objects.create(name='Strength', description='')
+        self.squat = Exercise.objects.create(name='Squat', type=exercise_type, description='')
+        self.workout = Workout.objects.create(profile=self.user.profile, name='Legs', duration=45)
+
+    def updates(self, queries):
+        return [query['sql'] for query in queries if query['sql'].startswith('UPDATE')]
+
+    def test_login_does_not_update_the_profile(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('login'), {'username': 'lifter', 'password': 'testpassword'})
+        self.assertEqual(response.status_code, 302)
+        updates = [sql for sql in self.updates(queries) if not sql.startswith('UPDATE "django_session"')]
+        self.assertEqual(len(updates), 1)
+        self.assertRegex(updates[0], r'^UPDATE "auth_user" SET "last_login" = .* WHERE')
+
+    def test_unchanged_save_is_skipped(self):
+        workout = Workout.objects.get(pk=self.workout.pk)
+        profile = Profile.objects.get(pk=self.user.profile.pk)
+        with self.assertNumQueries(0):
+            workout.save()
+            profile.save()
+
+    def test_only_changed_columns_are_written(self):
+        workout = Workout.objects.get(pk=self.workout.pk)
+        workout.duration = 50
+        with CaptureQueriesContext(connection) as queries:
+            workout.save()
+        self.assertEqual(len(queries), 1)
+        self.assertRegex(queries[0]['sql'], r'^UPDATE "WorkoutApp_workout" SET "duration" = 50 WHERE')
+        with self.assertNumQueries(0):
+            workout.save()
+        workout.refresh_from_db()
+        self.assertEqual(workout.changed_fields(), [])
+
+    def test_progress_edit_moves_rollup_without_rereading_the_row(self):
+        progress = ExerciseProgress.objects.create(
+            profile=self.user.profile, workout=self.workout, exercise=self.squat, sets=3, repetitions=5, weight=100, date=datetime.date(2023, 8, 1),
+        )
+        progress = ExerciseProgress.objects.get(pk=progress.pk)
+        progress.date = datetime.date(2023, 8, 2)
+        with CaptureQueriesContext(connection) as queries:
+            progress.save()
+        self.assertFalse(any(query['sql'].startswith('SELECT "WorkoutApp_exerciseprogress"') for query in queries))
+        self.assertEqual(
+            dict(DailyRollup.objects.filter(profile=self.user.profile).values_list('date', 'exercise_volume')),
+            {datetime.date(2023, 8, 1): 0, datetime.date(2023, 8, 2): 1500},
+        )
+
+
+class WeightTrendTests(ClearCachesMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='lifter', password='testpassword')
+        self.profile = self.user.profile
+        self.client.force_login(self.user)
+
+    def add_samples(self, samples):
+        for date, weight in samples:
+            history = ProfileHistory.objects.create(profile=self.profile, height=70, weight=weight)
+            ProfileHistory.objects.filter(pk=history.pk).update(date_recorded=date)
+
+    def test_unchanged_profile_saves_add_no_history(self):
+        data = {
+            'first_name': 'Sam', 'last_name': 'Lee', 'age': 30, 'email': 'sam@example.com', 'gender': 'O',
+            'height': "5'10", 'weight': 180.3, 'birthdate': '1994-01-01', 'fitness_goal': 'Strength',
+        }
+        url = reverse('profile_update', args=[self.profile.pk])
+        self.client.post(url, data)
+        self.client.post(url, data)
+        self.assertEqual(ProfileHistory.objects.filter(profile=self.profile).count(), 1)
+        self.client.post(url, dict(data, weight=179))
+        self.assertEqual(list(ProfileHistory.objects.filter(profile=self.profile).order_by('id').values_list('weight', flat=True)), [Decimal('180.30'), Decimal('179.00')])
+
+    def test_compaction_downsamples_old_history(self):
+        today = datetime.date(2024, 6, 30)
+        self.add_samples([
+            # Older than 180 days: the week of Monday 2023-12-04 collapses to one point
+            (datetime.date(2023, 12, 4), 200), (datetime.date(2023, 12, 6), 198), (datetime.date(2023, 12, 10), 196),
+            # Between 30 and 180 days: one point per day
+            (datetime.date(2024, 5, 1), 190), (datetime.date(2024, 5, 1), 189), (datetime.date(2024, 5, 2), 188),
+            # Recent samples are left alone
+            (datetime.date(2024, 6, 20), 185), (datetime.date(2024, 6, 20), 184),
+        ])
+        self.assertEqual(compact_history(self.profile.id, today=today), 3)
+        self.assertEqual(list(ProfileHistory.objects.filter(profile=self.profile).order_by('date_recorded', 'id').values_list('date_recorded', 'weight')), [
+            (datetime.date(2023, 12, 10), Decimal('198.00')),
+            (datetime.date(2024, 5, 1), Decimal('189.50')),
+            (datetime.date(2024, 5, 2), Decimal('188.00')),
+            (datetime.date(2024, 6, 20), Decimal('185.00')),
+            (datetime.date(2024, 6, 20), Decimal('184.00')),
+        ])
+        self.assertEqual(compact_history(self.profile.id, today=today), 0)
+
+    def test_trend(self):
+        trend = compute_trend([datetime.date(2024, 1, day) for day in (1, 8, 8, 22)], [200.0, 196.0, 194.0, 190.0], window=2, span=3)
+        self.assertEqual(trend['average'], [200.0, 198.0, 195.0, 192.0])
+        self.assertEqual(trend['ewma'], [200.0, 198.0, 196.0, 193.0])
+        self.assertEqual(trend['rate'], [None, -2.0, None, -1.5])
+
+    @skipUnless(trends.numpy, 'NumPy is not installed')
+    def test_numpy_matches_plain_python(self):
+        dates = [datetime.date(2020, 1, 1) + datetime.timedelta(days=day * 3) for day in range(3000)]
+        weights = [200 - day * 0.01 + (day % 7) * 0.3 for day in range(3000)]
+        vectorized = compute_trend(dates, weights)
+        with mock.patch.object(trends, 'numpy', None):
+            self.assertEqual(compute_trend(dates, weights), vectorized)
+
+    def test_trend_is_cached_until_history_changes(self):
+        self.add_samples([(datetime.date(2024, 1, 1), 200), (datetime.date(2024, 1, 8), 198)])
+        response = self.client.get(reverse('weight_trend_data'))
+        self.assertEqual(response.json()['labels'], ['2024-01-01', '2024-01-08'])
+        with self.assertNumQueries(0):
+            weight_trend(self.profile.id)
+        ProfileHistory.objects.create(profile=self.profile, height=70, weight=197)
+        self.assertEqual(weight_trend(self.profile.id)['weight'][-1], 197.0)
+
+
+class GuidedSessionTests(ClearCachesMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='lifter', password='testpassword')
+        self.profile = self.user.profile
+        exercise_type = ExerciseType.objects.create(name='Strength', description='')
+        self.workout = Workout.objects.create(profile=self.profile, name='Full body', duration=60)
+        self.exercises = [Exercise.objects.create(name=name, type=exercise_type, description='') for name in ('Squat', 'Bench', 'Row')]
+        # Added out of id order, so plan order and id order disagree
+        append_to_plan(self.workout, [self.exercises[2], self.exercises[0]])
+        append_to_plan(self.workout, [self.exercises[1], self.exercises[0]])
+        WorkoutExercise.objects.filter(workout=self.workout, exercise=self.exercises[2]).update(target_sets=3, target_repetitions=8, target_weight=60)
+        self.client.force_login(self.user)
+        self.url = reverse('guided_session', args=[self.workout.id])
+
+    def log_step(self, step, weight=60):
+        return self.client.post(self.url, {'step': step, 'action': 'log', 'sets': 3, 'repetitions': 8, 'weight': weight})
+
+    def test_plan_keeps_the_order_exercises_were_added(self):
+        self.assertEqual([step.exercise.name for step in plan_steps(self.workout.id)], ['Row', 'Squat', 'Bench'])
+        response = self.client.get(reverse('workout_detail', args=[self.workout.id]))
+        self.assertEqual([exercise.name for exercise in response.context['exercises']], ['Row', 'Squat', 'Bench'])
+
+    def test_walks_the_plan_with_one_write_per_step(self):
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Step 1 of 3: Row')
+        self.assertEqual(response.context['form'].initial, {'sets': 3, 'repetitions': 8, 'weight': Decimal('60.00')})
+        self.assertRedirects(self.log_step(0), self.url, fetch_redirect_response=False)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.log_step(1)
+        statements = [query['sql'] for query in queries]
+        self.assertFalse(any('"WorkoutApp_workout_exercises"' in sql or 'FROM "WorkoutApp_workout"' in sql for sql in statements))
+        self.assertEqual(len([sql for sql in statements if sql.startswith('INSERT INTO "WorkoutApp_exerciseprogress"')]), 1)
+
+        response = self.client.post(self.url, {'step': 2, 'action': 'skip'})
+        self.assertRedirects(response, reverse('workout_summary', args=[self.workout.id]), fetch_redirect_response=False)
+        self.workout.refresh_from_db()
+        self.assertTrue(self.workout.completed)
+        self.assertEqual(list(ExerciseProgress.objects.filter(workout=self.workout).order_by('id').values_list('exercise__name', flat=True)), ['Row', 'Squat'])
+        self.assertIsNone(GuidedSession.load(self.user.id, self.workout.id))
+
+    def test_resumes_after_the_cached_state_is_lost(self):
+        self.client.get(self.url)
+        self.log_step(0)
+        caching.get_cache().clear()
+        self.assertContains(self.client.get(self.url), 'Step 2 of 3: Squat')
+        self.assertContains(self.client.get(self.url, {'restart': 1}), 'Step 1 of 3: Row')
+
+    def test_resubmitted_step_is_not_logged_against_the_next_one(self):
+        self.client.get(self.url)
+        self.log_step(0, weight=100)
+        self.assertRedirects(self.log_step(0, weight=100), self.url, fetch_redirect_response=False)
+        self.assertEqual(list(ExerciseProgress.objects.filter(workout=self.workout).values_list('exercise__name', flat=True)), ['Row'])
+        self.assertContains(self.client.get(self.url), 'Step 2 of 3: Squat')
+
+        # Still rejected once the cached state is gone and the session resumes
+        caching.get_cache().clear()
+        self.log_step(0, weight=100)
+        self.assertEqual(ExerciseProgress.objects.filter(workout=self.workout).count(), 1)
+
+    def test_other_users_cannot_start(self):
+        other = User.objects.create_user(username='other', password='testpassword')
+        self.client.force_login(other)
+        self.assertRedirects(self.client.get(self.url), reverse('home'), fetch_redirect_response=False)
+
+    def test_edit_plan(self):
+        steps = plan_steps(self.workout.id)
+        data = {'form-TOTAL_FORMS': 3, 'form-INITIAL_FORMS': 3}
+        for index, (step, position) in enumerate(zip(steps, (3, 1, 2))):
+            data.update({'form-%d-id' % index: step.id, 'form-%d-position' % index: position, 'form-%d-target_sets' % index: 4})
+        response = self.client.post(reverse('edit_workout_plan', args=[self.workout.id]), data)
+        self.assertRedirects(response, reverse('workout_detail', args=[self.workout.id]), fetch_redirect_response=False)
+        self.assertEqual([(step.exercise.name, step.target_sets) for step in plan_steps(self.workout.id)], [('Squat', 4), ('Bench', 4), ('Row', 4)])
+
+    def post_plan(self, workout, **values):
+        data = {'form-TOTAL_FORMS': 0, 'form-INITIAL_FORMS': 0}
+        for index, step in enumerate(plan_steps(workout.id)):
+            data.update({'form-%d-id' % index: step.id, 'form-%d-position' % index: index, **{'form-%d-%s' % (index, key): value for key, value in values.items()}})
+            data['form-TOTAL_FORMS'] = data['form-INITIAL_FORMS'] = index + 1
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('edit_workout_plan', args=[workout.id]), data)
+        return response, [query['sql'] for query in queries if query['sql'].startswith('SELECT')]
+
+    def test_edit_plan_reads_do_not_grow_with_the_plan(self):
+        response, short = self.post_plan(self.workout, target_sets=5)
+        self.assertEqual(response.status_code, 302)
+        exercise_type = self.exercises[0].type
+        append_to_plan(self.workout, [Exercise.objects.create(name='Extra %d' % number, type=exercise_type, description='') for number in range(5)])
+        response, long = self.post_plan(self.workout, target_sets=6)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len(long), len(short))
+        self.assertEqual({step.target_sets for step in plan_steps(self.workout.id)}, {6})
+
+    def test_edit_plan_rejects_rows_of_other_workouts(self):
+        other = Workout.objects.create(profile=self.profile, name='Other', duration=30)
+        append_to_plan(other, [self.exercises[0]])
+        foreign = plan_steps(other.id)[0]
+        data = {'form-TOTAL_FORMS': 1, 'form-INITIAL_FORMS': 1, 'form-0-id': foreign.id, 'form-0-position': 0, 'form-0-target_sets': 9}
+        response = self.client.post(reverse('edit_workout_plan', args=[self.workout.id]), data)
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(WorkoutExercise.objects.get(pk=foreign.id).target_sets)
+
+
+class WorkoutTemplateTests(ClearCachesMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='coach', password='testpassword')
+        self.profile = self.user.profile
+        exercise_type = ExerciseType.objects.create(name='Strength', description='')
+        self.exercises = [Exercise.objects.create(name='Lift %d' % index, type=exercise_type, description='') for index in range(5)]
+        self.workout = Workout.objects.create(profile=self.profile, name='Push day', duration=45)
+        append_to_plan(self.workout, [self.exercises[3], self.exercises[1]])
+        WorkoutExercise.objects.filter(workout=self.workout, exercise=self.exercises[3]).update(target_sets=5, target_repetitions=5, target_weight=100)
+
+    def make_template(self, count):
+        template = WorkoutTemplate.objects.create(profile=self.profile, name='Program', duration=30)
+        TemplateExercise.objects.bulk_create([TemplateExercise(template=template, exercise=exercise, position=index) for index, exercise in enumerate(self.exercises[:count])])
+        return template
+
+    def test_round_trip_keeps_order_and_targets(self):
+        template = save_as_template(self.workout, public=True)
+        other = User.objects.create_user(username='athlete', password='testpassword').profile
+        workout = clone_template(template, other, datetime.date(2026, 1, 5))
+        self.assertEqual((workout.profile, workout.name, workout.duration, workout.date), (other, 'Push day', 45, datetime.date(2026, 1, 5)))
+        self.assertEqual(
+            [(step.exercise, step.target_sets, step.target_weight) for step in plan_steps(workout.id)],
+            [(self.exercises[3], 5, Decimal('100.00')), (self.exercises[1], None, None)],
+        )
+
+    def test_clone_query_count_does_not_grow_with_the_plan(self):
+        counts = []
+        for size in (1, 5):
+            template = self.make_template(size)
+            with CaptureQueriesContext(connection) as queries:
+                clone_template(template, self.profile)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_program_dates(self):
+        monday = datetime.date(2026, 1, 5)
+        self.assertEqual(program_dates(monday, 2), [monday, monday + datetime.timedelta(days=7)])
+        # Starting on a Wednesday, that week's Monday is skipped and the third week's Monday included
+        dates = program_dates(monday + datetime.timedelta(days=2), 2, [0, 2, 4])
+        self.assertEqual([date.isoformat() for date in dates], ['2026-01-07', '2026-01-09', '2026-01-12', '2026-01-14', '2026-01-16', '2026-01-19'])
+
+    def test_schedule_program_batches_and_skips_existing(self):
+        template = self.make_template(3)
+        profiles = [User.objects.create_user(username='member%d' % index, password='testpassword').profile.id for index in range(4)]
+        start = datetime.date(2026, 1, 5)
+
+        with CaptureQueriesContext(connection) as queries:
+            created = schedule_program(template, profiles, start, 12, [0, 3], batch_size=50)
+        self.assertEqual(created, 4 * 24)
+        # Two profiles' 48 workouts fit a batch of 50, so each batch is one workout insert and 144 steps in three inserts
+        inserts = [query['sql'] for query in queries if query['sql'].startswith('INSERT')]
+        self.assertEqual(len(inserts), 8)
+        workouts = Workout.objects.filter(profile_id__in=profiles)
+        self.assertEqual(workouts.count(), 96)
+        self.assertEqual(WorkoutExercise.objects.filter(workout__in=workouts).count(), 96 * 3)
+        self.assertEqual(plan_steps(workouts.first().id)[0].exercise, self.exercises[0])
+
+        Workout.objects.filter(profile_id=profiles[0], date=start).delete()
+        self.assertEqual(schedule_program(template, profiles, start, 12, [0, 3]), 1)
+
+    def test_browse_and_use_templates(self):
+        shared = save_as_template(self.workout, public=True)
+        private = save_as_template(self.workout)
+        other = User.objects.create_user(username='athlete', password='testpassword')
+        self.client.force_login(other)
+
+        response = self.client.get(reverse('browse_workouts'))
+        self.assertEqual(list(response.context['object_list']), [shared])
+        self.assertEqual(self.client.post(reverse('use_template', args=[private.id])).status_code, 404)
+
+        response = self.client.post(reverse('use_template', args=[shared.id]), {'date': '2026-02-01'})
+        workout = Workout.objects.get(profile=other.profile)
+        self.assertRedirects(response, reverse('workout_detail', args=[workout.id]), fetch_redirect_response=False)
+        self.assertEqual(workout.date, datetime.date(2026, 2, 1))
+        self.assertEqual(workout.exercises.count(), 2)
+
+    def test_only_the_owner_can_save_a_template(self):
+        other = User.objects.create_user(username='athlete', password='testpassword')
+        self.client.force_login(other)
+        self.client.post(reverse('save_workout_as_template', args=[self.workout.id]), {'public': '1'})
+        self.assertFalse(WorkoutTemplate.objects.exists())
+
+        self.client.force_login(self.user)
+        self.client.post(reverse('save_workout_as_template', args=[self.workout.id]), {'public': '1'})
+        self.assertTrue(WorkoutTemplate.objects.get().public)
+
+    def test_schedule_program_command(self):
+        template = self.make_template(2)
+        out = io.StringIO()
+        call_command('schedule_program', template.id, '--start', '2026-01-05', '--weeks', '4', '--day', 'mon', '--day', 'thu', '--profile', self.profile.id, stdout=out)
+        self.assertIn('Scheduled 8 workouts', out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('schedule_program', template.id + 100)
@@ -0,0 +1,173 @@
+import datetime
+import math
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .caching import MISSING, get_cache
+from .models import ProfileHistory
+
+try:
+    import numpy
+except ImportError:  # The trend falls back to plain Python, which gives the same numbers more slowly
+    numpy = None
+
+DEFAULT_WINDOW = 7
+DEFAULT_SPAN = 10
+DAILY_AFTER_DAYS = 30
+WEEKLY_AFTER_DAYS = 180
+
+
+def record_sample(profile):
+    # Profile saves only add history when height or weight actually moved. The form hands over floats,
+    # so they are compared as the decimals the columns would store.
+    sample = tuple(ProfileHistory._meta.get_field(name).to_python(getattr(profile, name)) for name in ('height', 'weight'))
+    latest = ProfileHistory.objects.filter(profile=profile).order_by('-date_recorded', '-id').values_list('height', 'weight').first()
+    if sample == (latest or (None, None)):
+        return None
+    return ProfileHistory.objects.create(profile=profile, height=sample[0], weight=sample[1])
+
+
+def bucket_for(date, today, daily_after, weekly_after):
+    age = (today - date).days
+    if age >= weekly_after:
+        return date - datetime.timedelta(days=date.weekday())
+    if age >= daily_after:
+        return date
+    return None
+
+
+def mean(values):
+    values = [value for value in values if value is not None]
+    return round(sum(values) / len(values), 2) if values else None
+
+
+def compact_history(profile_id, today=None, daily_after=DAILY_AFTER_DAYS, weekly_after=WEEKLY_AFTER_DAYS):
+    # Samples older than `daily_after` days collapse to one point per day and those older than `weekly_after`
+    # to one per week. Each bucket keeps its latest row, updated to the bucket's mean height and weight.
+    today = today or timezone.localdate()
+    rows = ProfileHistory.objects.filter(
+        profile_id=profile_id, date_recorded__lte=today - datetime.timedelta(days=daily_after),
+    ).order_by('date_recorded', 'id').values_list('id', 'date_recorded', 'height', 'weight')
+
+    buckets = {}
+    for row in rows:
+        buckets.setdefault(bucket_for(row[1], today, daily_after, weekly_after), []).append(row)
+
+    deleted = []
+    with transaction.atomic():
+        for bucket, samples in buckets.items():
+            if len(samples) < 2:
+                continue
+            keep = samples[-1]
+            height, weight = mean(sample[2] for sample in samples), mean(sample[3] for sample in samples)
+            if (height, weight) != (keep[2], keep[3]):
+                ProfileHistory.objects.filter(pk=keep[0]).update(height=height, weight=weight)
+            deleted.extend(sample[0] for sample in samples[:-1])
+        for start in range(0, len(deleted), 500):
+            ProfileHistory.objects.filter(pk__in=deleted[start:start + 500]).delete()
+        # QuerySet.update() skips the signals, so the cached trend is dropped here
+        invalidate_trend(profile_id)
+    return len(deleted)
+
+
+def rolling_mean(values, window):
+    if numpy is not None:
+        totals = numpy.cumsum(numpy.insert(values, 0, 0.0))
+        counts = numpy.minimum(numpy.arange(1, len(values) + 1), window)
+        ends = numpy.arange(1, len(values) + 1)
+        return (totals[ends] - totals[ends - counts]) / counts
+    averages = []
+    total = 0.0
+    for index, value in enumerate(values):
+        total += value
+        if index >= window:
+            total -= values[index - window]
+        averages.append(total / min(index + 1, window))
+    return averages
+
+
+def ewma(values, alpha):
+    # ewma[k] = decay * ewma[k-1] + alpha * x[k], seeded with x[0]. With NumPy the recurrence is unrolled into
+    # decay**(k+1) * seed + alpha * decay**k * cumsum(x / decay**j), in blocks short enough that decay**-j cannot overflow.
+    decay = 1.0 - alpha
+    if numpy is None or decay <= 0:
+        averages = []
+        previous = values[0] if len(values) else 0.0
+        for value in values:
+            previous = decay * previous + alpha * value
+            averages.append(previous)
+        return averages
+
+    block = max(1, int(600 / -math.log(decay)))
+    averages = numpy.empty(len(values))
+    previous = values[0] if len(values) else 0.0
+    for start in range(0, len(values), block):
+        chunk = values[start:start + block]
+        powers = decay ** numpy.arange(len(chunk))
+        averages[start:start + len(chunk)] = decay * powers * previous + alpha * powers * numpy.cumsum(chunk / powers)
+        previous = averages[start + len(chunk) - 1]
+    return averages
+
+
+def weekly_rate(smoothed, days):
+    # Change in the smoothed weight per 7 days between consecutive samples; None where the days coincide
+    if numpy is not None:
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            rates = numpy.diff(smoothed) * 7 / numpy.diff(days)
+        return [None] + [None if math.isinf(rate) or math.isnan(rate) else rate for rate in rates.tolist()]
+    rates = [None]
+    for index in range(1, len(smoothed)):
+        elapsed = days[index] - days[index - 1]
+        rates.append((smoothed[index] - smoothed[index - 1]) * 7 / elapsed if elapsed else None)
+    return rates
+
+
+def rounded(values):
+    return [None if value is None else round(float(value), 2) for value in values]
+
+
+def compute_trend(dates, weights, window=DEFAULT_WINDOW, span=DEFAULT_SPAN):
+    # Column-oriented like analytics.progress_series, so the chart hands each list to a dataset
+    series = {'labels': [date.isoformat() for date in dates], 'weight': rounded(weights), 'average': [], 'ewma': [], 'rate': []}
+    if not weights:
+        return series
+    ordinals = [date.toordinal() for date in dates]
+    if numpy is not None:
+        weights, ordinals = numpy.asarray(weights, dtype=float), numpy.asarray(ordinals, dtype=float)
+    smoothed = ewma(weights, 2.0 / (span + 1))
+    series['average'] = rounded(rolling_mean(weights, window))
+    series['ewma'] = rounded(smoothed)
+    series['rate'] = rounded(weekly_rate(smoothed, ordinals))
+    return series
+
+
+def trend_key(profile_id):
+    return 'weight_trend:%s' % profile_id
+
+
+def weight_trend(profile_id):
+    cache = get_cache()
+    series = cache.get(trend_key(profile_id), MISSING)
+    if series is MISSING:
+        rows = list(ProfileHistory.objects.filter(profile_id=profile_id, weight__isnull=False).order_by('date_recorded', 'id').values_list('date_recorded', 'weight'))
+        series = compute_trend(
+            [date for date, weight in rows], [float(weight) for date, weight in rows],
+            getattr(settings, 'WEIGHT_TREND_WINDOW', DEFAULT_WINDOW), getattr(settings, 'WEIGHT_TREND_SPAN', DEFAULT_SPAN),
+        )
+        cache.set(trend_key(profile_id), series, None)
+    return series
+
+
+def invalidate_trend(profile_id):
+    get_cache().delete(trend_key(profile_id))
+    transaction.on_commit(lambda: get_cache().delete(trend_key(profile_id)))
+
+
+@receiver(post_save, sender=ProfileHistory)
+@receiver(post_delete, sender=ProfileHistory)
+def invalidate_profile_trend(sender, instance, **kwargs):
+    invalidate_trend(instance.profile_id)
@@ -1,13 +1,17 @@
-from django.urls import path
+from django.conf import settings
+from django.urls import include, path
 from django.contrib.auth import views as auth_views
-from . import views
+from . import api, async_views, views
 from .views import UserRegisterView, UserUpdateView, UserDeleteView, DeleteExerciseView, PublicWorkoutListView
 
+# The hot read views have async twins for ASGI deployments
+read_views = async_views if settings.ASYNC_READ_VIEWS else views
+
 urlpatterns = [
 
     # Profile
     path('register/', views.UserRegisterView.as_view(), name='register'),
-    path('login/', auth_views.LoginView.as_view(template_name='login.html'), name='login'),
+    path('login/', views.LoginView.as_view(), name='login'),
     path('logout/', auth_views.LogoutView.as_view(next_page='/'), name='logout'),
     path('profile/<int:pk>/', views.UserDetailView.as_view(), name='profile'),
     path('profile/update/<int:pk>/', views.ProfileUpdateView.as_view(), name='profile_update'),
@@ -16,12 +20,14 @@ urlpatterns = [
 
     # Workouts
     path('workout/new/', views.WorkoutCreateView.as_view(), name='workout_create'),
-    path('workout/<int:pk>/', views.WorkoutDetailView.as_view(), name='workout_detail'),
+    path('workout/<int:pk>/', read_views.WorkoutDetailView.as_view(), name='workout_detail'),
     path('workout/<int:pk>/update/', views.WorkoutUpdateView.as_view(), name='workout_update'),
     path('workout/<int:pk>/delete/', views.WorkoutDeleteView.as_view(), name='workout_delete'),
     path('workout/<int:workout_id>/add_exercises/', views.add_exercises_to_workout, name='add_exercises_to_workout'),
-    path('profile/<int:profile_id>/workouts/', views.WorkoutListView.as_view(), name='workout_list'),
+    path('profile/<int:profile_id>/workouts/', read_views.WorkoutListView.as_view(), name='workout_list'),
     path('browse_workouts/', PublicWorkoutListView.as_view(), name='browse_workouts'),
+    path('workout/<int:workout_id>/save_template/', views.save_workout_as_template, name='save_workout_as_template'),
+    path('template/<int:template_id>/use/', views.use_template, name='use_template'),
     path('workout/edit/<int:pk>/', views.EditWorkoutView.as_view(), name='edit_workout'),
     path('workout/<int:pk>/complete/', views.complete_workout, name='complete_workout'),
     path('workout/<int:workout_id>/track/', views.track_workout_progress, name='track_workout_progress'),
@@ -29,6 +35,7 @@ urlpatterns = [
 
     # Individual Exercises
     path('profile/<int:profile_id>/exercises/', views.exercise_list, name='exercise_list'),
+    path('exercise/search/', views.exercise_search, name='exercise_search'),
     path('exercise/<int:exercise_id>/from-workout/<int:workout_id>/', views.exercise_detail, name='exercise_detail'),
     path('exercise/create/<int:profile_id>/<int:workout_id>/', views.exercise_create, name='exercise_create_from_workout'),
     path('exercise/create/<int:profile_id>/', views.exercise_create, name='exercise_create'),
@@ -37,5 +44,18 @@ urlpatterns = [
 
     # Exercise progress
     path('workout/<int:workout_id>/exercise/<int:exercise_id>/progress/', views.exercise_progress_create, name='exercise_progress_create'),
-    path('workout/<int:pk>/summary/', views.workout_summary, name='workout_summary'),
+    path('workout/<int:pk>/summary/', read_views.workout_summary, name='workout_summary'),
+    path('workout/<int:workout_id>/log/', views.workout_log, name='workout_log'),
+    path('workout/<int:workout_id>/plan/', views.edit_workout_plan, name='edit_workout_plan'),
+    path('workout/<int:workout_id>/guided/', views.guided_session, name='guided_session'),
+    path('workout/<int:workout_id>/log.json', views.workout_log_json, name='workout_log_json'),
+    path('progress/', views.get_workout_data, name='progress'),
+    path('progress/data/', read_views.progress_data, name='progress_data'),
+    path('progress/weight/', views.weight_trend_data, name='weight_trend_data'),
+    path('summary/daily/', views.daily_summary, name='daily_summary'),
+    path('export/', views.export_history, name='export_history'),
+    path('import/', views.import_history, name='import_history'),
+
+    # JSON API
+    path('api/%s/' % api.API_VERSION, include(api)),
 ]
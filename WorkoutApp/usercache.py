@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .caching import MISSING, get_cache
+from .models import Profile
+
+# The signed-in user's row is read from the database on every request, so a password change, a
+# deactivation or a deletion ends that user's sessions in every worker at once; the password hash
+# is never cached. With a cache shared between worker processes (SHARED_CACHE) the profile comes
+# from it, where one invalidation reaches every worker. Without one, a per-process copy could stay
+# stale in the other workers, so the profile is joined onto the user query instead.
+
+
+def profile_key(user_id):
+    return 'profile:user:%s' % user_id
+
+
+def load_user(user_id):
+    if not getattr(settings, 'SHARED_CACHE', False):
+        return User.objects.select_related('profile').filter(pk=user_id).first()
+    user = User.objects.filter(pk=user_id).first()
+    if user is None:
+        return None
+    cache = get_cache()
+    profile = cache.get(profile_key(user_id), MISSING)
+    if profile is MISSING:
+        profile = Profile.objects.filter(user_id=user_id).first()
+        if profile is None:
+            return user
+        cache.set(profile_key(user_id), profile, getattr(settings, 'USER_CACHE_TIMEOUT', 60))
+    user.profile = profile
+    return user
+
+
+def invalidate_profile(user_id):
+    # Now, so the rest of this request sees the change, and again after the commit, so a concurrent
+    # request cannot leave the old row cached
+    get_cache().delete(profile_key(user_id))
+    transaction.on_commit(lambda: get_cache().delete(profile_key(user_id)))
+
+
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def invalidate_saved_profile(sender, instance, **kwargs):
+    invalidate_profile(instance.user_id)
@@ -1,30 +1,48 @@
+import datetime
+import gzip
+import json
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import authenticate, login
 from django.contrib.auth.models import User
-from django.contrib.auth.forms import UserCreationForm
+from django.contrib.auth import views as auth_views
 from django.views.generic import CreateView, UpdateView, DeleteView, DetailView, ListView
 from django.shortcuts import render, get_object_or_404, redirect
-from django.http import HttpResponseRedirect
+from django.template.loader import render_to_string
+from django.conf import settings
+from django.http import HttpResponseBadRequest, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_POST
 from django.urls import reverse, reverse_lazy
-from .models import Profile, Exercise, ExerciseType, Workout, ExerciseProgress, ProfileHistory
-from .forms import ProfileForm, ExerciseForm, WorkoutForm, ExerciseProgressForm, ExerciseSelectionForm, WorkoutProgressForm
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.db.models import Q
+from .models import Profile, Exercise, ExerciseType, Workout, ExerciseProgress, WorkoutExercise, WorkoutTemplate
+from .forms import ProfileForm, ExerciseForm, WorkoutForm, ExerciseProgressForm, ExerciseSelectionForm, WorkoutProgressForm, ExerciseLogForm, ExerciseLogFormSet, ImportHistoryForm, RegisterForm, WorkoutPlanFormSet
+from .analytics import MAX_POINTS, METRICS, MIN_POINTS, PERIODS, progress_series
+from .rollups import rollup_summary
+from .trends import record_sample, weight_trend
+from .progress import log_exercise, log_workout
+from .pagination import MAX_PAGE_SIZE, KeysetPaginationMixin, keyset_paginate
+from .search import search_exercises
+from .caching import cached_for_user
+from .guided import GuidedSession, append_to_plan, plan_steps
+from .programs import clone_template, save_as_template
+from .exports import DATASETS, FORMATS, export_chunks, export_filename
+from .imports import import_history as import_rows, source_for as import_source
+from workout_app.querylog import allow_repeated_queries
+from workout_app.routers import analytics_view
 
 class UserRegisterView(CreateView):
     model = User
-    form_class = UserCreationForm
+    form_class = RegisterForm
     template_name = 'registration/register.html'
 
     def form_valid(self, form):
+        # A full hash pool raises HashPoolBusy, which HashPoolBusyMiddleware answers with a 503
         response = super().form_valid(form)
-        username = form.cleaned_data.get('username')
-        raw_password = form.cleaned_data.get('password1')
-        user = authenticate(self.request, username=username, password=raw_password)
-        if user is not None:
-            login(self.request, user)
-            messages.success(self.request, 'Registration successful')
-        else:
-            messages.error(self.request, 'Registration unsuccessful. Please try again.')
+        # The new account's password was just set, so log it in without hashing the password a second time
+        login(self.request, self.object, backend=settings.AUTHENTICATION_BACKENDS[0])
+        messages.success(self.request, 'Registration successful')
         return response
 
     def form_invalid(self, form):
@@ -35,6 +53,9 @@ class UserRegisterView(CreateView):
     def get_success_url(self):
         return reverse('profile_update', kwargs={'pk': self.object.profile.pk})
     
+class LoginView(auth_views.LoginView):
+    template_name = 'login.html'
+
 class ProfileUpdateView(UpdateView):
     model = Profile
     form_class = ProfileForm
@@ -43,7 +64,7 @@ class ProfileUpdateView(UpdateView):
 
     def form_valid(self, form):
         response = super().form_valid(form)
-        ProfileHistory.objects.create(profile=self.object, height=self.object.height, weight=self.object.weight)
+        record_sample(self.object)
         return response
 
 class UserDetailView(DetailView):
@@ -72,7 +93,7 @@ class WorkoutCreateView(CreateView):
     template_name = 'workout_create.html'
 
     def form_valid(self, form):
-        form.instance.profile = Profile.objects.get(user=self.request.user)
+        form.instance.profile = self.request.user.profile
         return super().form_valid(form)
 
     def get_success_url(self):
@@ -84,12 +105,20 @@ class WorkoutDetailView(DetailView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        workout = get_object_or_404(Workout, pk=self.kwargs['pk'])
-        
-        # Fetching exercise progress for this workout and user
-        exercise_progresses = ExerciseProgress.objects.filter(workout=workout, profile=self.request.user.profile)
-        
-        context['exercise_progresses'] = exercise_progresses
+        workout = self.object
+
+        def build():
+            # The plan in order, each step with its exercise, in one query
+            steps = plan_steps(workout.id)
+
+            # Map each exercise to its latest progress for this workout and user in a single query
+            exercise_progresses = {}
+            progresses = ExerciseProgress.objects.filter(workout=workout, profile=self.request.user.profile).order_by('date', 'id')
+            for progress in progresses:
+                exercise_progresses[progress.exercise_id] = progress
+            return {'steps': steps, 'exercises': [step.exercise for step in steps], 'exercise_progresses': exercise_progresses}
+
+        context.update(cached_for_user('workout_detail', self.request.user.id, workout.id, build))
         return context
 
 class WorkoutUpdateView(UpdateView):
@@ -106,9 +135,10 @@ class WorkoutDeleteView(DeleteView):
     def get_success_url(self):
         return reverse('workout_list', args=[self.request.user.profile.id])
 
-class WorkoutListView(ListView):
+class WorkoutListView(KeysetPaginationMixin, ListView):
     model = Workout
     template_name = 'workout_list.html'
+    keyset_ordering = ('-date', '-id')
 
     def get_queryset(self):
         # Return only the workouts that belong to the user's profile and haven't been completed yet
@@ -135,16 +165,42 @@ class DeleteExerciseView(DeleteView):
         profile_id = self.object.profile.id
         return reverse('exercise_list', args=[profile_id])
 
-class PublicWorkoutListView(ListView):
-    model = Workout
+@analytics_view
+class PublicWorkoutListView(KeysetPaginationMixin, ListView):
+    model = WorkoutTemplate
     template_name = 'public_workout_list.html'
 
     def get_queryset(self):
-        return Workout.objects.filter(public=True)
+        return WorkoutTemplate.objects.filter(public=True).select_related('profile__user')
+
+@login_required
+def save_workout_as_template(request, workout_id):
+    # A confirmation page rather than a form on the detail page, which is cached and so cannot carry a CSRF token
+    workout = get_object_or_404(Workout, pk=workout_id)
+    if request.user.profile.id != workout.profile_id:
+        messages.error(request, "You don't have permission to share this workout.")
+        return redirect('home')
+    if request.method == 'POST':
+        save_as_template(workout, public=bool(request.POST.get('public')))
+        messages.success(request, 'Saved "%s" as a template.' % workout.name)
+        return redirect('browse_workouts')
+    return render(request, 'workout_template_confirm.html', {'workout': workout})
+
+@login_required
+@require_POST
+def use_template(request, template_id):
+    profile = request.user.profile
+    template = get_object_or_404(WorkoutTemplate.objects.filter(Q(public=True) | Q(profile=profile)), pk=template_id)
+    try:
+        date = parse_date(request.POST.get('date', ''))
+    except ValueError:
+        date = None
+    workout = clone_template(template, profile, date)
+    return redirect('workout_detail', workout.id)
 
 def home(request):
-    profiles = Profile.objects.all()
     if request.user.is_authenticated:
+        profiles = keyset_paginate(request, Profile.objects.select_related('user'), ('id',))
         return render(request, 'home.html', {'profiles': profiles})
     else:
         return redirect('login')
@@ -179,16 +235,29 @@ def add_exercises_to_workout(request, workout_id):
     if request.method == 'POST':
         form = ExerciseSelectionForm(request.POST)
         if form.is_valid():
-            exercises = form.cleaned_data['exercises']
-            workout.exercises.add(*exercises)
+            append_to_plan(workout, form.cleaned_data['exercises'])
             return HttpResponseRedirect(reverse('workout_detail', args=(workout.id,)))
     else:
         form = ExerciseSelectionForm()
     return render(request, 'add_exercises_to_workout.html', {'form': form, 'workout': workout, 'some_profile_id': request.user.profile.id, 'current_workout_id': workout_id})
 
 def exercise_list(request, profile_id):
-    exercises = Exercise.objects.all()
-    return render(request, 'exercise_list.html', {'exercises': exercises})
+    query = request.GET.get('q', '').strip()
+    if query:
+        profile = request.user.profile if request.user.is_authenticated else None
+        exercises = search_exercises(query, profile, limit=MAX_PAGE_SIZE)
+        return render(request, 'exercise_list.html', {'exercises': exercises, 'query': query})
+    exercises = keyset_paginate(request, Exercise.objects.select_related('type'), ('id',))
+    return render(request, 'exercise_list.html', {'exercises': exercises.object_list, 'page': exercises})
+
+def exercise_search(request):
+    try:
+        limit = max(1, min(int(request.GET.get('limit', 10)), 50))
+    except ValueError:
+        return JsonResponse({'error': 'limit must be an integer'}, status=400)
+    profile = request.user.profile if request.user.is_authenticated else None
+    exercises = search_exercises(request.GET.get('q', ''), profile, limit)
+    return JsonResponse({'results': [{'id': exercise.id, 'name': exercise.name, 'type': exercise.type.name} for exercise in exercises]})
 
 def exercise_detail(request, exercise_id, workout_id):
     exercise = get_object_or_404(Exercise, pk=exercise_id)
@@ -237,17 +306,16 @@ def exercise_progress_create(request, workout_id, exercise_id):
             new_progress.workout = workout
             new_progress.exercise = current_exercise
             new_progress.profile = request.user.profile
-            new_progress.save()
 
-            # Get the IDs of exercises in the workout
-            exercise_ids = list(workout.exercises.values_list('id', flat=True))
+            for achievement in log_exercise(new_progress):
+                messages.success(request, achievement.title)
+
+            # The next step in plan order; guided_session walks the plan without re-reading it
+            plan = list(WorkoutExercise.objects.filter(workout=workout).order_by('position', 'id').values_list('exercise_id', flat=True))
             try:
-                # Find the index of current exercise
-                current_index = exercise_ids.index(current_exercise.id)
-                # Try to get the next exercise by ID
-                next_exercise_id = exercise_ids[current_index + 1]
+                next_exercise_id = plan[plan.index(current_exercise.id) + 1]
                 return redirect('exercise_progress_create', workout_id=workout.id, exercise_id=next_exercise_id)
-            except IndexError:
+            except (ValueError, IndexError):
                 # If current exercise is the last one
                 workout.completed = True  # Mark the workout as completed
                 workout.save()            # Save the workout instance
@@ -261,6 +329,114 @@ def exercise_progress_create(request, workout_id, exercise_id):
 
     return render(request, 'exercise_progress_create.html', {'form': form, 'exercise': current_exercise, 'workout': workout})
 
+@login_required
+def edit_workout_plan(request, workout_id):
+    workout = get_object_or_404(Workout, pk=workout_id)
+    if request.user.profile.id != workout.profile_id:
+        messages.error(request, "You don't have permission to edit this workout.")
+        return redirect('home')
+
+    queryset = WorkoutExercise.objects.filter(workout=workout).select_related('exercise').order_by('position', 'id')
+    formset = WorkoutPlanFormSet(request.POST or None, queryset=queryset)
+    if request.method == 'POST' and formset.is_valid():
+        formset.save()
+        return redirect('workout_detail', workout.id)
+    return render(request, 'workout_plan.html', {'formset': formset, 'workout': workout})
+
+@login_required
+def guided_session(request, workout_id):
+    session = GuidedSession.load(request.user.id, workout_id)
+    restart = request.method == 'GET' and 'restart' in request.GET
+    if session is None or restart:
+        workout = get_object_or_404(Workout, pk=workout_id)
+        if request.user.profile.id != workout.profile_id:
+            messages.error(request, "You don't have permission to log this workout.")
+            return redirect('home')
+        session = GuidedSession.start(request.user.id, workout, restart)
+        if not session.steps:
+            messages.error(request, 'Add exercises to this workout before starting it.')
+            return redirect('workout_detail', workout_id)
+        if session.finished:
+            session.finish()
+            return redirect('workout_summary', workout_id)
+
+    step = session.current
+    if request.method == 'POST':
+        if request.POST.get('step') != str(session.cursor):
+            # A resubmitted form, or one from another tab, is for a step we have already moved past
+            messages.info(request, 'That step was already recorded.')
+            return redirect('guided_session', workout_id)
+        form = ExerciseProgressForm(request.POST)
+        if request.POST.get('action') == 'skip':
+            session.skip()
+        elif form.is_valid():
+            for achievement in session.log(**form.cleaned_data):
+                messages.success(request, achievement.title)
+        else:
+            return render(request, 'guided_session.html', {'form': form, 'session': session, 'step': step, 'workout_id': workout_id})
+        if session.finished:
+            return redirect('workout_summary', workout_id)
+        return redirect('guided_session', workout_id)
+
+    form = ExerciseProgressForm(initial={'sets': step.target_sets, 'repetitions': step.target_repetitions, 'weight': step.target_weight})
+    return render(request, 'guided_session.html', {'form': form, 'session': session, 'step': step, 'workout_id': workout_id})
+
+@login_required
+def workout_log(request, workout_id):
+    workout = get_object_or_404(Workout, pk=workout_id)
+    profile = request.user.profile
+    if profile.id != workout.profile_id:
+        messages.error(request, "You don't have permission to log this workout.")
+        return redirect('home')
+
+    exercises = {step.exercise_id: step.exercise for step in plan_steps(workout.id)}
+    choices = [(exercise.id, exercise.name) for exercise in exercises.values()]
+
+    if request.method == 'POST':
+        formset = ExerciseLogFormSet(request.POST, form_kwargs={'exercise_choices': choices})
+        if formset.is_valid():
+            entries = [form.cleaned_data for form in formset if form.cleaned_data]
+            progresses, achievements = log_workout(workout, profile, entries, exercises)
+            for achievement in achievements:
+                messages.success(request, achievement.title)
+            return redirect('workout_summary', workout.id)
+    else:
+        formset = ExerciseLogFormSet(initial=[{'exercise': exercise_id} for exercise_id in exercises], form_kwargs={'exercise_choices': choices})
+
+    return render(request, 'workout_log.html', {'formset': formset, 'workout': workout})
+
+@login_required
+@require_POST
+def workout_log_json(request, workout_id):
+    workout = get_object_or_404(Workout, pk=workout_id)
+    profile = request.user.profile
+    if profile.id != workout.profile_id:
+        return JsonResponse({'error': "You don't have permission to log this workout."}, status=403)
+
+    try:
+        entries = json.loads(request.body)['entries']
+        if not isinstance(entries, list):
+            raise TypeError
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Expected a JSON object with an "entries" list.'}, status=400)
+    if len(entries) > ExerciseLogFormSet.max_num:
+        return JsonResponse({'error': 'At most %d entries per request.' % ExerciseLogFormSet.max_num}, status=400)
+
+    exercises = {step.exercise_id: step.exercise for step in plan_steps(workout.id)}
+    choices = [(exercise.id, exercise.name) for exercise in exercises.values()]
+    forms = [ExerciseLogForm(entry if isinstance(entry, dict) else {}, exercise_choices=choices) for entry in entries]
+    errors = {index: form.errors.get_json_data() for index, form in enumerate(forms) if not form.is_valid()}
+    if errors:
+        return JsonResponse({'errors': errors}, status=400)
+
+    progresses, achievements = log_workout(workout, profile, [form.cleaned_data for form in forms], exercises)
+    return JsonResponse({
+        'workout': workout.id,
+        'completed': workout.completed,
+        'logged': [progress.id for progress in progresses],
+        'achievements': [achievement.title for achievement in achievements],
+    }, status=201)
+
 def complete_workout(request, pk):
     workout = get_object_or_404(Workout, pk=pk)
 
@@ -289,6 +465,7 @@ def track_workout_progress(request, workout_id):
         form = WorkoutProgressForm()
     return render(request, 'track_workout_progress.html', {'form': form, 'workout': workout})
 
+@analytics_view
 def workout_summary(request, pk):
     workout = get_object_or_404(Workout, pk=pk)
 
@@ -296,25 +473,107 @@ def workout_summary(request, pk):
         messages.error(request, "You don't have permission to view this workout.")
         return redirect('home')  # Redirect to a fallback view or page
     
-    exercises_progress = workout.exerciseprogress_set.all()  # Fetching all ExerciseProgress records related to the workout
+    def build():
+        exercises_progress = workout.exerciseprogress_set.select_related('exercise')  # The fragment prints each row's exercise name
+        return render_to_string('workout_summary_fragment.html', {'workout': workout, 'exercises_progress': exercises_progress})
 
     context = {
         'workout': workout,
-        'exercises_progress': exercises_progress
+        'summary': cached_for_user('workout_summary', request.user.id, workout.id, build),
     }
     return render(request, 'workout_summary.html', context)
 
+def parse_progress_filters(request):
+    period = request.GET.get('period', 'day')
+    if period not in PERIODS:
+        raise ValueError('period must be one of: %s' % ', '.join(PERIODS))
+
+    filters = {'period': period}
+    for name in ('start', 'end'):
+        value = request.GET.get(name)
+        if value:
+            parsed = parse_date(value)
+            if parsed is None:
+                raise ValueError('%s must be a date in YYYY-MM-DD format' % name)
+            filters[name] = parsed
+
+    exercise_id = request.GET.get('exercise')
+    if exercise_id:
+        if not exercise_id.isdigit():
+            raise ValueError('exercise must be an exercise id')
+        filters['exercise_id'] = int(exercise_id)
+
+    points = request.GET.get('points')
+    if points:
+        if not points.isdigit() or not MIN_POINTS <= int(points) <= MAX_POINTS:
+            raise ValueError('points must be a number from %d to %d' % (MIN_POINTS, MAX_POINTS))
+        filters['points'] = int(points)
+        metric = request.GET.get('metric', 'volume')
+        if metric not in METRICS:
+            raise ValueError('metric must be one of: %s' % ', '.join(METRICS))
+        filters['metric'] = metric
+    return filters
+
+@login_required
+@analytics_view
 def get_workout_data(request):
-    # Fetch the data from the ExerciseProgress model.
-    workout_data = ExerciseProgress.objects.filter(user=request.user)
-
-    # Aggregate the data. For simplicity, we are aggregating the count of exercises per day.
-    aggregated_data = {}
-    for entry in workout_data:
-        date = entry.date.strftime('%Y-%m-%d')  # Format the date as a string.
-        if date in aggregated_data:
-            aggregated_data[date] += 1
-        else:
-            aggregated_data[date] = 1
+    exercises = Exercise.objects.filter(exerciseprogress__profile=request.user.profile).distinct().order_by('name')
+    return render(request, 'progress.html', {'exercises': exercises, 'periods': list(PERIODS)})
+
+@login_required
+@analytics_view
+def progress_data(request):
+    try:
+        filters = parse_progress_filters(request)
+    except ValueError as error:
+        return JsonResponse({'error': str(error)}, status=400)
+
+    return JsonResponse(progress_series(request.user.profile, **filters))
+
+@login_required
+def weight_trend_data(request):
+    # Served from the per-profile cache, so the chart costs the same however long the history is
+    return JsonResponse(weight_trend(request.user.profile.id))
+
+@login_required
+@analytics_view
+def daily_summary(request):
+    # Reads one pre-aggregated row per day instead of scanning the raw tracking tables
+    end = parse_date(request.GET.get('end', '')) or timezone.localdate()
+    start = parse_date(request.GET.get('start', '')) or end - datetime.timedelta(days=29)
+    rollups = rollup_summary(request.user.profile, start, end)
+    return render(request, 'daily_summary.html', {'rollups': rollups, 'start': start, 'end': end})
 
-    return render(request, 'progress.html', {'data': aggregated_data})
\ No newline at end of file
+@login_required
+def export_history(request):
+    export_format = request.GET.get('format', 'ndjson')
+    if export_format not in FORMATS:
+        return HttpResponseBadRequest('format must be one of: %s' % ', '.join(FORMATS))
+    datasets = request.GET.getlist('dataset') or list(DATASETS)
+    unknown = [dataset for dataset in datasets if dataset not in DATASETS]
+    if unknown:
+        return HttpResponseBadRequest('Unknown dataset: %s' % ', '.join(unknown))
+    compress = request.GET.get('compress') == 'gzip'
+
+    profile = request.user.profile
+    response = StreamingHttpResponse(
+        export_chunks(profile, datasets, export_format, compress),
+        content_type='application/gzip' if compress else FORMATS[export_format],
+    )
+    response['Content-Disposition'] = 'attachment; filename="%s"' % export_filename(profile, datasets, export_format, compress)
+    return response
+
+@login_required
+@allow_repeated_queries
+def import_history(request):
+    stats = None
+    form = ImportHistoryForm(request.POST or None, request.FILES or None)
+    if request.method == 'POST' and form.is_valid():
+        upload = form.cleaned_data['file']
+        name = upload.name[:-3] if upload.name.endswith('.gz') else upload.name
+        import_format = form.cleaned_data['format'] or ('csv' if name.endswith('.csv') else 'ndjson')
+        # Re-uploading the same file after a failure resumes it
+        source = import_source(upload.name, upload)
+        stream = gzip.GzipFile(fileobj=upload) if upload.name.endswith('.gz') else upload
+        stats = import_rows(request.user.profile, stream, import_format, source)
+    return render(request, 'import_history.html', {'form': form, 'stats': stats})
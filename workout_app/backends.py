@@ -1,16 +1,38 @@
 from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth import get_user_model
+from django.db.models import Value
+from django.db.models.functions import Lower
+
+from . import hashing
 
 class CaseInsensitiveModelBackend(ModelBackend):
     def authenticate(self, request, username=None, password=None, **kwargs):
         UserModel = get_user_model()
-        try:
-            user = UserModel.objects.get(username__iexact=username)  # case-insensitive comparison
-        except UserModel.DoesNotExist:
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        # LOWER(username) = ... can use the functional index from WorkoutApp migration 0007; iexact's LIKE cannot.
+        # Both sides are lowered by the database: SQLite's LOWER() only folds ASCII, so comparing it with
+        # str.lower() would lock out any username with a capitalised non-ASCII letter.
+        users = UserModel.objects.annotate(username_lower=Lower(UserModel.USERNAME_FIELD)).filter(username_lower=Lower(Value(username)))
+        # If several users differ only by case, use the oldest one. This is a rare case and can be handled differently if needed.
+        user = users.order_by('pk').first()
+        if user is None:
+            # Hash anyway, as ModelBackend does, so response time does not reveal which usernames exist
+            hashing.make_password(password)
             return None
-        except UserModel.MultipleObjectsReturned:
-            # If multiple objects are returned, get the first one. This is a rare case and can be handled differently if needed.
-            user = UserModel.objects.filter(username__iexact=username).first()
-        if user.check_password(password):
-            return user
-        return None
+        valid, must_update = hashing.check_password(password, user.password)
+        if not valid or not self.user_can_authenticate(user):
+            return None
+        if must_update:
+            # Upgrade hashes made with an older hasher or fewer iterations, as User.check_password() would
+            user.password = hashing.make_password(password)
+            user.save(update_fields=['password'])
+        return user
+
+    def get_user(self, user_id):
+        # Called by AuthenticationMiddleware for every signed-in request; the result is memoized on the request
+        from WorkoutApp.usercache import load_user
+        user = load_user(user_id)
+        return user if user is not None and self.user_can_authenticate(user) else None
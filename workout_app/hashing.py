@@ -0,0 +1,164 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.http import HttpResponse
+from django.utils.deprecation import MiddlewareMixin
+
+from .profiling import COLLECTORS, HISTOGRAMS, Histogram, latency_buckets
+
+
+class HashPoolBusy(Exception):
+    pass
+
+
+class HashPool:
+    # Runs password hashing on at most `workers` threads so a burst of logins cannot take every CPU
+    # from other requests. hashlib's PBKDF2 releases the GIL, so threads hash in parallel. At most
+    # `max_queue` calls wait for a thread; beyond that, callers get HashPoolBusy straight away.
+    def __init__(self, workers, max_queue, timeout):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash') if workers else None
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def run(self, operation, function, *args):
+        if self.executor is None:
+            return self.timed(operation, time.perf_counter(), function, *args)
+        with self.lock:
+            if self.pending >= self.workers + self.max_queue:
+                self.rejected += 1
+                raise HashPoolBusy('Too many password checks in progress')
+            self.pending += 1
+        try:
+            future = self.executor.submit(self.timed, operation, time.perf_counter(), function, *args)
+        except BaseException:
+            self.release()
+            raise
+        # The slot is held until the hash itself finishes or is cancelled, not until the caller stops waiting,
+        # so callers that time out cannot push the pool past workers + max_queue
+        future.add_done_callback(self.release)
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            future.cancel()
+            raise HashPoolBusy('Password check timed out waiting for the hash pool')
+
+    def release(self, future=None):
+        with self.lock:
+            self.pending -= 1
+
+    def timed(self, operation, submitted, function, *args):
+        started = time.perf_counter()
+        labels = (('operation', operation),)
+        HISTOGRAMS['hash_wait'].observe(labels, started - submitted)
+        with self.lock:
+            self.running += 1
+        try:
+            return function(*args)
+        finally:
+            HISTOGRAMS['hash'].observe(labels, time.perf_counter() - started)
+            with self.lock:
+                self.running -= 1
+                self.completed += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                'workers': self.workers,
+                'running': self.running,
+                'queued': max(0, self.pending - self.running),
+                'completed': self.completed,
+                'rejected': self.rejected,
+            }
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+
+
+HISTOGRAMS['hash_wait'] = Histogram('workout_password_hash_wait_seconds', 'Time a password hash waited for a pool thread.', latency_buckets())
+HISTOGRAMS['hash'] = Histogram('workout_password_hash_seconds', 'Time spent hashing a password.', latency_buckets())
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = HashPool(
+                    getattr(settings, 'PASSWORD_HASH_WORKERS', os.cpu_count() or 1),
+                    getattr(settings, 'PASSWORD_HASH_MAX_QUEUE', 64),
+                    getattr(settings, 'PASSWORD_HASH_TIMEOUT', 10),
+                )
+    return _pool
+
+
+def configure(workers, max_queue=64, timeout=10):
+    # Swap in a differently sized pool, e.g. for the login benchmark
+    global _pool
+    with _pool_lock:
+        previous, _pool = _pool, HashPool(workers, max_queue, timeout)
+    if previous is not None:
+        previous.shutdown()
+    return _pool
+
+
+def reset():
+    # Drop the pool; the next hash builds one from settings again
+    global _pool
+    with _pool_lock:
+        previous, _pool = _pool, None
+    if previous is not None:
+        previous.shutdown()
+
+
+def collect_metrics():
+    stats = _pool.stats() if _pool is not None else {'workers': 0, 'running': 0, 'queued': 0, 'completed': 0, 'rejected': 0}
+    return [
+        '# TYPE workout_password_hash_workers gauge', 'workout_password_hash_workers %d' % stats['workers'],
+        '# TYPE workout_password_hash_running gauge', 'workout_password_hash_running %d' % stats['running'],
+        '# TYPE workout_password_hash_queued gauge', 'workout_password_hash_queued %d' % stats['queued'],
+        '# TYPE workout_password_hash_completed_total counter', 'workout_password_hash_completed_total %d' % stats['completed'],
+        '# TYPE workout_password_hash_rejected_total counter', 'workout_password_hash_rejected_total %d' % stats['rejected'],
+    ]
+
+
+COLLECTORS.append(collect_metrics)
+
+
+class HashPoolBusyMiddleware(MiddlewareMixin):
+    # Any view that authenticates or sets a password (our login and registration, the admin's login) can
+    # find every hash thread taken and the queue full; ask the client to retry rather than pile on
+    def process_exception(self, request, exception):
+        if isinstance(exception, HashPoolBusy):
+            response = HttpResponse('Too many sign-ins right now, please try again in a moment.', status=503)
+            response['Retry-After'] = '1'
+            return response
+        return None
+
+
+def verify(password, encoded):
+    # Returns (valid, must_update): the setter only runs for a correct password hashed with an outdated hasher
+    outdated = []
+    valid = hashers.check_password(password, encoded, setter=outdated.append)
+    return valid, bool(outdated)
+
+
+def check_password(password, encoded):
+    return get_pool().run('verify', verify, password, encoded)
+
+
+def make_password(password):
+    return get_pool().run('hash', hashers.make_password, password)
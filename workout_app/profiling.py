@@ -0,0 +1,256 @@
+import bisect
+import contextlib
+import random
+import threading
+import time
+
+from asgiref.local import Local
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.http import Http404, HttpResponse
+from django.template.backends import django as django_backend
+
+# Prometheus' default latency buckets, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+_state = Local()
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series['buckets'][index] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    def reset(self):
+        with self.lock:
+            self.series = {}
+
+    def render(self):
+        lines = ['# HELP %s %s' % (self.name, self.help_text), '# TYPE %s histogram' % self.name]
+        with self.lock:
+            series = sorted(self.series.items())
+            for labels, values in series:
+                label_text = ','.join('%s="%s"' % (key, escape_label(value)) for key, value in labels)
+                cumulative = 0
+                for bound, count in zip(self.buckets, values['buckets']):
+                    cumulative += count
+                    lines.append('%s_bucket{%s,le="%s"} %d' % (self.name, label_text, format_bound(bound), cumulative))
+                lines.append('%s_bucket{%s,le="+Inf"} %d' % (self.name, label_text, values['count']))
+                lines.append('%s_sum{%s} %s' % (self.name, label_text, repr(float(values['sum']))))
+                lines.append('%s_count{%s} %d' % (self.name, label_text, values['count']))
+        return lines
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_bound(bound):
+    return repr(float(bound))
+
+
+def latency_buckets():
+    return getattr(settings, 'PROFILING_BUCKETS', DEFAULT_BUCKETS)
+
+
+# Per-process; each worker exposes its own series and Prometheus sums them across scrape targets
+HISTOGRAMS = {
+    'total': Histogram('workout_request_duration_seconds', 'Time spent handling the request.', latency_buckets()),
+    'db': Histogram('workout_request_db_seconds', 'Time spent executing SQL.', latency_buckets()),
+    'queries': Histogram('workout_request_queries', 'SQL queries executed.', QUERY_BUCKETS),
+    'templates': Histogram('workout_request_template_seconds', 'Time spent rendering templates.', latency_buckets()),
+}
+
+
+# Other modules add callables returning extra exposition lines (gauges, counters)
+COLLECTORS = []
+
+
+def reset_metrics():
+    for histogram in HISTOGRAMS.values():
+        histogram.reset()
+
+
+def render_metrics():
+    lines = []
+    for histogram in HISTOGRAMS.values():
+        lines.extend(histogram.render())
+    for collector in COLLECTORS:
+        lines.extend(collector())
+    return '\n'.join(lines) + '\n'
+
+
+class RequestProfile:
+    def __init__(self):
+        self.db_seconds = 0.0
+        self.queries = 0
+        self.template_seconds = 0.0
+        self.template_depth = 0
+
+    def execute(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_seconds += time.perf_counter() - start
+            self.queries += 1
+
+
+def current_profile():
+    return getattr(_state, 'profile', None)
+
+
+def timed_render(render):
+    # Only the outermost render is timed, so a render_to_string inside a rendered view is not counted twice
+    def wrapper(self, *args, **kwargs):
+        profile = current_profile()
+        if profile is None:
+            return render(self, *args, **kwargs)
+        profile.template_depth += 1
+        start = time.perf_counter()
+        try:
+            return render(self, *args, **kwargs)
+        finally:
+            profile.template_depth -= 1
+            if not profile.template_depth:
+                profile.template_seconds += time.perf_counter() - start
+    wrapper.profiled = True
+    return wrapper
+
+
+def install_template_timer():
+    # Django has no hook around template rendering outside the test runner, so the
+    # backend's render() is wrapped once; it is a no-op for requests that are not sampled
+    if not getattr(django_backend.Template.render, 'profiled', False):
+        django_backend.Template.render = timed_render(django_backend.Template.render)
+
+
+# Anything else is labelled "other", so a client inventing verbs cannot add series without bound
+KNOWN_METHODS = frozenset(('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'))
+
+
+def method_label(request):
+    return request.method if request.method in KNOWN_METHODS else 'other'
+
+
+def route_label(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.route if match else '<unresolved>'
+
+
+@contextlib.contextmanager
+def wrap_queries(wrapper):
+    # Installs an execute_wrapper on every database connection of the current thread
+    with contextlib.ExitStack() as stack:
+        if wrapper is not None:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(wrapper))
+        yield
+
+
+@contextlib.asynccontextmanager
+async def awrap_queries(wrapper):
+    # Async views run their queries through sync_to_async in the request's thread-sensitive worker thread,
+    # whose connections are not the event loop's, so the wrapper is installed and removed there
+    stack = contextlib.ExitStack()
+    await sync_to_async(stack.enter_context)(wrap_queries(wrapper))
+    try:
+        yield
+    finally:
+        await sync_to_async(stack.close)()
+
+
+class ProfilingMiddleware:
+    # Times sampled requests end to end, with SQL and template time broken out, reports them in a
+    # Server-Timing header and feeds the per-route histograms served by metrics_view.
+    # Async-capable, so under ASGI async views are not pushed into a worker thread on its account.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        self.sample_rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 1.0)
+        self.trace_sql = getattr(settings, 'PROFILING_TRACE_SQL', True)
+        self.trace_templates = getattr(settings, 'PROFILING_TRACE_TEMPLATES', True)
+        self.server_timing = getattr(settings, 'PROFILING_SERVER_TIMING', True)
+        if self.trace_templates:
+            install_template_timer()
+
+    def sampled(self):
+        return self.sample_rate > 0 and (self.sample_rate >= 1 or random.random() < self.sample_rate)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+
+        profile = RequestProfile()
+        _state.profile = profile if self.trace_templates else None
+        start = time.perf_counter()
+        try:
+            with wrap_queries(profile.execute if self.trace_sql else None):
+                response = self.get_response(request)
+        finally:
+            _state.profile = None
+        return self.record(request, response, profile, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+
+        profile = RequestProfile()
+        _state.profile = profile if self.trace_templates else None
+        start = time.perf_counter()
+        try:
+            async with awrap_queries(profile.execute if self.trace_sql else None):
+                response = await self.get_response(request)
+        finally:
+            _state.profile = None
+        return self.record(request, response, profile, time.perf_counter() - start)
+
+    def record(self, request, response, profile, total):
+        if self.server_timing:
+            timings = ['total;dur=%.1f' % (total * 1000)]
+            if self.trace_sql:
+                timings.append('db;dur=%.1f;desc="%d queries"' % (profile.db_seconds * 1000, profile.queries))
+            if self.trace_templates:
+                timings.append('tpl;dur=%.1f' % (profile.template_seconds * 1000))
+            response['Server-Timing'] = ', '.join(timings)
+
+        match = getattr(request, 'resolver_match', None)
+        if not (match and match.url_name == 'metrics'):
+            labels = (('route', route_label(request)), ('method', method_label(request)))
+            HISTOGRAMS['total'].observe(labels, total)
+            if self.trace_sql:
+                HISTOGRAMS['db'].observe(labels, profile.db_seconds)
+                HISTOGRAMS['queries'].observe(labels, profile.queries)
+            if self.trace_templates:
+                HISTOGRAMS['templates'].observe(labels, profile.template_seconds)
+        return response
+
+
+def metrics_view(request):
+    # Prometheus text exposition; only served to the addresses in PROFILING_METRICS_ALLOWED_IPS
+    if request.META.get('REMOTE_ADDR') not in getattr(settings, 'PROFILING_METRICS_ALLOWED_IPS', ('127.0.0.1', '::1')):
+        raise Http404
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,170 @@
+import contextlib
+import functools
+import logging
+import os
+import re
+import sys
+import time
+
+from asgiref.local import Local
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.template.base import Node
+
+from .profiling import awrap_queries, wrap_queries
+
+logger = logging.getLogger('workout_app.queries')
+
+_state = Local()
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Other execute_wrappers sit between the query and its caller; they are never the code to blame
+INSTRUMENTATION = {os.path.abspath(__file__), os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiling.py')}
+# Collapses the variable-length placeholder lists of __in lookups and bulk inserts
+PLACEHOLDER_LIST = re.compile(r'\((?:%s|\?)(?:\s*,\s*(?:%s|\?))*\)')
+
+
+class NPlusOneError(AssertionError):
+    pass
+
+
+def query_shape(sql):
+    return PLACEHOLDER_LIST.sub('(...)', sql)
+
+
+def template_location():
+    # The innermost template node being rendered, as "template.html:line"
+    frame = sys._getframe(1)
+    while frame is not None:
+        if frame.f_code.co_name == 'render_annotated':
+            node = frame.f_locals.get('self')
+            if isinstance(node, Node) and node.origin is not None and node.token is not None:
+                return '%s:%s' % (node.origin.template_name or node.origin.name, node.token.lineno)
+        frame = frame.f_back
+    return None
+
+
+def code_location():
+    # The innermost frame in this project's own code, skipping Django, third-party packages and the instrumentation
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = os.path.abspath(frame.f_code.co_filename)
+        if filename.startswith(PROJECT_ROOT) and filename not in INSTRUMENTATION and 'site-packages' not in filename:
+            return '%s:%d' % (os.path.relpath(filename, PROJECT_ROOT), frame.f_lineno)
+        frame = frame.f_back
+    return None
+
+
+def describe(view, location, template):
+    parts = ['view=%s' % view]
+    if location:
+        parts.append('at %s' % location)
+    if template:
+        parts.append('template %s' % template)
+    return ' '.join(parts)
+
+
+class RequestQueries:
+    def __init__(self, request, slow_ms, threshold, raise_errors):
+        self.request = request
+        self.slow_ms = slow_ms
+        self.threshold = threshold
+        self.raise_errors = raise_errors
+        self.shapes = {}
+        self.reported = set()
+        self.allow_repeats = False
+
+    @property
+    def view(self):
+        match = getattr(self.request, 'resolver_match', None)
+        return match.view_name if match else self.request.path
+
+    def execute(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            if self.slow_ms is not None and elapsed_ms >= self.slow_ms:
+                logger.warning('Slow query (%.1fms) %s: %s', elapsed_ms, describe(self.view, code_location(), template_location()), sql)
+            self.count(sql)
+
+    def count(self, sql):
+        # Writes repeat legitimately (one UPDATE per rollup day, savepoints); N+1s are reads
+        if self.allow_repeats or not sql.lstrip()[:6].upper() == 'SELECT':
+            return
+        shape = query_shape(sql)
+        seen = self.shapes.get(shape, 0) + 1
+        self.shapes[shape] = seen
+        if seen < self.threshold or shape in self.reported:
+            return
+        self.reported.add(shape)
+        message = 'Possible N+1: the same query ran %d times in one request, %s: %s' % (
+            seen, describe(self.view, code_location(), template_location()), shape,
+        )
+        if self.raise_errors:
+            raise NPlusOneError(message)
+        logger.warning(message)
+
+
+def current_queries():
+    return getattr(_state, 'queries', None)
+
+
+@contextlib.contextmanager
+def repeated_queries_allowed():
+    # For code that batches on purpose (chunked imports and exports), so repeated shapes are expected
+    queries = current_queries()
+    previous = queries.allow_repeats if queries else None
+    if queries:
+        queries.allow_repeats = True
+    try:
+        yield
+    finally:
+        if queries:
+            queries.allow_repeats = previous
+
+
+def allow_repeated_queries(view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        with repeated_queries_allowed():
+            return view(*args, **kwargs)
+    return wrapper
+
+
+class QueryInspectionMiddleware:
+    # Logs queries slower than SLOW_QUERY_MS and flags SELECTs that repeat NPLUSONE_THRESHOLD
+    # times within one request, with the view, code line and template line they came from.
+    # NPLUSONE_RAISE turns the N+1 warning into an NPlusOneError, which the test settings enable.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        self.slow_ms = getattr(settings, 'SLOW_QUERY_MS', None)
+        self.threshold = getattr(settings, 'NPLUSONE_THRESHOLD', 5)
+        self.raise_errors = getattr(settings, 'NPLUSONE_RAISE', False)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        queries = RequestQueries(request, self.slow_ms, self.threshold, self.raise_errors)
+        _state.queries = queries
+        try:
+            with wrap_queries(queries.execute):
+                return self.get_response(request)
+        finally:
+            _state.queries = None
+
+    async def __acall__(self, request):
+        queries = RequestQueries(request, self.slow_ms, self.threshold, self.raise_errors)
+        _state.queries = queries
+        try:
+            async with awrap_queries(queries.execute):
+                return await self.get_response(request)
+        finally:
+            _state.queries = None
@@ -0,0 +1,138 @@
+import asyncio
+import functools
+import os
+import time
+
+from asgiref.local import Local
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.decorators import method_decorator
+
+PRIMARY_ALIAS = 'default'
+REPLICA_ALIAS = 'replica'
+PIN_COOKIE = 'pin_primary'
+
+_state = Local()
+
+
+def replica_synced_at():
+    # sync_replica writes the SQLite file in place, so its mtime is the time of the last sync
+    try:
+        return os.path.getmtime(settings.DATABASES[REPLICA_ALIAS]['NAME'])
+    except (KeyError, OSError, TypeError):
+        return None
+
+
+def replica_staleness():
+    synced_at = replica_synced_at()
+    if synced_at is None:
+        return None
+    return max(0.0, time.time() - synced_at)
+
+
+def replica_available():
+    if REPLICA_ALIAS not in settings.DATABASES:
+        return False
+    staleness = replica_staleness()
+    return staleness is not None and staleness <= getattr(settings, 'REPLICA_MAX_LAG', 300)
+
+
+def pin_to_primary():
+    _state.pinned = True
+
+
+def is_pinned():
+    return getattr(_state, 'pinned', False)
+
+
+class analytics_reads:
+    # Reads inside this block may be served from the replica. Whether it is fresh enough is decided
+    # once, on entering the outermost block, rather than with a stat() of the replica per query.
+    def __enter__(self):
+        self.previous = getattr(_state, 'analytics', False), getattr(_state, 'replica', False)
+        if not self.previous[0]:
+            _state.replica = replica_available()
+        _state.analytics = True
+        return self
+
+    def __exit__(self, *exc_info):
+        _state.analytics, _state.replica = self.previous
+
+
+def analytics_view(view):
+    # Marks a function view or class-based view as analytics-only reading
+    if isinstance(view, type):
+        return method_decorator(analytics_view, name='dispatch')(view)
+
+    if asyncio.iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def async_wrapper(*args, **kwargs):
+            with analytics_reads():
+                return await view(*args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        with analytics_reads():
+            return view(*args, **kwargs)
+    return wrapper
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if getattr(_state, 'analytics', False) and getattr(_state, 'replica', False) and not is_pinned():
+            return REPLICA_ALIAS
+        return PRIMARY_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # Anything read later in this request must see this write
+        pin_to_primary()
+        return PRIMARY_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica is a file copy of the primary, never migrated on its own
+        return db == PRIMARY_ALIAS
+
+
+class PrimaryPinMiddleware:
+    # Keeps a client on the primary for REPLICA_PIN_SECONDS after it writes, so it reads its own writes
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        self.start(request)
+        return self.finish(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        # The router's pin is set in the worker thread that ran the query; asgiref carries it back here
+        self.start(request)
+        return self.finish(request, await self.get_response(request))
+
+    def start(self, request):
+        _state.pinned = False
+        _state.analytics = False
+        _state.replica = False
+        try:
+            pinned_until = float(request.COOKIES.get(PIN_COOKIE, 0))
+        except ValueError:
+            pinned_until = 0
+        if pinned_until > time.time():
+            pin_to_primary()
+
+    def finish(self, request, response):
+        if is_pinned() and request.method not in ('GET', 'HEAD', 'OPTIONS'):
+            seconds = getattr(settings, 'REPLICA_PIN_SECONDS', 10)
+            response.set_cookie(PIN_COOKIE, str(time.time() + seconds), max_age=seconds, httponly=True, samesite='Lax')
+        _state.pinned = False
+        return response
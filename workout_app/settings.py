@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
 import os
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -42,15 +43,44 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'workout_app.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'workout_app.hashing.HashPoolBusyMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Slow-query log and N+1 detector (workout_app.querylog), for development and staging
+QUERY_INSPECTION = DEBUG or os.environ.get('WORKOUT_QUERY_INSPECTION') == '1'
+
+if QUERY_INSPECTION:
+    MIDDLEWARE.insert(1, 'workout_app.querylog.QueryInspectionMiddleware')
+
+# Queries at least this slow are logged to workout_app.queries with their view and template line
+SLOW_QUERY_MS = 100
+
+# A SELECT repeated this many times in one request is reported as a likely N+1
+NPLUSONE_THRESHOLD = 3
+
+# Under `manage.py test` an N+1 raises NPlusOneError instead of logging, so CI fails on it
+NPLUSONE_RAISE = sys.argv[1:2] == ['test']
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'workout_app.queries': {'handlers': ['console'], 'level': 'WARNING', 'propagate': False},
+        'workout_app.sqlite_backend': {'handlers': ['console'], 'level': 'WARNING', 'propagate': False},
+    },
+}
+
 ROOT_URLCONF = 'workout_app.urls'
 
 TEMPLATES = [
@@ -71,6 +101,11 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'workout_app.wsgi.application'
 
+ASGI_APPLICATION = 'workout_app.asgi.application'
+
+# Serve the async versions of the hot read views (WorkoutApp.async_views); turn on when running under ASGI
+ASYNC_READ_VIEWS = os.environ.get('WORKOUT_ASYNC_VIEWS') == '1'
+
 
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
@@ -82,6 +117,116 @@ DATABASES = {
     }
 }
 
+# Production profile: WAL journal, tuned PRAGMAs, persistent connections and BEGIN IMMEDIATE
+# write transactions (see workout_app/sqlite_backend). Enable with WORKOUT_DB_PROFILE=production.
+DATABASE_PROFILE = os.environ.get('WORKOUT_DB_PROFILE', 'development')
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 268435456,  # 256 MiB
+    'cache_size': -65536,  # 64 MiB, negative values are KiB
+    'temp_store': 'MEMORY',
+}
+
+PRODUCTION_DATABASE = {
+    'ENGINE': 'workout_app.sqlite_backend',
+    'CONN_MAX_AGE': 600,
+    'CONN_HEALTH_CHECKS': True,
+    'OPTIONS': {
+        'timeout': 5,  # seconds a connection waits on the write lock before "database is locked"
+    },
+}
+
+if DATABASE_PROFILE == 'production':
+    DATABASES['default'].update(PRODUCTION_DATABASE)
+
+# Optional read replica for analytics-heavy views: a second SQLite file refreshed by
+# `manage.py sync_replica` and used by workout_app.routers while it is fresher than REPLICA_MAX_LAG.
+if os.environ.get('WORKOUT_READ_REPLICA'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': BASE_DIR / 'db_replica.sqlite3',
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_ROUTERS = ['workout_app.routers.PrimaryReplicaRouter']
+    MIDDLEWARE.append('workout_app.routers.PrimaryPinMiddleware')
+
+# Seconds of replication lag after which analytics reads go back to the primary
+REPLICA_MAX_LAG = 300
+
+# Seconds a client keeps reading from the primary after a write
+REPLICA_PIN_SECONDS = 10
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Per-user workout detail/summary cache (WorkoutApp.caching)
+    'workouts': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'workouts',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    'sessions': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'sessions',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+# Share the workout and session caches between worker processes with WORKOUT_CACHE_BACKEND=file
+SHARED_CACHE = os.environ.get('WORKOUT_CACHE_BACKEND') == 'file'
+if SHARED_CACHE:
+    CACHES['workouts'] = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache' / 'workouts',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+    CACHES['sessions'] = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache' / 'sessions',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+
+WORKOUT_CACHE_ALIAS = 'workouts'
+
+# With SHARED_CACHE, signed-in users' profiles (WorkoutApp.usercache) are kept in the workout cache;
+# the user row itself, password hash included, is always read from the database
+USER_CACHE_TIMEOUT = 60
+
+# Body-weight trend (WorkoutApp.trends): samples in the rolling average, and the EWMA span
+WEIGHT_TREND_WINDOW = 7
+WEIGHT_TREND_SPAN = 10
+
+# With a cache shared between worker processes, sessions are read from it and written through to the
+# database. A per-process cache would keep a logged-out session alive in every other worker, so without
+# one sessions stay in the database.
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db' if SHARED_CACHE else 'django.contrib.sessions.backends.db'
+SESSION_CACHE_ALIAS = 'sessions'
+
+WORKOUT_CACHE_TIMEOUT = 600
+
+
+# Request profiling (workout_app.profiling): Server-Timing headers plus per-route histograms at /metrics/
+
+# Fraction of requests that are profiled; unsampled requests skip the middleware's work entirely
+PROFILING_SAMPLE_RATE = float(os.environ.get('WORKOUT_PROFILING_SAMPLE_RATE', 1.0))
+
+# SQL timing wraps every query and template timing every render; turn either off to cut overhead
+PROFILING_TRACE_SQL = True
+
+PROFILING_TRACE_TEMPLATES = True
+
+# Server-Timing shows per-request internals to the client
+PROFILING_SERVER_TIMING = DEBUG or os.environ.get('WORKOUT_SERVER_TIMING') == '1'
+
+PROFILING_METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -105,6 +250,11 @@ AUTHENTICATION_BACKENDS = [
     'workout_app.backends.CaseInsensitiveModelBackend',
 ]
 
+# Password hashing runs on a bounded thread pool (see workout_app/hashing.py); 0 workers hashes inline
+PASSWORD_HASH_WORKERS = int(os.environ.get('WORKOUT_PASSWORD_HASH_WORKERS', os.cpu_count() or 1))
+PASSWORD_HASH_MAX_QUEUE = int(os.environ.get('WORKOUT_PASSWORD_HASH_MAX_QUEUE', 64))
+PASSWORD_HASH_TIMEOUT = 10
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/4.2/topics/i18n/
@@ -0,0 +1,23 @@
+# SQLite backend for the production database profile (WORKOUT_DB_PROFILE=production).
+# Same as django.db.backends.sqlite3, except that transactions open with BEGIN IMMEDIATE, so a writer
+# takes the write lock up front instead of failing with "database is locked" when it upgrades from a
+# read lock mid-transaction. That applies to every atomic() block, read-only ones included, so keep
+# reads out of atomic blocks; in WAL mode plain autocommit reads never wait on a writer.
+# PRAGMAs from settings.SQLITE_PRAGMAS are applied to every new connection.
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.backends.sqlite3 import base
+from django.dispatch import receiver
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN IMMEDIATE')
+
+
+@receiver(connection_created, sender=DatabaseWrapper)
+def apply_pragmas(sender, connection, **kwargs):
+    with connection.cursor() as cursor:
+        for name, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+            cursor.execute('PRAGMA %s = %s' % (name, value))
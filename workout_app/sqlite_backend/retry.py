@@ -0,0 +1,37 @@
+import functools
+import logging
+import random
+import time
+
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+
+LOCKED_MESSAGES = ('database is locked', 'database table is locked')
+
+logger = logging.getLogger('workout_app.sqlite_backend')
+
+
+def is_locked_error(error):
+    return any(message in str(error) for message in LOCKED_MESSAGES)
+
+
+def retry_on_locked(func=None, attempts=5, backoff=0.05, max_backoff=1.0, using=None):
+    # Retry a write transaction when SQLite reports the database as locked. Only the outermost
+    # transaction can be retried, so inside an existing atomic block the call is made once.
+    if func is None:
+        return functools.partial(retry_on_locked, attempts=attempts, backoff=backoff, max_backoff=max_backoff, using=using)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if connections[using or DEFAULT_DB_ALIAS].in_atomic_block:
+            return func(*args, **kwargs)
+        for attempt in range(attempts):
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as error:
+                if not is_locked_error(error) or attempt == attempts - 1:
+                    raise
+                logger.warning('%s: database is locked, retrying (attempt %d of %d)', func.__qualname__, attempt + 2, attempts)
+                # Full jitter keeps a crowd of blocked writers from retrying in lockstep
+                time.sleep(random.uniform(0, min(max_backoff, backoff * 2 ** attempt)))
+
+    return wrapper